@@ -3,6 +3,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_migrate import Migrate
 from config import AppConfig
+import database
+import logs
+import metrics
 
 
 
@@ -14,9 +17,26 @@ def create_app():
     app.config.from_object(AppConfig) 
     CORS(app)
 
-    
+    from tokens import check_settings # Imports db from this module
+    check_settings()
+
+    database.configure(app)
     db.init_app(app)
+    database.init_app(app, db)
+    from writer import group_commit # Imports db from this module
+    group_commit.init_app(app)
+    from jobs import extraction_queue
+    extraction_queue.init_app(app)
     migrate.init_app(app, db)
+    logs.init_app(app)
+    metrics.init_app(app)
+
+    from auth import auth_bp
+    from chats import chats_bp
+    from location import location_bp
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(chats_bp)
+    app.register_blueprint(location_bp)
 
 
     return app
@@ -0,0 +1,219 @@
+import asyncio
+import contextvars
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from asgiref.wsgi import WsgiToAsgi
+from app import create_app
+from config import AppConfig
+from middleware import token_required, rate_limited, claim_rate_limit_lease
+from service import clients
+from turns import ChatTurn, turn_from_request, DEFAULT_MODEL
+from logs import fields, new_request_id, request_id_var
+from schemas import encode
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _ASGI entry point (uvicorn asgi:app) that serves POST /api/chats/<chat_id>/messages with AsyncOpenAI,
+         so a pending completion holds a coroutine instead of a worker thread
+        _The short DB phases of a turn (auth, prompt building, saving) run on a small thread pool inside a Flask
+         request context with the usual session; every other route is handed to the Flask app unchanged
+"""
+
+MESSAGES_PATH = re.compile(r"^/api/chats/(?P<chat_id>[^/]+)/messages/?$")
+
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+
+
+@token_required
+@rate_limited(DEFAULT_MODEL)
+def prepare_message(chat_id):
+    turn = turn_from_request(chat_id)
+    if isinstance(turn, ChatTurn):
+        turn.lease = claim_rate_limit_lease() # Held until the completion ends, released in send_message
+    return turn
+
+
+"""explain: Builds a WSGI environ from an ASGI scope so the Flask request context (auth header, form parsing) works unchanged."""
+def build_environ(scope, body):
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "SERVER_NAME": scope["server"][0] if scope.get("server") else "localhost",
+        "SERVER_PORT": str(scope["server"][1]) if scope.get("server") else "80",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": BytesIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+class ChatAsgiApp():
+    """
+    Used for :
+        _Routing the message endpoint to the async handler and everything else to WsgiToAsgi(flask_app)
+    """
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi_app = WsgiToAsgi(flask_app)
+        self.db_executor = ThreadPoolExecutor(max_workers=AppConfig.ASGI_DB_THREADS, thread_name_prefix="asgi-db")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] == "http" and scope["method"] == "POST":
+            match = MESSAGES_PATH.match(scope["path"])
+            if match:
+                return await self.send_message(scope, receive, send, match.group("chat_id"))
+        return await self.wsgi_app(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if "async_openai" in clients.clients:
+                    await clients.async_openai().close()
+                self.db_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    """explain: Runs a blocking DB phase on the pool, in a copy of the current context so log lines keep the request id."""
+    async def run_db(self, func, *args):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, context.run, func, *args)
+
+    """explain: Authenticates and prepares the turn in a request context. Returns (turn, empty response) where the response only carries the headers added by Flask's after-request handlers (CORS), or (None, finished response) when the request is rejected or answered as JSON without OpenAI."""
+    def _prepare(self, environ, chat_id):
+        with self.flask_app.request_context(environ):
+            turn = None
+            try:
+                turn = self.flask_app.preprocess_request()
+                if turn is None:
+                    turn = prepare_message(chat_id)
+                if isinstance(turn, ChatTurn) and (turn.stream or not turn.immediate_response):
+                    mimetype = "text/event-stream" if turn.stream else "application/json"
+                    response = self.flask_app.process_response(self.flask_app.response_class(mimetype=mimetype))
+                    return turn, response
+                if isinstance(turn, ChatTurn):
+                    if turn.lease:
+                        turn.lease.release()
+                    turn = turn.immediate_response
+                response = self.flask_app.process_response(self.flask_app.make_response(turn))
+                return None, response
+            except Exception:
+                if isinstance(turn, ChatTurn) and turn.lease:
+                    turn.lease.release()
+                logger.exception("Error preparing message", extra=fields(chat_id=chat_id))
+                response = self.flask_app.make_response(({"error": "Internal server error"}, 500))
+                return None, response
+
+    def _in_app_context(self, func, *args):
+        with self.flask_app.app_context():
+            return func(*args)
+
+    async def send_message(self, scope, receive, send, chat_id):
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        environ = build_environ(scope, bytes(body))
+        # One id for the whole turn: the Flask hooks in _prepare read it back from the environ
+        environ["HTTP_X_REQUEST_ID"] = environ.get("HTTP_X_REQUEST_ID") or new_request_id()
+        request_id_var.set(environ["HTTP_X_REQUEST_ID"])
+        turn, response = await self.run_db(self._prepare, environ, chat_id)
+        if turn is None:
+            return await self.send_response(send, response.status_code, response.headers, response.get_data())
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ("content-type", "content-length")]
+        try:
+            if turn.stream:
+                return await self.stream_completion(send, turn, headers)
+
+            client = clients.async_openai()
+            try:
+                completion = await client.chat.completions.create(**turn.completion_args())
+                payload = await self.run_db(self._in_app_context, turn.complete, completion.choices[0].message.content, completion.usage)
+                status = 200
+            except Exception as e:
+                payload = await self.run_db(self._in_app_context, turn.fail, e)
+                status = 500
+            headers.append(("Content-Type", "application/json"))
+            await self.send_response(send, status, headers, encode(payload))
+        finally:
+            if turn.lease:
+                turn.lease.release()
+
+    """explain: Same SSE frames as the Flask view's stream_completion, written from the event loop as deltas arrive."""
+    async def stream_completion(self, send, turn, headers):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": SSE_HEADERS + [(k.encode("latin1"), v.encode("latin1")) for k, v in headers if k.lower() != "cache-control"],
+        })
+
+        async def send_event(event, data):
+            frame = f"event: {event}\ndata: {encode(data).decode()}\n\n"
+            await send({"type": "http.response.body", "body": frame.encode(), "more_body": True})
+
+        if turn.immediate_response:
+            for section, text in turn.immediate_events():
+                await send_event("delta", {"section": section, "text": text})
+            await send_event("done", turn.immediate_response)
+            return await send({"type": "http.response.body", "body": b""})
+
+        try:
+            stream = await clients.async_openai().chat.completions.create(**turn.completion_args(stream=True))
+            async for chunk in stream:
+                turn.record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                for section, text in turn.stream_events(delta):
+                    await send_event("delta", {"section": section, "text": text})
+
+            events, payload = await self.run_db(self._in_app_context, turn.finish_stream)
+            for section, text in events:
+                await send_event("delta", {"section": section, "text": text})
+            await send_event("done", payload)
+        except Exception as e:
+            await send_event("error", await self.run_db(self._in_app_context, turn.fail, e))
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send_response(self, send, status, headers, body):
+        raw_headers = [
+            (k.encode("latin1"), v.encode("latin1")) for k, v in headers
+            if k.lower() != "content-length"
+        ]
+        raw_headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+app = ChatAsgiApp(create_app())
@@ -1,4 +1 @@
-from main import app
 from auth.routes import auth_bp
-
-app.register_blueprint(auth_bp)
\ No newline at end of file
@@ -1,10 +1,15 @@
+import logging
 from flask import request,jsonify,Blueprint
 import uuid
 from models import User
-from main import db
+from app import db
 from middleware import *
+from config import AppConfig
+from tokens import issue_tokens,decode_token,revocation_list
+from writer import group_commit
 
 auth_bp = Blueprint('auth',__name__)
+logger = logging.getLogger(__name__)
 
 """explain: Authenticates a user based on username and password, returning a token on success."""
 @auth_bp.route('/api/login', methods=['POST'])
@@ -18,42 +23,78 @@ def login():
     user = User.query.filter_by(username=username).first()
 
     if user and user.check_password(password):
+        if AppConfig.AUTH_TOKEN_MODE == 'jwt':
+            # Signed tokens: nothing to store, and several devices can stay logged in at once
+            return jsonify({"message": "Login successful", **issue_tokens(user)}), 200
+
         token = str(uuid.uuid4())
-        user.token = token # Update user's token
         try:
-            db.session.commit()
+            group_commit.write(lambda: User.query.filter_by(id=user.id).update({"token": token})) # Update user's token
+            token_cache.invalidate_user(user.id) # The previous token is no longer valid
             return jsonify({"message": "Login successful", "token": token}), 200
         except Exception as e:
              db.session.rollback()
-             print(f"DB error during login: {e}")
+             logger.exception("DB error during login")
              return jsonify({"error": "Database error during login"}), 500
     else: # Invalid username or password
         return jsonify({"error": "Invalid credentials"}), 401
 
-"""explain: Invalidates the user's current authentication token."""
+"""explain: Invalidates the user's current authentication token (signed tokens are added to the revocation list)."""
 @auth_bp.route('/api/logout', methods=['POST'])
 @token_required
 def logout():
     user = request.user
-    user.token = None # Invalidate the token
+    claims = getattr(request, 'token_claims', None)
+    if claims:
+        try:
+            revocation_list.revoke(claims)
+            data = request.get_json(silent=True) or {}
+            refresh_claims = decode_token(data['refresh_token'], "refresh") if data.get('refresh_token') else None
+            if refresh_claims and refresh_claims["sub"] == claims["sub"]:
+                revocation_list.revoke(refresh_claims)
+            return jsonify({"message": "Logout successful"}), 200
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("DB error during logout")
+            return jsonify({"error": "Database error during logout"}), 500
+
+    user_id = user.id
     try:
-        db.session.commit()
+        group_commit.write(lambda: User.query.filter_by(id=user_id).update({"token": None})) # Invalidate the token
+        token_cache.invalidate_user(user.id)
         return jsonify({"message": "Logout successful"}), 200
     except Exception as e:
         db.session.rollback()
-        print(f"DB error during logout: {e}")
+        logger.exception("DB error during logout")
         return jsonify({"error": "Database error during logout"}), 500
 
+"""explain: Exchanges a refresh token for a new access/refresh token pair. The used refresh token is revoked (rotation)."""
+@auth_bp.route('/api/token/refresh', methods=['POST'])
+def refresh_token():
+    if AppConfig.AUTH_TOKEN_MODE != 'jwt':
+        return jsonify({"error": "Token refresh is only available with AUTH_TOKEN_MODE=jwt"}), 404
+    data = request.get_json(silent=True) or {}
+    claims = decode_token(data['refresh_token'], "refresh") if data.get('refresh_token') else None
+    if not claims:
+        return jsonify({"error": "Invalid or expired refresh token"}), 401
+
+    user = db.session.get(User, int(claims["sub"])) if claims["sub"].isdigit() else None
+    if not user:
+        return jsonify({"error": "Invalid or expired refresh token"}), 401
+    try:
+        revocation_list.revoke(claims)
+        return jsonify({"message": "Token refreshed", **issue_tokens(user)}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("DB error during token refresh")
+        return jsonify({"error": "Database error during token refresh"}), 500
+
 """explain: Checks if the provided token in the Authorization header is valid."""
 @auth_bp.route('/api/check-login', methods=['GET'])
 def check_login():
-    token = None
-    if 'Authorization' in request.headers:
-        auth_header = request.headers['Authorization']
-        if auth_header.startswith("Bearer "):
-            token = auth_header[7:]
+    token = get_bearer_token()
 
-    if token and User.query.filter_by(token=token).first():
+    if token and authenticate(token):
         return jsonify({"logged_in": True}), 200
     else:
         # Return 401 if token is missing or invalid
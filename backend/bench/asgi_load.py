@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+    Used for :
+        _Load comparison of the two ways to serve POST /api/chats/<id>/messages, against a local fake OpenAI server
+         that answers after a fixed latency:
+            + asgi: asgi:app under uvicorn (AsyncOpenAI; a pending completion is a coroutine)
+            + wsgi: the same Flask app on a WSGI server with a fixed pool of --threads request threads,
+              the way a threaded gunicorn worker serves it
+        _python bench/asgi_load.py --requests 200 --latency 2 --threads 16
+         Rate limits are turned off; every request goes to its own chat
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--requests", type=int, default=200, help="concurrent requests per run")
+parser.add_argument("--latency", type=float, default=2.0, help="seconds the fake OpenAI server takes per completion")
+parser.add_argument("--threads", type=int, default=16, help="request threads of the WSGI server")
+parser.add_argument("--mode", choices=("asgi", "wsgi", "both"), default="both")
+parser.add_argument("--stream", action="store_true", help="ask for SSE responses")
+args = parser.parse_args()
+
+tmp_dir = tempfile.mkdtemp(prefix="merlin-bench-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+    OPENAI_API_KEY="bench",
+    OPENAI_BASE_URL="http://127.0.0.1:8961/v1",
+    RATE_LIMIT_PER_MINUTE="0",
+    RATE_LIMIT_USER_CONCURRENCY="0",
+    RATE_LIMIT_MODEL_CONCURRENCY="0",
+    LOG_LEVEL="WARNING",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+from werkzeug.serving import BaseWSGIServer
+
+
+async def fake_openai(scope, receive, send):
+    if scope["type"] != "http":
+        message = await receive()
+        await send({"type": message["type"] + ".complete"})
+        return
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    stream = json.loads(body).get("stream")
+    await asyncio.sleep(args.latency)
+    if stream:
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+        for text in ("Hello", " from", " the fake server."):
+            chunk = {"id": "b", "object": "chat.completion.chunk", "created": 0, "model": "m",
+                     "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+            await send({"type": "http.response.body", "body": f"data: {json.dumps(chunk)}\n\n".encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+        return
+    reply = {"id": "b", "object": "chat.completion", "created": 0, "model": "m",
+             "choices": [{"index": 0, "message": {"role": "assistant", "content": "Hello from the fake server."}, "finish_reason": "stop"}]}
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps(reply).encode()})
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Used for :
+        _Werkzeug's server with a fixed request thread pool instead of one thread per request
+    """
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+        self.request_queue_size = 4096
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve_asgi(app, port):
+    config = uvicorn.Config(app, port=port, log_level="warning", limit_concurrency=10000, backlog=4096)
+    threading.Thread(target=uvicorn.Server(config).run, daemon=True).start()
+
+
+def serve_wsgi(app, port):
+    server = PooledWSGIServer("127.0.0.1", port, app, args.threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+async def run(port, chat_ids, headers):
+    data = {"message": "hello", "stream": "true" if args.stream else "false"}
+    latencies = []
+
+    async def one(client, chat_id):
+        started = time.perf_counter()
+        response = await client.post(f"http://127.0.0.1:{port}/api/chats/{chat_id}/messages", data=data, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        return response.status_code
+
+    limits = httpx.Limits(max_connections=len(chat_ids) + 10)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*[one(client, chat_id) for chat_id in chat_ids])
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "rps": len(chat_ids) / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[max(0, int(len(latencies) * 0.99) - 1)],
+        "statuses": {status: statuses.count(status) for status in sorted(set(statuses))},
+    }
+
+
+def main():
+    threading.Thread(target=uvicorn.Server(uvicorn.Config(fake_openai, port=8961, log_level="warning", backlog=4096)).run, daemon=True).start()
+
+    import asgi
+    from app import db
+    from models import Chat, User
+    flask_app = asgi.app.flask_app
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username="bench", token="bench-token")
+        user.set_password("bench")
+        db.session.add(user)
+        db.session.commit()
+        modes = ("asgi", "wsgi") if args.mode == "both" else (args.mode,)
+        chats = {mode: [f"{mode}-{i}" for i in range(args.requests)] for mode in modes}
+        db.session.add_all(Chat(id=chat_id, user_id=user.id, name=chat_id) for ids in chats.values() for chat_id in ids)
+        db.session.commit()
+
+    serve_asgi(asgi.app, 8962)
+    serve_wsgi(flask_app, 8963)
+    time.sleep(1.5)
+
+    print(f"{args.requests} concurrent requests, {args.latency:g}s completion latency, stream={args.stream}, WSGI threads={args.threads}")
+    for mode in modes:
+        result = asyncio.run(run(8962 if mode == "asgi" else 8963, chats[mode], {"Authorization": "Bearer bench-token"}))
+        print(f"  {mode}: {result['elapsed']:.2f}s total, {result['rps']:.1f} req/s, "
+              f"p50 {result['p50']:.2f}s, p99 {result['p99']:.2f}s, statuses {result['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+"""
+    Used for :
+        _Throughput of concurrent chat turn commits through turns.commit_turn (the send-message persistence path):
+         --threads writers each commit --turns turns to their own chat on a temporary SQLite file
+        _Each configuration runs in a fresh process, since AppConfig reads the environment at import:
+            + default: SQLAlchemy's pool (5 + 10) and SQLite's own settings (rollback journal, synchronous=FULL)
+            + tuned: the engine options and pragmas of database.py, committing in the request thread
+            + write-behind: WRITE_BEHIND_ENABLED=true, each writer waits for the group commit of its turn
+            + no-wait: WRITE_BEHIND_WAIT_FOR_TURNS=false, so only the enqueueing is timed; the writer thread is
+              drained before the rows are counted
+         Other settings come from the environment, e.g. WRITE_BEHIND_MAX_DELAY_MS=2 python bench/commit_turns.py
+        _python bench/commit_turns.py --threads 1 16 64 --turns 20 --runs 2 --modes default tuned
+        _python bench/commit_turns.py --threads 1 10 100 --modes tuned write-behind no-wait
+         Prints the best run's turns per second, its p99 commit latency and the writes per group commit,
+         per configuration and thread count
+"""
+
+MODES = {
+    "default": {
+        "DB_POOL_SIZE": "5", "DB_MAX_OVERFLOW": "10", "DB_POOL_TIMEOUT": "30", "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_BUSY_TIMEOUT_MS": "5000", "SQLITE_MMAP_SIZE": "0",
+    },
+    "tuned": {},
+    "write-behind": {"WRITE_BEHIND_ENABLED": "true"},
+    "no-wait": {"WRITE_BEHIND_ENABLED": "true", "WRITE_BEHIND_WAIT_FOR_TURNS": "false"},
+}
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--threads", type=int, nargs="+", default=[1, 16, 64])
+parser.add_argument("--turns", type=int, default=20, help="turns per thread")
+parser.add_argument("--runs", type=int, default=2)
+parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+parser.add_argument("--child", nargs=2, metavar=("MODE", "THREADS"), help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+"""explain: One run in this process: commits the turns and prints a JSON line with the throughput, p99 latency, errors, rows written and writes per group commit."""
+def child(mode, threads):
+    tmp_dir = tempfile.mkdtemp(prefix="merlin-bench-")
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+        OPENAI_API_KEY="bench",
+        LOG_LEVEL="WARNING",
+        **MODES[mode]
+    )
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from main import app
+    from app import db
+    from models import Chat, Message, User
+    from turns import commit_turn
+    from writer import group_commit
+
+    with app.app_context():
+        db.create_all()
+        user = User(username="bench", token="bench-token")
+        user.set_password("bench")
+        db.session.add(user)
+        db.session.flush()
+        chat_ids = [f"chat-{n}" for n in range(threads)]
+        db.session.add_all(Chat(id=chat_id, user_id=user.id, name=chat_id) for chat_id in chat_ids)
+        db.session.commit()
+
+    latencies = []
+    errors = []
+    start = threading.Barrier(threads + 1)
+    def writer(chat_id):
+        with app.app_context():
+            start.wait()
+            for n in range(args.turns):
+                started = time.perf_counter()
+                try:
+                    commit_turn(chat_id, f"question {n}", f"answer {n}")
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(str(e))
+                latencies.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=writer, args=(chat_id,)) for chat_id in chat_ids]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    group_commit.stop() # Commits what the no-wait writers left queued
+
+    with app.app_context():
+        rows = Message.query.count()
+    print(json.dumps({
+        "turns_per_second": threads * args.turns / elapsed, "p99_ms": percentile(latencies, 0.99) * 1000,
+        "errors": len(errors), "locked": sum("locked" in error for error in errors), "rows": rows,
+        "ops_per_batch": group_commit.stats()["ops_per_batch"],
+    }))
+
+
+def main():
+    print(f"{args.turns} turns per thread, best of {args.runs} runs")
+    print("  threads  " + "".join(f"{mode:40}" for mode in args.modes))
+    for threads in args.threads:
+        cells = []
+        for mode in args.modes:
+            runs = []
+            for _ in range(args.runs):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--turns", str(args.turns), "--child", mode, str(threads)],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            best = max(runs, key=lambda run: run["turns_per_second"])
+            cell = f"{best['turns_per_second']:.0f} turns/s p99 {best['p99_ms']:.0f} ms"
+            if best["ops_per_batch"]:
+                cell += f", {best['ops_per_batch']:.0f}/commit"
+            missing = threads * args.turns * 2 - best["rows"]
+            if best["errors"] or missing:
+                cell += f" ({best['errors']} errors, {best['locked']} locked, {missing} rows missing)"
+            cells.append(f"{cell:40}")
+        print(f"  {threads:<7}  " + "".join(cells))
+
+
+if __name__ == "__main__":
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+    else:
+        main()
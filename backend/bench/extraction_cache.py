@@ -0,0 +1,104 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+"""
+    Used for :
+        _Time from upload to a finished extraction job for a generated --pages page PDF, through the Flask app
+         on a temporary SQLite file and cache directory:
+            + first upload: pages extracted on the process pool, then cached by content hash
+            + re-upload of the same bytes to another chat: served from the extraction cache
+         A small PDF is uploaded first so the pool's startup is not counted
+        _python bench/extraction_cache.py --pages 400
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--pages", type=int, default=400)
+parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PDF_EXTRACTION_WORKERS")
+args = parser.parse_args()
+
+tmp_dir = tempfile.mkdtemp(prefix="merlin-bench-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+    OPENAI_API_KEY="bench",
+    UPLOAD_SPOOL_DIR=os.path.join(tmp_dir, "upload_spool"),
+    PDF_CACHE_DIR=os.path.join(tmp_dir, "pdf_cache"),
+    PDF_EXTRACTION_WORKERS=str(args.workers),
+    PDF_JOB_POLL_SECONDS="0.05",
+    RATE_LIMIT_PER_MINUTE="0",
+    LOG_LEVEL="WARNING",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+from app import db
+from models import Chat, User
+from jobs import extraction_queue
+
+
+"""explain: A PDF with one paragraph of Helvetica text per page."""
+def make_pdf(pages):
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for number in range(pages):
+        lines = " ".join(f"(Page {number} line {line}: the quick brown fox jumps over the lazy dog.) Tj 0 -14 Td" for line in range(40))
+        stream = f"BT /F1 10 Tf 72 740 Td {lines} ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def upload(client, headers, chat_id, filename, pdf):
+    started = time.perf_counter()
+    response = client.post(
+        f"/api/chats/{chat_id}/upload-pdfs", data={"pdfs": (io.BytesIO(pdf), filename)},
+        headers=headers, content_type="multipart/form-data"
+    )
+    status_url = response.get_json()["status_url"]
+    while True:
+        job = client.get(status_url, headers=headers).get_json()
+        if job["status"] not in ("queued", "processing"):
+            return time.perf_counter() - started, job["status"]
+        time.sleep(0.01)
+
+
+def main():
+    with app.app_context():
+        db.create_all()
+        user = User(username="bench", token="bench-token")
+        user.set_password("bench")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all(Chat(id=chat_id, user_id=user.id, name=chat_id) for chat_id in ("warmup", "first", "again"))
+        db.session.commit()
+
+    client = app.test_client()
+    headers = {"Authorization": "Bearer bench-token"}
+    pdf = make_pdf(args.pages)
+    upload(client, headers, "warmup", "warmup.pdf", make_pdf(1))
+
+    first_seconds, first_status = upload(client, headers, "first", "report.pdf", pdf)
+    again_seconds, again_status = upload(client, headers, "again", "copy.pdf", pdf)
+    print(f"{args.pages}-page PDF ({len(pdf) / 1024:.0f} KiB), PDF_EXTRACTION_WORKERS={args.workers}")
+    print(f"  first upload: {first_seconds:.2f} s ({first_status})")
+    print(f"  re-upload:    {again_seconds:.2f} s ({again_status}, from the cache)")
+    if extraction_queue.executor is not None:
+        extraction_queue.executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+"""
+    Used for :
+        _Cost of saving one chat turn as the history grows, on a temporary SQLite file:
+            + blob: the baseline way, decoding chat.messages, appending the turn and writing the whole JSON back
+            + rows: turns.save_turn, inserting the two new message rows
+        _python bench/history_append.py --history 10,100,1000 --turns 50
+         Prints milliseconds per committed turn and the bytes each side writes per turn
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--history", default="10,100,1000", help="comma-separated numbers of messages already in the chat")
+parser.add_argument("--turns", type=int, default=50, help="turns saved per run")
+parser.add_argument("--message-bytes", type=int, default=500, help="length of each message")
+args = parser.parse_args()
+
+tmp_dir = tempfile.mkdtemp(prefix="merlin-bench-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+    OPENAI_API_KEY="bench",
+    LOG_LEVEL="WARNING",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+from app import db
+from models import Chat, Message, User
+from turns import save_turn
+
+
+def history(size):
+    text = "x" * args.message_bytes
+    return [
+        {"role": "user", "content": text} if n % 2 == 0 else {"role": "assistant", "reasoning": None, "content": text}
+        for n in range(size)
+    ]
+
+
+def append_to_blob(chat_id, text):
+    chat = db.session.get(Chat, chat_id)
+    messages = json.loads(chat.messages or '[]')
+    messages.append({"role": "user", "content": text})
+    messages.append({"role": "assistant", "reasoning": None, "content": text})
+    chat.messages = json.dumps(messages)
+    db.session.commit()
+    return len(chat.messages)
+
+
+def append_rows(chat_id, text):
+    save_turn(chat_id, text, text)
+    db.session.commit()
+    return 2 * len(text)
+
+
+def run(append, chat_id):
+    text = "y" * args.message_bytes
+    written = 0
+    started = time.perf_counter()
+    for _ in range(args.turns):
+        written += append(chat_id, text)
+        db.session.expunge_all() # Every request starts with an empty session
+    return (time.perf_counter() - started) * 1000 / args.turns, written / args.turns
+
+
+def main():
+    with app.app_context():
+        db.create_all()
+        user = User(username="bench")
+        user.set_password("bench")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        print(f"{args.turns} turns of 2 x {args.message_bytes}-byte messages per run")
+        for size in (int(n) for n in args.history.split(",")):
+            blob_chat = Chat(user_id=user_id, name=f"blob-{size}", messages=json.dumps(history(size)))
+            rows_chat = Chat(user_id=user_id, name=f"rows-{size}")
+            db.session.add_all([blob_chat, rows_chat])
+            db.session.flush()
+            db.session.add_all(
+                Message(chat_id=rows_chat.id, seq=n, role=msg["role"], content=msg["content"])
+                for n, msg in enumerate(history(size))
+            )
+            db.session.commit()
+            blob_chat_id, rows_chat_id = blob_chat.id, rows_chat.id
+
+            blob_ms, blob_bytes = run(append_to_blob, blob_chat_id)
+            rows_ms, rows_bytes = run(append_rows, rows_chat_id)
+            print(f"  {size:6} messages: blob {blob_ms:7.2f} ms/turn, {blob_bytes / 1024:8.1f} KiB written | "
+                  f"rows {rows_ms:6.2f} ms/turn, {rows_bytes / 1024:5.1f} KiB written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+"""
+    Used for :
+        _Throughput comparison of intent + cuisine detection on generated chat messages:
+            + substring: the scans the baseline ran per turn (restaurant intent check in send_message,
+              then RestaurantHandle.extract_food_keywords), copied here with their keyword lists
+            + router: intents.intent_router.analyze, which returns both in one pass
+        _Two corpora of --messages messages of 10-120 words, seeded:
+            + chat: ordinary filler text; a third of the messages carry 1-3 keywords (some in plural form)
+            + dense: every message carries 4-8 keywords
+        _python bench/intents_bench.py --messages 5000 --repeat 5
+         Prints the best of --repeat runs in messages per second, and how many messages each side
+         routes to the restaurant flow / tags with a cuisine
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--messages", type=int, default=5000, help="messages per corpus")
+parser.add_argument("--repeat", type=int, default=5, help="timed runs per corpus and matcher; the best one is kept")
+parser.add_argument("--seed", type=int, default=15)
+args = parser.parse_args()
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import intent_router
+
+# Baseline lists, as they were in chats/routes.py and utils.py
+RESTAURANT_KEYWORDS = ['restaurant', 'eat', 'food', 'dinner', 'lunch', 'meal', 'cuisine', 'dining']
+INTENT_KEYWORDS = ['near me', 'find', 'where', 'suggest', 'recommend', 'looking for', 'want to eat', 'nearby', 'around here']
+FOOD_TYPES = [
+    'italian', 'chinese', 'japanese', 'mexican', 'indian', 'american', 'french',
+    'mediterranean', 'middle eastern', 'vietnamese', 'pho', 'thai', 'greek', 'spanish',
+    'german', 'russian', 'african', 'caribbean', 'south american', 'korean', 'bbq',
+    'pizza', 'burger', 'sandwiches', 'sushi', 'ramen', 'tapas', 'steak', 'seafood',
+    'vegetarian', 'vegan', 'gluten-free', 'bakery', 'cafe', 'coffee', 'dessert', 'brunch'
+]
+
+FILLER = (
+    "the a an and or but so if then when what which who how why this that these those it its is are was were be "
+    "been have has had do does did can could would should will may might must i you we they he she me us them my "
+    "your our their about after again all also always any around because before best better between both come day "
+    "each even every first from get give go good great here just know last like little long look make many more most "
+    "much need never new next now only other over people place please really right same say see some still such sure "
+    "take tell thank than thing think through time today tomorrow tonight try under up use very want way week well "
+    "while with without work year yes yet phone report meeting project email weekend trip friends family question "
+    "answer document page summary budget plan team office city street morning evening"
+).split()
+KEYWORDS = (
+    RESTAURANT_KEYWORDS + INTENT_KEYWORDS + FOOD_TYPES
+    + ['restaurants', 'meals', 'burgers', 'pizzas', 'bakeries', 'desserts', 'steaks', 'cafes', 'eating']
+)
+
+
+def make_corpus(rng, keywords_per_message):
+    corpus = []
+    for _ in range(args.messages):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(10, 120))]
+        for _ in range(keywords_per_message(rng)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(KEYWORDS))
+        corpus.append(" ".join(words).capitalize() + rng.choice(".?!"))
+    return corpus
+
+
+def substring(message):
+    lower_message = message.lower()
+    is_restaurant_query = any(keyword in lower_message for keyword in RESTAURANT_KEYWORDS) and \
+                          any(intent in lower_message for intent in INTENT_KEYWORDS)
+    return is_restaurant_query, [food for food in FOOD_TYPES if food in lower_message]
+
+
+def router(message):
+    analysis = intent_router.analyze(message)
+    return analysis.has("restaurant"), analysis.get("cuisine")
+
+
+def best_rate(matcher, corpus):
+    best = 0.0
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        for message in corpus:
+            matcher(message)
+        best = max(best, len(corpus) / (time.perf_counter() - started))
+    return best
+
+
+def main():
+    rng = random.Random(args.seed)
+    corpora = {
+        "chat": make_corpus(rng, lambda rng: rng.randint(1, 3) if rng.random() < 1 / 3 else 0),
+        "dense": make_corpus(rng, lambda rng: rng.randint(4, 8)),
+    }
+    print(f"{args.messages} messages of 10-120 words per corpus, best of {args.repeat} runs")
+    for name, corpus in corpora.items():
+        for matcher in (substring, router):
+            results = [matcher(message) for message in corpus]
+            routed = sum(1 for is_query, _ in results if is_query)
+            tagged = sum(1 for _, cuisines in results if cuisines)
+            print(f"  {name:5} {matcher.__name__:9}: {best_rate(matcher, corpus):9,.0f} msg/s, "
+                  f"{routed} routed to restaurants, {tagged} with a cuisine")
+
+
+if __name__ == "__main__":
+    main()
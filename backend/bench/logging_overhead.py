@@ -0,0 +1,100 @@
+import argparse
+import logging
+import os
+import queue
+import sys
+import time
+
+"""
+    Used for :
+        _Request-thread CPU spent on logging, for --requests simulated requests that each write 3 INFO lines and
+         1 DEBUG line with fields, sleeping --sleep-ms between requests so a listener thread can keep up:
+            + print: the 3 INFO lines through an unstructured print() with flush, as before logs.py
+            + sync json: logs.JsonFormatter on a StreamHandler, formatted and written in the request thread
+            + queue: logs.BufferedQueueHandler with its listener thread and the LogRecord optimizations of configure_logging()
+         Every mode writes to os.devnull; both logging modes run the same sampling and request id filters
+        _python bench/logging_overhead.py --requests 3000 --runs 3
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--requests", type=int, default=3000)
+parser.add_argument("--runs", type=int, default=3)
+parser.add_argument("--sleep-ms", type=float, default=1)
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import AppConfig
+from logs import BufferedQueueHandler, DrainingQueueListener, JsonFormatter, RequestIdFilter, SamplingFilter, fields
+
+logger = logging.getLogger("bench")
+sink = open(os.devnull, "w")
+
+
+def log_request(n):
+    logger.info("Request started", extra=fields(method="POST", path="/api/chats/c1/messages"))
+    logger.debug("Context built", extra=fields(chat_id="c1", history_messages=12, document_tokens=1800))
+    logger.info("Turn finished", extra=fields(chat_id="c1", model="gpt-4o", prompt_ms=1.2, openai_ms=850.0, n=n))
+    logger.info("Request finished", extra=fields(method="POST", status=200, duration_ms=861.4))
+
+
+def print_request(n):
+    print("Request started POST /api/chats/c1/messages", file=sink, flush=True)
+    print(f"Turn finished c1 gpt-4o {n}", file=sink, flush=True)
+    print("Request finished 200", file=sink, flush=True)
+
+
+"""explain: Request-thread CPU per request in microseconds; sleeping does not count towards thread_time."""
+def run(handle):
+    cpu = 0.0
+    for n in range(args.requests):
+        started = time.thread_time()
+        handle(n)
+        cpu += time.thread_time() - started
+        time.sleep(args.sleep_ms / 1000)
+    return cpu * 1e6 / args.requests
+
+
+def add_filters(handler):
+    handler.addFilter(SamplingFilter(AppConfig.LOG_DEBUG_SAMPLE_RATE))
+    handler.addFilter(RequestIdFilter())
+    return handler
+
+
+def main():
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    results = {"print": [], "sync json": [], "queue": []}
+    dropped = 0
+    for _ in range(args.runs):
+        results["print"].append(run(print_request))
+
+        output = logging.StreamHandler(sink)
+        output.setFormatter(JsonFormatter())
+        logger.addHandler(add_filters(output))
+        results["sync json"].append(run(log_request))
+        logger.removeHandler(output)
+
+    # configure_logging() switches these off for the whole process, so the queued runs go last
+    logging._srcfile = None
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = logging.logAsyncioTasks = False
+    for _ in range(args.runs):
+        handler = add_filters(BufferedQueueHandler(queue.Queue(AppConfig.LOG_QUEUE_SIZE)))
+        output = logging.StreamHandler(sink)
+        output.setFormatter(JsonFormatter())
+        listener = DrainingQueueListener(handler.queue, output, respect_handler_level=False)
+        listener.start()
+        logger.addHandler(handler)
+        results["queue"].append(run(log_request))
+        logger.removeHandler(handler)
+        listener.stop()
+        dropped += handler.dropped
+
+    print(f"{args.requests} requests, 3 INFO + 1 DEBUG lines each, request-thread CPU per request over {args.runs} runs")
+    for label, micros in results.items():
+        print(f"  {label:9}: {min(micros):.0f}-{max(micros):.0f} us")
+    print(f"  queue records dropped: {dropped}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+"""
+    Used for :
+        _Encoding and decoding a chat detail payload with --message-bytes messages, half of them assistant messages
+         with reasoning:
+            + json: the baseline, a dict per message and json.dumps with jsonify's settings (sorted keys, compact);
+              decoding is json.loads plus a type check of every field
+            + msgspec: schemas.ChatDetail / MessageOut Structs encoded by schemas.encode, decoded as ChatDetail
+         Time is the best of --repeat runs; peak memory comes from a separate tracemalloc run
+        _python bench/payload_codec.py --messages 1000 10000
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--messages", type=int, nargs="+", default=[1000, 10000])
+parser.add_argument("--message-bytes", type=int, default=500)
+parser.add_argument("--repeat", type=int, default=10)
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import msgspec
+from schemas import ChatDetail, MessageOut, encode
+
+FIELD_TYPES = {"seq": int, "role": str, "content": str}
+
+
+def text(rng):
+    return "".join(rng.choice("abcdefghij klmnopqrstuvwxyz") for _ in range(args.message_bytes))
+
+
+def json_encode(messages):
+    payload = {
+        "id": "c1", "name": "Chat", "has_more": False, "next_before_seq": None, "next_after_seq": None,
+        "messages": [
+            {"seq": seq, "role": role, "content": content, "reasoning": reasoning} if role == "assistant"
+            else {"seq": seq, "role": role, "content": content}
+            for seq, role, content, reasoning in messages
+        ],
+    }
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+
+
+def json_decode(body):
+    data = json.loads(body)
+    for message in data["messages"]:
+        for name, expected in FIELD_TYPES.items():
+            if not isinstance(message[name], expected):
+                raise ValueError(name)
+        if not isinstance(message.get("reasoning"), (str, type(None))):
+            raise ValueError("reasoning")
+    return data
+
+
+def msgspec_encode(messages):
+    return encode(ChatDetail(
+        id="c1", name="Chat", has_more=False, next_before_seq=None, next_after_seq=None,
+        messages=[
+            MessageOut(seq, role, content, reasoning) if role == "assistant" else MessageOut(seq, role, content)
+            for seq, role, content, reasoning in messages
+        ]
+    ))
+
+
+def msgspec_decode(body):
+    return msgspec.json.decode(body, type=ChatDetail)
+
+
+"""explain: (best time in ms, peak traced MiB) of func(value)."""
+def measure(func, value):
+    best = min(timed(func, value) for _ in range(args.repeat))
+    tracemalloc.start()
+    func(value)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / 2**20
+
+
+def timed(func, value):
+    started = time.perf_counter()
+    func(value)
+    return time.perf_counter() - started
+
+
+def main():
+    rng = random.Random(23)
+    print(f"{args.message_bytes}-byte messages, best of {args.repeat} runs")
+    print(f"  {'messages':9} {'step':24} {'json':24} msgspec")
+    for count in args.messages:
+        messages = [
+            (seq, "user", text(rng), None) if seq % 2 == 0 else (seq, "assistant", text(rng), text(rng))
+            for seq in range(count)
+        ]
+        json_body, msgspec_body = json_encode(messages), msgspec_encode(messages)
+        assert json.loads(json_body) == json.loads(msgspec_body)
+        for step, baseline, candidate, value in (
+            (f"encode ({len(msgspec_body) / 2**20:.2f} MiB body)", json_encode, msgspec_encode, messages),
+            ("decode (+ validation)", json_decode, msgspec_decode, msgspec_body),
+        ):
+            cells = [f"{ms:.1f} ms, peak {peak:.1f} MiB" for ms, peak in (measure(baseline, value), measure(candidate, value))]
+            print(f"  {count:<9} {step:24} {cells[0]:24} {cells[1]}")
+
+
+if __name__ == "__main__":
+    main()
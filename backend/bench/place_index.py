@@ -0,0 +1,78 @@
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+"""
+    Used for :
+        _Query time of places.PlaceIndex.nearest over --places synthetic places in a 33x44 km box (around Tokyo),
+         for each cell size in --cells:
+            + --queries k=--k lookups with a --radius meter limit from random points in the box
+            + the first --verify queries are checked against a brute force scan over every place
+        _python bench/place_index.py --places 1000000 --queries 2000 --cells 0.002 0.005 0.01
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--places", type=int, default=1000000)
+parser.add_argument("--queries", type=int, default=2000)
+parser.add_argument("--k", type=int, default=10)
+parser.add_argument("--radius", type=float, default=2000)
+parser.add_argument("--cells", type=float, nargs="+", default=[0.002, 0.005, 0.01])
+parser.add_argument("--verify", type=int, default=20, help="Queries checked against brute force")
+parser.add_argument("--seed", type=int, default=14)
+args = parser.parse_args()
+
+tmp_dir = tempfile.mkdtemp(prefix="merlin-bench-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+    OPENAI_API_KEY="bench",
+    LOG_LEVEL="WARNING",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from places import PlaceIndex
+
+SOUTH, WEST = 35.55, 139.55
+HEIGHT, WIDTH = 0.3, 0.48 # About 33 km by 44 km
+
+
+def brute_force(places, latitude, longitude):
+    lng_scale = max(math.cos(math.radians(latitude)), 0.01)
+    limit = (args.radius / PlaceIndex.METERS_PER_DEGREE) ** 2
+    found = []
+    for n, (lat, lng) in enumerate(places):
+        squared = (lat - latitude) ** 2 + ((lng - longitude) * lng_scale) ** 2
+        if squared <= limit:
+            found.append((squared, f"p{n}"))
+    return [place_id for _, place_id in sorted(found)[:args.k]]
+
+
+def main():
+    rng = random.Random(args.seed)
+    places = [(SOUTH + rng.random() * HEIGHT, WEST + rng.random() * WIDTH) for _ in range(args.places)]
+    queries = [(SOUTH + rng.random() * HEIGHT, WEST + rng.random() * WIDTH) for _ in range(args.queries)]
+    expected = [brute_force(places, latitude, longitude) for latitude, longitude in queries[:args.verify]]
+
+    print(f"{args.places} places, {args.queries} k={args.k} queries within {args.radius:.0f} m")
+    for cell_degrees in args.cells:
+        index = PlaceIndex(cell_degrees, refresh_seconds=0)
+        started = time.perf_counter()
+        for n, (lat, lng) in enumerate(places):
+            index.insert(f"p{n}", lat, lng, "", fetched_ts=0)
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = [index.nearest(latitude, longitude, args.k, args.radius) for latitude, longitude in queries]
+        query_seconds = time.perf_counter() - started
+        matches = sum([place_id for _, place_id in got] == want for got, want in zip(results, expected))
+        print(
+            f"  {cell_degrees} degree cells: build {build_seconds:.1f} s, {query_seconds * 1000 / args.queries:.2f} ms/query,"
+            f" {matches}/{len(expected)} match brute force"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+"""
+    Used for :
+        _Prompt size and latency of chunk retrieval against sending whole documents, on a temporary SQLite file:
+            + one chat holding a generated document of --words words, with --facts planted sentences
+            + each query asks about one planted fact; a hit is a top-k excerpt containing it
+        _python bench/retrieval_bench.py --words 200000 --facts 50
+         Prints document tokens per turn (whole vs top-k), index build time, per-query time with the cached
+         index, and how many queries found their fact
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--words", type=int, default=200000, help="length of the generated document")
+parser.add_argument("--facts", type=int, default=50, help="planted sentences, one query each")
+parser.add_argument("--seed", type=int, default=4)
+args = parser.parse_args()
+
+tmp_dir = tempfile.mkdtemp(prefix="merlin-bench-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+    OPENAI_API_KEY="bench",
+    LOG_LEVEL="WARNING",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+from app import db
+from config import AppConfig
+from context import count_tokens
+from models import Chat, User
+from retrieval import build_chunks, chunk_index_cache, format_chunks, retrieve_chunks
+
+
+def make_document(rng):
+    vocabulary = [f"term{n}" for n in range(5000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))] # Zipf-like, as in prose
+    words = rng.choices(vocabulary, weights, k=args.words)
+    facts = []
+    for n in range(args.facts):
+        code = f"project{n}x{rng.randrange(10 ** 6)}"
+        sentence = f"the budget of {code} was approved by director{n} in quarter{n % 4}"
+        words.insert(rng.randrange(len(words)), sentence)
+        facts.append((f"Who approved the budget of {code}?", code))
+    return " ".join(words), facts
+
+
+def main():
+    rng = random.Random(args.seed)
+    document, facts = make_document(rng)
+    with app.app_context():
+        db.create_all()
+        user = User(username="bench")
+        user.set_password("bench")
+        db.session.add(user)
+        db.session.flush()
+        chat = Chat(user_id=user.id, name="bench")
+        db.session.add(chat)
+        db.session.flush()
+        chat_id = chat.id
+        db.session.add_all(build_chunks(chat_id, "report.pdf", document))
+        db.session.commit()
+
+        started = time.perf_counter()
+        retrieve_chunks(chat_id, facts[0][0]) # Builds and caches the index
+        build_ms = (time.perf_counter() - started) * 1000
+
+        hits = 0
+        excerpt_tokens = 0
+        started = time.perf_counter()
+        for query, code in facts:
+            chunks = retrieve_chunks(chat_id, query)
+            hits += any(code in chunk.content for chunk in chunks)
+            excerpt_tokens += count_tokens(format_chunks(chunks))
+        query_ms = (time.perf_counter() - started) * 1000 / len(facts)
+
+        index = chunk_index_cache.get(chat_id)
+        print(f"{args.words} words in {len(index)} chunks of {AppConfig.RETRIEVAL_CHUNK_WORDS} words, "
+              f"top {AppConfig.RETRIEVAL_TOP_K}, {len(facts)} queries")
+        print(f"  document tokens per turn: whole {count_tokens(document)}, excerpts {excerpt_tokens / len(facts):.0f}")
+        print(f"  index build (first query): {build_ms:.0f} ms")
+        print(f"  query with the cached index: {query_ms:.2f} ms (includes loading the k chunks)")
+        print(f"  queries whose fact was retrieved: {hits}/{len(facts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+"""
+    Used for :
+        _Startup cost of each --modules entry point, imported in a fresh interpreter --runs times:
+         wall time of the import (which builds the app), peak RSS, registered routes, and which of the heavy
+         client libraries (openai, googlemaps, PyPDF2, tiktoken) were loaded
+        _--backend points at another checkout to compare, e.g. the tree before the lazy imports:
+            git worktree add /tmp/merlin-before <commit>
+            python bench/startup.py --backend /tmp/merlin-before/backend
+        _python bench/startup.py --modules main asgi --runs 5
+"""
+
+HEAVY_MODULES = ("openai", "googlemaps", "PyPDF2", "tiktoken")
+
+CHILD = """
+import json, resource, sys, time
+started = time.perf_counter()
+module = __import__(sys.argv[1])
+elapsed = time.perf_counter() - started
+app = getattr(module, "app", None)
+app = getattr(app, "flask_app", app) # asgi:app wraps the Flask app
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "routes": len(list(app.url_map.iter_rules())) if hasattr(app, "url_map") else None,
+    "heavy": [name for name in sys.argv[2:] if name in sys.modules],
+}))
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--modules", nargs="+", default=["main", "asgi"])
+parser.add_argument("--runs", type=int, default=5)
+parser.add_argument("--backend", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+args = parser.parse_args()
+
+
+"""explain: The child's measurements, or {"error": last stderr line} when the import failed."""
+def run(module, env):
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, module, *HEAVY_MODULES], cwd=args.backend, env=env, capture_output=True, text=True
+    )
+    if result.returncode:
+        return {"error": (result.stderr.strip().splitlines() or ["exit status %d" % result.returncode])[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp(prefix="merlin-bench-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+        OPENAI_API_KEY="bench",
+        GOOGLE_API_KEY="AIza-bench", # Older trees build the Maps client at import and check the key's prefix
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=args.backend,
+    )
+    print(f"{args.backend}, {args.runs} runs per module")
+    for module in args.modules:
+        runs = [run(module, env) for _ in range(args.runs)]
+        if "error" in runs[-1]:
+            print(f"  {module:6}: {runs[-1]['error']}")
+            continue
+        seconds = [result["seconds"] for result in runs]
+        rss = [result["rss_mib"] for result in runs]
+        print(
+            f"  {module:6}: {min(seconds):.2f}-{max(seconds):.2f} s, {min(rss):.0f}-{max(rss):.0f} MiB RSS,"
+            f" {runs[-1]['routes']} routes, loaded: {', '.join(runs[-1]['heavy']) or 'none of ' + ', '.join(HEAVY_MODULES)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+"""
+    Used for :
+        _Cost of authenticating opaque tokens with and without middleware.TokenCache, on a temporary SQLite file:
+         --requests GET /api/check-login calls through the Flask test client, spread over --users logged-in users
+        _python bench/token_cache.py --requests 3000 --users 10
+         Prints the SELECTs on the user table and the time per request for each run
+"""
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--requests", type=int, default=3000)
+parser.add_argument("--users", type=int, default=10)
+args = parser.parse_args()
+
+tmp_dir = tempfile.mkdtemp(prefix="merlin-bench-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+    OPENAI_API_KEY="bench",
+    LOG_LEVEL="WARNING",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from main import app
+from app import db
+from middleware import token_cache
+from models import User
+
+USER_TABLE = re.compile(r'\bFROM "?user"?(\s|$)')
+
+
+def run(client, tokens, engine):
+    selects = [0]
+    def count(conn, cursor, statement, parameters, context, executemany):
+        selects[0] += statement.lstrip().upper().startswith("SELECT") and bool(USER_TABLE.search(statement))
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        started = time.perf_counter()
+        for n in range(args.requests):
+            response = client.get("/api/check-login", headers={"Authorization": f"Bearer {tokens[n % len(tokens)]}"})
+            assert response.status_code == 200
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return selects[0], elapsed * 1e6 / args.requests
+
+
+def main():
+    with app.app_context():
+        db.create_all()
+        tokens = [f"bench-token-{n}" for n in range(args.users)]
+        for n, token in enumerate(tokens):
+            user = User(username=f"bench{n}", token=token)
+            user.set_password("bench")
+            db.session.add(user)
+        db.session.commit()
+        engine = db.engine
+
+    client = app.test_client()
+    client.get("/api/check-login") # Warms up the app
+    print(f"{args.requests} authenticated requests over {args.users} tokens")
+    max_entries = token_cache.max_entries
+    for label, entries in (("no cache", 0), ("token cache", max_entries)):
+        token_cache.max_entries = entries
+        selects, micros = run(client, tokens, engine)
+        print(f"  {label:11}: {selects} user SELECTs, {micros:.0f} us per request")
+    print(f"  cache stats: {token_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
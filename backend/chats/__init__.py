@@ -1,4 +1 @@
-from main import app
 from chats.routes import chats_bp
-
-app.register_blueprint(chats_bp)
\ No newline at end of file
@@ -1,16 +1,23 @@
-from middleware import token_required
-from flask import blueprints,jsonify,request
-from main import db
-import io
-import json
-from PyPDF2 import PdfReader
-from models import Chat
+from middleware import token_required,rate_limited
+from flask import Blueprint,jsonify,request,make_response,Response,stream_with_context,current_app
+from app import db
+import logging
+import os
+import hashlib
+import base64
+from datetime import datetime,timezone
+import msgspec
+from models import Chat,Message,Document,DocumentChunk,UploadJob,UploadJobFile
+from config import AppConfig
 import uuid
-from utils import RestaurantHandle,parse_reasoning_response
-from main import openai_client
+from jobs import extraction_queue,spool_path
+from turns import ChatTurn,turn_from_request,DEFAULT_MODEL
+from service import clients
+from schemas import ChatDetail,ChatSummary,encode,json_response,rename_decoder
 
 
-chats_bp = blueprints('chats',__name__)
+chats_bp = Blueprint('chats',__name__)
+logger = logging.getLogger(__name__)
 
 """explain: Creates a new chat session for the authenticated user."""
 @chats_bp.route('/api/chats', methods=['POST'])
@@ -31,26 +38,102 @@ def create_chat():
         db.session.add(chat)
         db.session.commit()
         # Return the full chat object including the generated name
-        return jsonify({"id": chat.id, "name": chat.name}), 201
+        return json_response(ChatSummary(chat.id, chat.name), 201)
     except Exception as e:
          db.session.rollback()
-         print(f"DB error creating chat: {e}")
+         logger.exception("DB error creating chat")
          return jsonify({"error": "Database error creating chat"}), 500
     
-"""explain: Retrieves the list of chat sessions (ID and name) for the authenticated user."""
+"""explain: Opaque chat list cursor: the updated_at and id of the last chat on a page."""
+def encode_chat_cursor(updated_at, chat_id):
+    return base64.urlsafe_b64encode(f"{updated_at.isoformat()}|{chat_id}".encode()).decode().rstrip("=")
+
+def decode_chat_cursor(cursor):
+    try:
+        updated_at, chat_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|", 1)
+        return datetime.fromisoformat(updated_at), chat_id
+    except ValueError:
+        return None
+
+"""explain: Retrieves the user's chats (id, name, updated_at), most recently active first. Without ?limit= or ?before= all chats are returned; with them, one page, and the cursor of the next page comes back in the X-Next-Before header (absent on the last page)."""
 @chats_bp.route('/api/chats', methods=['GET'])
 @token_required
 def get_chats():
+    limit = request.args.get('limit', type=int)
+    before = request.args.get('before')
+    paged = limit is not None or before is not None
+    limit = max(1, min(AppConfig.CHAT_PAGE_SIZE if limit is None else limit, AppConfig.MAX_CHAT_PAGE_SIZE))
+    cursor = decode_chat_cursor(before) if before else None
+    if before and cursor is None:
+        return jsonify({"error": "Invalid cursor"}), 400
     try:
-        # Order chats by creation time or last updated time if available
-        # Assuming newer chats are more relevant, order descending by ID (if UUIDs are sequential enough) or add a timestamp column
-        chats = Chat.query.filter_by(user_id=request.user.id).order_by(Chat.id.desc()).all()
-        # Return basic info: id and name
-        return jsonify([{"id": chat.id, "name": chat.name or f"Chat {chat.id[:4]}"} for chat in chats])
+        # Keyset pagination over ix_chat_user_id_updated_at: only the selected columns are read, never the legacy blobs
+        query = db.session.query(Chat.id, Chat.name, Chat.updated_at).filter(Chat.user_id == request.user.id)
+        if cursor:
+            query = query.filter(db.tuple_(Chat.updated_at, Chat.id) < cursor)
+        query = query.order_by(Chat.updated_at.desc(), Chat.id.desc())
+        rows = query.limit(limit + 1).all() if paged else query.all()
+        page = rows[:limit] if paged else rows
+        response = json_response([
+            ChatSummary(chat_id, name or f"Chat {chat_id[:4]}", updated_at.replace(tzinfo=timezone.utc))
+            for chat_id, name, updated_at in page
+        ])
+        if paged and len(rows) > limit:
+            response.headers['X-Next-Before'] = encode_chat_cursor(page[-1].updated_at, page[-1].id)
+        return response
     except Exception as e:
-        print(f"Error fetching chats: {e}")
+        logger.exception("Error fetching chats")
         return jsonify({"error": "Error retrieving chat list"}), 500
 
+CHAT_DETAIL_FIELDS = {"id", "name", "messages", "pdf_text", "uploaded_pdfs"}
+
+"""explain: Builds a weak ETag from cheap lookups (name, last message seq, documents_version) plus the query string, so any change to the chat or a different view of it yields a new tag. Document ids are not used: SQLite hands a removed document's id to the next upload."""
+def chat_etag(chat):
+    last_seq = db.session.query(db.func.max(Message.seq)).filter(Message.chat_id == chat.id).scalar()
+    version = f"{chat.id}|{chat.name}|{last_seq}|{chat.documents_version}|{request.query_string.decode()}"
+    return hashlib.sha1(version.encode()).hexdigest()
+
+"""explain: Serializes only the requested fields of a chat. Without ?limit= or a cursor all messages are returned; with them, messages page backwards with ?before_seq= (newest page first) or forwards with ?after_seq=."""
+def chat_detail(chat, fields):
+    data = ChatDetail()
+    if "id" in fields:
+        data.id = chat.id
+    if "name" in fields:
+        data.name = chat.name or f"Chat {chat.id[:4]}"
+    if "messages" in fields:
+        limit = request.args.get('limit', type=int)
+        before_seq = request.args.get('before_seq', type=int)
+        after_seq = request.args.get('after_seq', type=int)
+        paged = limit is not None or before_seq is not None or after_seq is not None
+        limit = max(1, min(AppConfig.MESSAGE_PAGE_SIZE if limit is None else limit, AppConfig.MAX_MESSAGE_PAGE_SIZE))
+
+        query = Message.query.filter_by(chat_id=chat.id)
+        if not paged: # Full history, as before paging existed
+            page = query.order_by(Message.seq).all()
+            has_more = False
+            data.next_before_seq = None
+            data.next_after_seq = page[-1].seq if page else None
+        elif after_seq is not None:
+            page = query.filter(Message.seq > after_seq).order_by(Message.seq).limit(limit + 1).all()
+            has_more = len(page) > limit
+            page = page[:limit]
+            data.next_after_seq = page[-1].seq if page else after_seq
+        else:
+            if before_seq is not None:
+                query = query.filter(Message.seq < before_seq)
+            page = query.order_by(Message.seq.desc()).limit(limit + 1).all()
+            has_more = len(page) > limit
+            page = page[:limit][::-1] # Back to chronological order
+            data.next_before_seq = page[0].seq if has_more else None
+            data.next_after_seq = page[-1].seq if page else None
+        data.messages = [msg.to_struct() for msg in page]
+        data.has_more = has_more
+    if "pdf_text" in fields:
+        data.pdf_text = Document.assemble(chat.id)
+    if "uploaded_pdfs" in fields:
+        data.uploaded_pdfs = Document.filenames(chat.id)
+    return data
+
 """explain: Handles GET (retrieve details), PUT (rename), and DELETE operations for a specific chat."""
 
 @chats_bp.route('/api/chats/<chat_id>', methods=['GET', 'PUT', 'DELETE'])
@@ -63,35 +146,35 @@ def manage_chat(chat_id):
 
     if request.method == 'GET':
         try:
-            messages_list = json.loads(chat.messages or '[]')
-            pdfs_list = json.loads(chat.uploaded_pdfs or '[]')
-
-            # --- Ensure messages have the correct structure for frontend ---
-            # Add empty reasoning if missing for older messages or non-reasoning responses
-            updated_messages = []
-            for msg in messages_list:
-                if msg.get('role') == 'assistant' and 'reasoning' not in msg:
-                    msg['reasoning'] = None # Add null/None reasoning field
-                updated_messages.append(msg)
-
-            return jsonify({
-                "id": chat.id,
-                "name": chat.name or f"Chat {chat.id[:4]}",
-                "messages": updated_messages, # Return potentially modified messages
-                "pdf_text": chat.pdf_text or "",
-                "uploaded_pdfs": pdfs_list
-            })
-        except json.JSONDecodeError:
-             return jsonify({"error": "Error decoding chat data"}), 500
+            # --- Field selection (?fields=messages,uploaded_pdfs); all fields when omitted ---
+            fields_param = request.args.get('fields')
+            if fields_param:
+                fields = {field.strip() for field in fields_param.split(',') if field.strip()}
+                unknown = fields - CHAT_DETAIL_FIELDS
+                if unknown:
+                    return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+            else:
+                fields = set(CHAT_DETAIL_FIELDS)
+
+            # --- Conditional GET: 304 when nothing in the chat changed since the client's copy ---
+            etag = chat_etag(chat)
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = json_response(chat_detail(chat, fields))
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
         except Exception as e:
-            print(f"Error fetching chat details: {e}")
+            logger.exception("Error fetching chat details")
             return jsonify({"error": "Internal server error fetching chat details"}), 500
 
     elif request.method == 'PUT': # Rename chat
-        data = request.get_json()
-        if not data or 'name' not in data:
+        try:
+            data = rename_decoder.decode(request.get_data()) # Rejects a missing or non-string name
+        except msgspec.DecodeError:
             return jsonify({"error": "New name is required"}), 400
-        new_name = data['name'].strip()
+        new_name = data.name.strip()
         if not new_name:
              return jsonify({"error": "Chat name cannot be empty"}), 400
         # Optional: Add length validation for the name
@@ -105,20 +188,23 @@ def manage_chat(chat_id):
             return jsonify({"success": True, "message": "Chat renamed successfully"})
         except Exception as e:
              db.session.rollback()
-             print(f"DB error renaming chat: {e}")
+             logger.exception("DB error renaming chat")
              return jsonify({"error": "Database error renaming chat"}), 500
 
     elif request.method == 'DELETE':
         try:
+            Message.query.filter_by(chat_id=chat.id).delete(synchronize_session=False)
+            DocumentChunk.query.filter_by(chat_id=chat.id).delete(synchronize_session=False)
+            Document.query.filter_by(chat_id=chat.id).delete(synchronize_session=False)
             db.session.delete(chat)
             db.session.commit()
             return jsonify({"success": True, "message": "Chat deleted successfully"})
         except Exception as e:
              db.session.rollback()
-             print(f"DB error deleting chat: {e}")
+             logger.exception("DB error deleting chat")
              return jsonify({"error": "Database error deleting chat"}), 500
 
-"""explain: Handles uploading of PDF files, extracts text, and appends it to the chat's context."""
+"""explain: Accepts PDF uploads and queues them for background text extraction. Returns 202 with a job id to poll."""
 
 @chats_bp.route('/api/chats/<chat_id>/upload-pdfs', methods=['POST'])
 @token_required
@@ -134,62 +220,77 @@ def upload_pdfs(chat_id):
     if not pdf_files:
          return jsonify({"error": "No PDF files selected"}), 400
 
-    current_pdf_text = chat.pdf_text or ""
-    current_uploaded_pdfs = json.loads(chat.uploaded_pdfs or '[]')
-    newly_uploaded_filenames = []
+    current_uploaded_pdfs = set(Document.filenames(chat.id))
+    pending_pdfs = {
+        job_file.filename for job_file in UploadJobFile.query.filter(
+            UploadJobFile.chat_id == chat.id, UploadJobFile.status.in_(('queued', 'processing'))
+        )
+    }
+    job = UploadJob(chat_id=chat.id)
+    db.session.add(job)
+    queued_files = []
     errors = []
+    os.makedirs(AppConfig.UPLOAD_SPOOL_DIR, exist_ok=True)
 
-    for pdf_file in pdf_files:
-        if pdf_file and pdf_file.filename and pdf_file.filename.lower().endswith('.pdf'):
-            filename = pdf_file.filename
-
-            if filename in current_uploaded_pdfs:
-                 errors.append(f"'{filename}' is already uploaded to this chat.")
-                 continue
-
-            try:
-                pdf_stream = io.BytesIO(pdf_file.read())
-                pdf_reader = PdfReader(pdf_stream)
-                extracted_text = ""
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        extracted_text += page_text + "\n\n"
-
-                if extracted_text:
-                     current_pdf_text += f"--- START OF {filename} ---\n{extracted_text}\n--- END OF {filename} ---\n\n"
-                     current_uploaded_pdfs.append(filename)
-                     newly_uploaded_filenames.append(filename)
-                else:
-                     errors.append(f"Could not extract text from '{filename}'.")
-
-            except Exception as e:
-                errors.append(f"Error processing PDF '{filename}': {str(e)}")
-        else:
-            if pdf_file.filename:
-                 errors.append(f"Invalid file type for '{pdf_file.filename}'. Only PDFs are allowed.")
+    try:
+        for pdf_file in pdf_files:
+            if pdf_file and pdf_file.filename and pdf_file.filename.lower().endswith('.pdf'):
+                filename = pdf_file.filename
+
+                if filename in current_uploaded_pdfs:
+                     errors.append(f"'{filename}' is already uploaded to this chat.")
+                     continue
+                if filename in pending_pdfs:
+                     errors.append(f"'{filename}' is already being processed for this chat.")
+                     continue
+
+                job_file = UploadJobFile(job=job, chat_id=chat.id, filename=filename, status='queued')
+                db.session.add(job_file)
+                db.session.flush() # Assigns the id used to name the spooled file
+                pdf_file.save(spool_path(job_file.id))
+                queued_files.append(job_file)
+                pending_pdfs.add(filename)
+            else:
+                if pdf_file.filename:
+                     errors.append(f"Invalid file type for '{pdf_file.filename}'. Only PDFs are allowed.")
 
-    if newly_uploaded_filenames:
-        chat.pdf_text = current_pdf_text
-        chat.uploaded_pdfs = json.dumps(current_uploaded_pdfs)
-        try:
-            db.session.commit()
-        except Exception as e:
+        if not queued_files:
             db.session.rollback()
-            print(f"DB error saving uploaded PDF data: {e}")
-            all_errors = errors + ["Database error saving changes."]
-            return jsonify({"error": ", ".join(all_errors)}), 500
+            return jsonify({"error": ", ".join(errors) or "No PDF files selected"}), 400
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for job_file in queued_files:
+            if job_file.id and os.path.exists(spool_path(job_file.id)):
+                os.remove(spool_path(job_file.id))
+        logger.exception("DB error queueing uploaded PDFs")
+        return jsonify({"error": ", ".join(errors + ["Database error saving changes."])}), 500
+
+    extraction_queue.start(current_app._get_current_object())
 
-    if not errors:
-        return jsonify({"message": "PDFs uploaded successfully.", "uploaded_pdfs": current_uploaded_pdfs})
-    else:
-         return jsonify({
-             "message": f"Processed uploads with some issues. Newly added: {', '.join(newly_uploaded_filenames) if newly_uploaded_filenames else 'None'}.",
-             "errors": errors,
-             "uploaded_pdfs": current_uploaded_pdfs
-         }), 207
+    response = job.to_dict()
+    response.update({
+        "message": f"Queued for processing: {', '.join(job_file.filename for job_file in queued_files)}.",
+        "status_url": f"/api/chats/{chat.id}/upload-jobs/{job.id}",
+        "errors": errors,
+    })
+    return jsonify(response), 202
 
-"""explain: Removes a specific PDF's filename from the list and its corresponding text content from the chat context."""
+"""explain: Reports the progress of a PDF upload job, per file and per page."""
+
+@chats_bp.route('/api/chats/<chat_id>/upload-jobs/<job_id>', methods=['GET'])
+@token_required
+def get_upload_job(chat_id, job_id):
+    chat = Chat.query.filter_by(id=chat_id, user_id=request.user.id).first()
+    if not chat:
+        return jsonify({"error": "Chat not found or access denied"}), 404
+
+    job = UploadJob.query.filter_by(id=job_id, chat_id=chat.id).first()
+    if not job:
+        return jsonify({"error": "Upload job not found"}), 404
+    return jsonify(job.to_dict())
+
+"""explain: Removes a specific PDF (its document row and retrieval chunks) from the chat context."""
 
 @chats_bp.route('/api/chats/<chat_id>/remove-pdf', methods=['POST'])
 @token_required
@@ -204,228 +305,75 @@ def remove_pdf(chat_id):
     pdf_name_to_remove = data['pdf_name']
 
     try:
-        uploaded_pdfs = json.loads(chat.uploaded_pdfs or '[]')
-        if pdf_name_to_remove not in uploaded_pdfs:
+        removed = Document.query.filter_by(chat_id=chat.id, filename=pdf_name_to_remove).delete(synchronize_session=False)
+        if not removed:
+            db.session.rollback()
             return jsonify({"error": f"PDF '{pdf_name_to_remove}' not found in this chat"}), 404
-
-        uploaded_pdfs.remove(pdf_name_to_remove)
-
-        current_pdf_text = chat.pdf_text or ""
-        start_marker = f"--- START OF {pdf_name_to_remove} ---"
-        end_marker = f"--- END OF {pdf_name_to_remove} ---"
-        start_index = current_pdf_text.find(start_marker)
-        end_index = current_pdf_text.find(end_marker)
-
-        new_pdf_text = current_pdf_text
-        if start_index != -1 and end_index != -1:
-            end_marker_line_end = current_pdf_text.find("\n", end_index + len(end_marker))
-            if end_marker_line_end != -1:
-                 new_pdf_text = current_pdf_text[:start_index] + current_pdf_text[end_marker_line_end:].lstrip("\n")
-            else:
-                 new_pdf_text = current_pdf_text[:start_index]
-        else:
-             print(f"Warning: Markers for '{pdf_name_to_remove}' not found in pdf_text. Text content not removed.")
-
-
-        chat.uploaded_pdfs = json.dumps(uploaded_pdfs)
-        chat.pdf_text = new_pdf_text.strip()
+        DocumentChunk.query.filter_by(chat_id=chat.id, filename=pdf_name_to_remove).delete(synchronize_session=False)
+        Chat.bump_documents_version(chat.id)
 
         db.session.commit()
         return jsonify({"success": True, "message": f"PDF '{pdf_name_to_remove}' removed."})
 
-    except json.JSONDecodeError:
-        return jsonify({"error": "Error decoding PDF list data"}), 500
     except Exception as e:
         db.session.rollback()
-        print(f"DB error removing PDF: {e}")
+        logger.exception("DB error removing PDF")
         return jsonify({"error": "Database error removing PDF"}), 500
 
-"""explain: Processes incoming user messages, interacts with OpenAI (handling normal, food, and reasoning flows with structured output), and saves the conversation."""
-@chats_bp.route('/api/chats/<chat_id>/messages', methods=['POST'])
-@token_required
-def send_message(chat_id):
-    chat = Chat.query.filter_by(id=chat_id, user_id=request.user.id).first()
-    if not chat:
-        return jsonify({"error": "Chat not found or access denied"}), 404
-
-    message = request.form.get("message")
-    use_reasoning_flag = request.form.get("use_reasoning", "false").lower() == "true"
-
-    if not message or not message.strip():
-        return jsonify({"error": "Message cannot be empty"}), 400
-
-    message = message.strip()
+"""explain: Formats a single server-sent event frame."""
+def sse_event(event, data):
+    return f"event: {event}\ndata: {encode(data).decode()}\n\n"
+
+"""explain: Streams an OpenAI completion to the client as server-sent events. Reasoning/answer sections are parsed incrementally and the turn is saved to the chat only once the stream ends."""
+def stream_completion(turn):
+    def generate():
+        if turn.immediate_response: # Already answered (e.g. response cache hit): replay it as one stream
+            for section, text in turn.immediate_events():
+                yield sse_event("delta", {"section": section, "text": text})
+            yield sse_event("done", turn.immediate_response)
+            return
+        try:
+            stream = clients.openai().chat.completions.create(**turn.completion_args(stream=True))
+            for chunk in stream:
+                turn.record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                for section, text in turn.stream_events(delta):
+                    yield sse_event("delta", {"section": section, "text": text})
+
+            events, payload = turn.finish_stream()
+            for section, text in events:
+                yield sse_event("delta", {"section": section, "text": text})
+            yield sse_event("done", payload)
 
-    try:
-        messages = json.loads(chat.messages or '[]')
-        pdf_text = chat.pdf_text or ""
-    except json.JSONDecodeError:
-        return jsonify({"error": "Error decoding existing messages"}), 500
-
-    base_system_message = (
-        "You are Merlin, a helpful AI assistant. Provide detailed, accurate, and relevant responses. "
-        "Be concise when appropriate but comprehensive when needed. "
-        "If the user asks about coding, provide clear code examples using markdown code blocks. "
-        "For HTML snippets, use ```html ... ```. For Python, use ```python ... ```, etc. "
-        "Structure your answers clearly using paragraphs, lists, or other formatting as needed."
-    )
+        except Exception as e:
+            yield sse_event("error", turn.fail(e))
 
-    reasoning_instructions = (
-        "\n\nIMPORTANT: Structure your response as follows:\n"
-        "1. First, provide your step-by-step reasoning within <reasoning> tags. Explain how you interpret the request, relevant context (like documents), and how you arrive at the answer.\n"
-        "2. After the reasoning, provide the final, direct answer to the user's query within <answer> tags.\n"
-        "Example:\n<reasoning>\nThe user is asking about X based on the provided document Z. Document Z states Y. Therefore, the answer involves combining information about X and Y.\n</reasoning>\n<answer>\nBased on document Z, the details about X are Y.\n</answer>"
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    system_message = base_system_message
-    if pdf_text:
-        system_message += f"\n\nCONTEXT FROM UPLOADED DOCUMENTS:\n{pdf_text}"
-
-    # Append reasoning instructions ONLY if reasoning mode is active
-    if use_reasoning_flag:
-        system_message += reasoning_instructions
-
-    openai_model = "gpt-4o" # Default model
-    if use_reasoning_flag:
-        # Use gpt-4o-mini for the reasoning flow as requested
-        openai_model = "gpt-4o"
-        print(f"Reasoning mode active for chat {chat_id}. Using model: {openai_model}")
-    else:
-        print(f"Default mode active for chat {chat_id}. Using model: {openai_model}")
-
-
-    is_restaurant_query = False
-    if not use_reasoning_flag: # Check location/food only if not explicitly in reasoning mode
-        restaurant_keywords = ['restaurant', 'eat', 'food', 'dinner', 'lunch', 'meal', 'cuisine', 'dining']
-        intent_keywords = ['near me', 'find', 'where', 'suggest', 'recommend', 'looking for', 'want to eat', 'nearby', 'around here']
-        lower_message = message.lower()
-        is_restaurant_query = any(keyword in lower_message for keyword in restaurant_keywords) and \
-                             any(intent in lower_message for intent in intent_keywords)
-
-    user = request.user
-
-    # --- Restaurant Flow ---
-    if is_restaurant_query: # Only runs if not use_reasoning_flag
-        print(f"Restaurant query detected for chat {chat_id}")
-        if user.latitude is None or user.longitude is None:
-            print("Location not available for food query.")
-            response_text = "I can help with restaurant suggestions! Please share your location first by clicking the 'Share Location' button."
-            messages.append({"role": "user", "content": message})
-            # Store assistant message with null reasoning
-            messages.append({"role": "assistant", "reasoning": None, "content": response_text})
-            chat.messages = json.dumps(messages)
-            try:
-                 db.session.commit()
-            except Exception as e:
-                 db.session.rollback(); print(f"DB error saving location prompt: {e}")
-            return jsonify({"reasoning": None, "response": response_text}) # Return structured response
-        else:
-            print(f"Location available: ({user.latitude}, {user.longitude}). Preparing food query.")
-            restaurant_handle = RestaurantHandle()
-            keywords = restaurant_handle.extract_food_keywords(message)
-            restaurants = restaurant_handle.get_restaurants(user.latitude, user.longitude, keywords)
-            formatted_restaurants = restaurant_handle.format_restaurants(restaurants)
-
-            prompt = (
-                f"User's location: ({user.latitude}, {user.longitude})\n"
-                f"User's message: {message}\n"
-                f"{formatted_restaurants}\n"
-                "Task: Suggest one or more restaurants based on the user's preferences (or lack thereof). "
-                "For each restaurant, provide the following details:\n"
-                "1. Name of the restaurant\n"
-                "2. Notable reason(s) to recommend it\n"
-                "3. Address\n"
-                f"4. Google Maps Link: Use this format: put the name of the restaurant as a link: https://www.google.com/maps/search/?api=1&query={user.latitude},{user.longitude}\n"
-                "5. Google Maps: display an iframe of google map"
-                "If preferences are unclear, suggest a variety of options and explain why each is a good choice. "
-                "Ask follow-up questions if needed to clarify their food interests."
-                
-             )
-
-            openai_api_messages = [
-                {"role": "system", "content": base_system_message}, # Food query doesn't need reasoning tags
-                {"role": "user", "content": prompt}
-            ]
-
-            try:
-                print("Sending food recommendation request to OpenAI...")
-                response = openai_client.chat.completions.create(
-                    model="gpt-4o", # Using gpt-4o for food recommendation
-                    messages=openai_api_messages,
-                    max_tokens=1024
-                )
-                ai_response_text = response.choices[0].message.content
-                print("Received food recommendation response from OpenAI.")
-
-                messages.append({"role": "user", "content": message})
-                # Store food response with null reasoning
-                messages.append({"role": "assistant", "reasoning": None, "content": ai_response_text})
-                chat.messages = json.dumps(messages)
-                db.session.commit()
-                # Return structured response even for non-reasoning flow
-                return jsonify({"reasoning": None, "response": ai_response_text})
-
-            except Exception as e:
-                 db.session.rollback()
-                 print(f"Error during OpenAI call for food recommendation: {e}")
-                 error_message = f"Sorry, I encountered an error while looking for restaurants: {str(e)}"
-                 messages.append({"role": "user", "content": message})
-                 messages.append({"role": "assistant", "reasoning": None, "content": error_message})
-                 chat.messages = json.dumps(messages)
-                 db.session.commit()
-                 return jsonify({"reasoning": None, "response": error_message}), 500
-
-    # --- Default or Reasoning Flow ---
-    else:
-        print(f"Proceeding with {openai_model} completion (Reasoning Mode: {use_reasoning_flag}).")
-
-        openai_api_messages = [{"role": "system", "content": system_message}]
-        # Append previous messages, adapting structure if needed
-        for msg in messages:
-            if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
-                # Send only the 'content' part to the API history
-                 openai_api_messages.append({"role": msg["role"], "content": msg["content"]})
-        openai_api_messages.append({"role": "user", "content": message})
-
-        try:
-            response = openai_client.chat.completions.create(
-                model=openai_model,
-                messages=openai_api_messages,
-                max_tokens=4096
-            )
-            ai_response_text = response.choices[0].message.content
-
-            extracted_reasoning = None
-            extracted_answer = ai_response_text # Default if not in reasoning mode or parsing fails
-
-            # Parse only if reasoning was requested
-            if use_reasoning_flag:
-                extracted_reasoning, extracted_answer = parse_reasoning_response(ai_response_text)
-                if extracted_reasoning is None:
-                    print(f"Warning: Could not parse reasoning tags from {openai_model} response.")
-                    # Keep the full response as the answer if parsing fails but reasoning was expected
-                    extracted_answer = ai_response_text
-
-            # Save history with the new structure
-            messages.append({"role": "user", "content": message})
-            messages.append({"role": "assistant", "reasoning": extracted_reasoning, "content": extracted_answer})
-            chat.messages = json.dumps(messages) # Save updated history
-            db.session.commit()
-
-            # Return structured response
-            return jsonify({"reasoning": extracted_reasoning, "response": extracted_answer})
+"""explain: Processes incoming user messages, interacts with OpenAI (handling normal, food, and reasoning flows with structured output), and saves the conversation. The same turn is served without blocking a thread by asgi.py."""
+@chats_bp.route('/api/chats/<chat_id>/messages', methods=['POST'])
+@token_required
+@rate_limited(DEFAULT_MODEL)
+def send_message(chat_id):
+    turn = turn_from_request(chat_id)
+    if not isinstance(turn, ChatTurn):
+        return turn # Rejected request (unknown chat or empty message)
+    if turn.stream:
+        return stream_completion(turn)
+    if turn.immediate_response:
+        return json_response(turn.immediate_response)
 
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error during OpenAI call with model {openai_model}: {e}")
-            error_message = f"Sorry, I encountered an error processing your request: {str(e)}"
-            messages.append({"role": "user", "content": message})
-            messages.append({"role": "assistant", "reasoning": None, "content": error_message}) # Save error with null reasoning
-            chat.messages = json.dumps(messages)
-            try:
-                db.session.commit()
-            except Exception as db_err:
-                db.session.rollback()
-                print(f"DB error saving error message: {db_err}")
-
-            return jsonify({"reasoning": None, "response": error_message}), 500
+    try:
+        response = clients.openai().chat.completions.create(**turn.completion_args())
+        # Return structured response
+        return json_response(turn.complete(response.choices[0].message.content, response.usage))
+    except Exception as e:
+        return json_response(turn.fail(e), 500)
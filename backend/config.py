@@ -9,14 +9,118 @@ class AppConfig:
             + SECRET KEY 
             + SQLALCHEMY_DATABASE_URI
             + SQLALCHEMY_TRACK_MODIFICATIONS
+            + DB_* / SQLITE_* (Connection pool, Postgres statement timeout and SQLite pragmas, see database.py)
+            + WRITE_BEHIND_* (Optional single writer thread group-committing turns, tokens and locations, see writer.py)
             + MAX_CONTENT_LENGTH (Limit uploads to 100MB total)
+            + MESSAGE_PAGE_SIZE / MAX_MESSAGE_PAGE_SIZE (Chat history paging)
+            + CHAT_PAGE_SIZE / MAX_CHAT_PAGE_SIZE (Chat list paging)
+            + CONTEXT_TOKEN_BUDGET / DOCUMENT_TOKEN_BUDGET (Prompt size limits per turn)
+            + RETRIEVAL_* (Document chunking and top-k retrieval)
+            + PDF_* / UPLOAD_SPOOL_DIR (Background PDF extraction queue and extracted-text cache)
+            + TOKEN_CACHE_* (In-process auth token cache)
+            + AUTH_TOKEN_MODE ('opaque' database tokens or 'jwt' signed access/refresh tokens; 'jwt' requires its own JWT_SECRET_KEY)
+            + ASGI_DB_THREADS (Async serving path in asgi.py)
+            + OPENAI_* / GOOGLE_MAPS_* / UPSTREAM_* / CIRCUIT_BREAKER_* (Outbound HTTP pools, timeouts, retries)
+            + PLACES_CACHE_* (Places nearby-search cache by geohash cell; PLACES_CACHE_DB persists it in SQLite)
+            + PLACE_INDEX_* (Local grid index of fetched restaurants, used before calling the Places API)
+            + INTENTS_CONFIG (Optional JSON file adding keyword sets and intents, see intents.py)
+            + RESPONSE_CACHE_* (Opt-in SQLite cache of completions for repeated questions, see response_cache.py)
+            + RATE_LIMIT_* (Per-user token bucket and per-user / per-model in-flight limits on completions, see ratelimit.py)
+            + LOG_* (Queued JSON/text logging: root and per-module levels, debug sampling, queue size)
+            + METRICS_TOKEN (Optional bearer token protecting /metrics)
         _ Google Map API Key
     """
     
-    SECRET_KEY = os.getenv('SECRET_KEY', 'theChosenOne')
+    DEFAULT_SECRET_KEY = 'theChosenOne'
+    SECRET_KEY = os.getenv('SECRET_KEY', DEFAULT_SECRET_KEY)
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///site.db') 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 16)) # At least ASGI_DB_THREADS, so no worker thread waits for a connection
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 8))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800)) # Seconds; Postgres only, with pool_pre_ping
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 15000)) # Postgres only; 0 disables
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+    WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", 256)) # Writes per transaction
+    WRITE_BEHIND_MAX_DELAY_MS = float(os.getenv("WRITE_BEHIND_MAX_DELAY_MS", 0)) # Extra wait for writes to join a batch; with 0 a batch is what queued up during the previous commit
+    WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", 10000))
+    WRITE_BEHIND_ACK_TIMEOUT = float(os.getenv("WRITE_BEHIND_ACK_TIMEOUT", 10)) # Seconds a request waits for its commit
+    WRITE_BEHIND_WAIT_FOR_TURNS = os.getenv("WRITE_BEHIND_WAIT_FOR_TURNS", "true").lower() == "true" # false: reply before the turn is committed
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024
+    MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", 100))
+    MAX_MESSAGE_PAGE_SIZE = 1000
+    CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", 100))
+    MAX_CHAT_PAGE_SIZE = 500
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 12000))
+    DOCUMENT_TOKEN_BUDGET = int(os.getenv("DOCUMENT_TOKEN_BUDGET", 16000))
+    CONTEXT_SUMMARY_MESSAGES = int(os.getenv("CONTEXT_SUMMARY_MESSAGES", 10))
+    CONTEXT_TOKENIZER_MODEL = os.getenv("CONTEXT_TOKENIZER_MODEL", "gpt-4o")
+    RETRIEVAL_CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", 200))
+    RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", 40))
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 6))
+    RETRIEVAL_INDEX_CACHE_CHATS = int(os.getenv("RETRIEVAL_INDEX_CACHE_CHATS", 16))
+    UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "upload_spool"))
+    PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", os.cpu_count() or 2))
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+    PDF_JOB_POLL_SECONDS = float(os.getenv("PDF_JOB_POLL_SECONDS", 5))
+    PDF_JOB_STALE_SECONDS = int(os.getenv("PDF_JOB_STALE_SECONDS", 600))
+    PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf_cache"))
+    PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", 10000))
+    TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", 30))
+    AUTH_TOKEN_MODE = os.getenv("AUTH_TOKEN_MODE", "opaque").lower()
+    JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY") # No fallback to SECRET_KEY, whose default is public
+    ACCESS_TOKEN_TTL_SECONDS = int(os.getenv("ACCESS_TOKEN_TTL_SECONDS", 15 * 60))
+    REFRESH_TOKEN_TTL_SECONDS = int(os.getenv("REFRESH_TOKEN_TTL_SECONDS", 30 * 24 * 3600))
+    REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", 5))
+    ASGI_DB_THREADS = int(os.getenv("ASGI_DB_THREADS", 16))
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") # None means the SDK default
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5))
+    OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", 120))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 500))
+    GOOGLE_MAPS_BASE_URL = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com")
+    GOOGLE_MAPS_CONNECT_TIMEOUT = float(os.getenv("GOOGLE_MAPS_CONNECT_TIMEOUT", 3))
+    GOOGLE_MAPS_READ_TIMEOUT = float(os.getenv("GOOGLE_MAPS_READ_TIMEOUT", 10))
+    GOOGLE_MAPS_MAX_CONNECTIONS = int(os.getenv("GOOGLE_MAPS_MAX_CONNECTIONS", 20))
+    UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", 3))
+    UPSTREAM_BACKOFF_BASE_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_BASE_SECONDS", 0.5))
+    UPSTREAM_BACKOFF_MAX_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_MAX_SECONDS", 8))
+    CIRCUIT_BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", 5))
+    CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", 30))
+    PLACES_CACHE_TTL_SECONDS = int(os.getenv("PLACES_CACHE_TTL_SECONDS", 15 * 60))
+    PLACES_CACHE_MAX_ENTRIES = int(os.getenv("PLACES_CACHE_MAX_ENTRIES", 5000))
+    PLACES_CACHE_DB = os.getenv("PLACES_CACHE_DB") # e.g. places_cache.db; memory only when unset
+    PLACES_CACHE_CELL_FRACTION = float(os.getenv("PLACES_CACHE_CELL_FRACTION", 0.25))
+    PLACE_INDEX_CELL_DEGREES = float(os.getenv("PLACE_INDEX_CELL_DEGREES", 0.005))
+    PLACE_INDEX_MIN_RESULTS = int(os.getenv("PLACE_INDEX_MIN_RESULTS", 3))
+    PLACE_INDEX_MAX_AGE_SECONDS = int(os.getenv("PLACE_INDEX_MAX_AGE_SECONDS", 7 * 24 * 3600))
+    PLACE_INDEX_REFRESH_SECONDS = float(os.getenv("PLACE_INDEX_REFRESH_SECONDS", 60))
+    INTENTS_CONFIG = os.getenv("INTENTS_CONFIG")
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "response_cache.db"))
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 24 * 3600))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    RESPONSE_CACHE_HISTORY_MESSAGES = int(os.getenv("RESPONSE_CACHE_HISTORY_MESSAGES", 4))
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower() # 'memory' or 'sqlite' (shared by the workers of a host)
+    RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rate_limits.db"))
+    RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", 20)) # 0 disables the token bucket
+    RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 5))
+    RATE_LIMIT_USER_CONCURRENCY = int(os.getenv("RATE_LIMIT_USER_CONCURRENCY", 2)) # 0 disables
+    RATE_LIMIT_MODEL_CONCURRENCY = int(os.getenv("RATE_LIMIT_MODEL_CONCURRENCY", 64)) # 0 disables
+    RATE_LIMIT_MODEL_LIMITS = os.getenv("RATE_LIMIT_MODEL_LIMITS") # JSON overrides, e.g. {"gpt-4o": 32}
+    RATE_LIMIT_LEASE_SECONDS = float(os.getenv("RATE_LIMIT_LEASE_SECONDS", 300))
+    RATE_LIMIT_BUSY_RETRY_SECONDS = float(os.getenv("RATE_LIMIT_BUSY_RETRY_SECONDS", 2))
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING,werkzeug=WARNING") # Per-module overrides
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower() # 'json' or 'text'
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.1)) # Share of DEBUG records kept per call site
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN") # /metrics is open when unset
 
 
     open_ai_key=os.getenv("OPENAI_API_KEY")
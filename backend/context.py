@@ -0,0 +1,159 @@
+import logging
+import re
+from functools import lru_cache
+from config import AppConfig
+from logs import fields
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _Counting tokens locally (tiktoken when installed, a regex approximation otherwise)
+        _Assembling the OpenAI message list for a chat turn within a token budget
+"""
+
+APPROX_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+APPROX_CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4 # Role/separator tokens the chat format adds per message
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    try:
+        import tiktoken # Optional, and deferred to the first count: loading it is slow
+    except ImportError: # Fall back to an approximate local count
+        return None
+    try:
+        return tiktoken.encoding_for_model(AppConfig.CONTEXT_TOKENIZER_MODEL)
+    except Exception as e:
+        logger.warning("tiktoken encoding unavailable, using approximate token counts", extra=fields(error=e))
+        return None
+
+
+"""explain: Counts the tokens in a piece of text. Results are cached, so replayed history messages are only tokenized once."""
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(APPROX_TOKEN_PATTERN.findall(text))
+
+
+"""explain: Cuts text down to at most `budget` tokens, keeping the beginning."""
+def truncate_to_tokens(text, budget):
+    if budget <= 0 or not text:
+        return ""
+    if count_tokens(text) <= budget:
+        return text
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:budget])
+    # Approximate: shrink by characters until the count fits
+    cut = budget * APPROX_CHARS_PER_TOKEN
+    while cut > 0 and len(APPROX_TOKEN_PATTERN.findall(text[:cut])) > budget:
+        cut = int(cut * 0.9)
+    return text[:cut]
+
+
+class ContextBuilder():
+    """
+    Used for :
+        _Keeping the most recent turns that fit in history_budget
+        _Replacing older turns with a short extractive summary of what the user asked
+        _Capping document context at document_budget
+    """
+    SUMMARY_QUESTION_CHARS = 120
+
+    def __init__(self, history_budget=None, document_budget=None, summary_messages=None):
+        self.history_budget = AppConfig.CONTEXT_TOKEN_BUDGET if history_budget is None else history_budget
+        self.document_budget = AppConfig.DOCUMENT_TOKEN_BUDGET if document_budget is None else document_budget
+        self.summary_messages = AppConfig.CONTEXT_SUMMARY_MESSAGES if summary_messages is None else summary_messages
+
+    """explain: Returns the document text capped to the document budget, plus its token count."""
+    def build_documents(self, document_text):
+        documents = truncate_to_tokens(document_text or "", self.document_budget)
+        if documents != (document_text or ""):
+            documents += "\n\n[Document context truncated to fit the context window]"
+        return documents, count_tokens(documents)
+
+    """
+    explain: Builds the OpenAI message list. `history` is an iterable of {"role", "content"} dicts ordered NEWEST FIRST,
+    so callers can stream rows from the database and stop reading once the budget is spent.
+    `system_message` must stay identical across turns (it is the prompt prefix the API can cache); per-turn
+    instructions go in `suffix`, sent as a system message right before the user message.
+    Returns (api_messages, stats) where stats holds the selected token counts.
+    """
+    def build(self, system_message, history, user_message, suffix=None):
+        user_tokens = count_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+        remaining = self.history_budget - user_tokens
+
+        kept = []
+        omitted = 0
+        history_tokens = 0
+        summary_questions = []
+        history_iter = iter(history)
+        for msg in history_iter:
+            msg_tokens = count_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS
+            if msg_tokens > remaining:
+                omitted += 1
+                self._collect_question(msg, summary_questions)
+                break
+            kept.append({"role": msg["role"], "content": msg["content"]})
+            remaining -= msg_tokens
+            history_tokens += msg_tokens
+        # Read a bounded number of older messages for the summary, never the whole history
+        for msg in history_iter:
+            omitted += 1
+            if len(summary_questions) >= self.summary_messages:
+                break
+            self._collect_question(msg, summary_questions)
+
+        # Do not start the replayed history with an orphaned assistant reply
+        if kept and kept[-1]["role"] == "assistant" and omitted:
+            dropped = kept.pop()
+            history_tokens -= count_tokens(dropped["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+        api_messages = [{"role": "system", "content": system_message}]
+        prefix_tokens = count_tokens(system_message) + MESSAGE_OVERHEAD_TOKENS
+        system_tokens = prefix_tokens
+        summary_tokens = 0
+        if omitted:
+            # Its own message, so the summary changing does not invalidate the cached prefix
+            summary = self._summarize(summary_questions)
+            api_messages.append({"role": "system", "content": summary})
+            summary_tokens = count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+            system_tokens += summary_tokens
+        api_messages.extend(reversed(kept))
+        if suffix:
+            api_messages.append({"role": "system", "content": suffix})
+            system_tokens += count_tokens(suffix) + MESSAGE_OVERHEAD_TOKENS
+        api_messages.append({"role": "user", "content": user_message})
+
+        stats = {
+            "prefix_tokens": prefix_tokens,
+            "system_tokens": system_tokens,
+            "summary_tokens": summary_tokens,
+            "history_tokens": history_tokens,
+            "history_messages": len(kept),
+            "omitted_messages": omitted,
+            "user_tokens": user_tokens,
+            "total_tokens": system_tokens + history_tokens + user_tokens,
+        }
+        return api_messages, stats
+
+    def _collect_question(self, msg, summary_questions):
+        if msg["role"] == "user" and len(summary_questions) < self.summary_messages:
+            question = " ".join(msg["content"].split())
+            if len(question) > self.SUMMARY_QUESTION_CHARS:
+                question = question[:self.SUMMARY_QUESTION_CHARS - 3] + "..."
+            summary_questions.append(question)
+
+    def _summarize(self, summary_questions):
+        summary = "EARLIER CONVERSATION: Older messages were omitted to fit the context window."
+        if summary_questions:
+            # Questions were collected newest first; present them chronologically
+            summary += " Before the messages below, the user asked about:\n"
+            summary += "\n".join(f"- {q}" for q in reversed(summary_questions))
+        return summary
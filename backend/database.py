@@ -0,0 +1,87 @@
+import logging
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from config import AppConfig
+from logs import fields
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _Engine options per database backend, applied before db.init_app():
+            + SQLite: a connection pool sized for the request / ASGI threads, and on every new connection
+              journal_mode=WAL (readers do not block the writer), synchronous=NORMAL (no fsync per commit in WAL mode,
+              still safe against corruption), busy_timeout (wait for the write lock instead of "database is locked")
+              and mmap_size
+            + Postgres (DATABASE_URL=postgresql://...): pool_size / max_overflow / pool_timeout, pool_pre_ping and
+              pool_recycle against dropped server connections, and a server-side statement_timeout
+        _DB_* / SQLITE_* settings in AppConfig
+"""
+
+
+def normalize_uri(uri):
+    # Hosting providers hand out postgres://, which SQLAlchemy 1.4+ no longer accepts
+    if uri.startswith("postgres://"):
+        return "postgresql://" + uri[len("postgres://"):]
+    return uri
+
+
+def is_memory_sqlite(url):
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+"""explain: SQLALCHEMY_ENGINE_OPTIONS for a database URI."""
+def engine_options(uri):
+    url = make_url(uri)
+    if is_memory_sqlite(url):
+        return {} # One shared connection per thread, pool options do not apply
+    options = {
+        "pool_size": AppConfig.DB_POOL_SIZE,
+        "max_overflow": AppConfig.DB_MAX_OVERFLOW,
+        "pool_timeout": AppConfig.DB_POOL_TIMEOUT,
+    }
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        options["connect_args"] = {"timeout": AppConfig.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    else:
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = AppConfig.DB_POOL_RECYCLE
+        if backend == "postgresql" and AppConfig.DB_STATEMENT_TIMEOUT_MS > 0:
+            # Understood by psycopg2 and psycopg 3
+            options["connect_args"] = {"options": f"-c statement_timeout={AppConfig.DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={AppConfig.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={AppConfig.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={AppConfig.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={AppConfig.SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+
+"""explain: Sets the engine options in app.config; call before db.init_app(app)."""
+def configure(app):
+    uri = normalize_uri(app.config["SQLALCHEMY_DATABASE_URI"])
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    options = engine_options(uri)
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+
+"""explain: Installs the per-connection SQLite pragmas on the app's engine and drops inherited connections in forked workers; call after db.init_app(app)."""
+def init_app(app, db):
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    # A forked worker opens its own connections instead of sharing the parent's (preloading WSGI servers)
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+    logger.info("Database engine ready", extra=fields(
+        backend=engine.dialect.name, pool=type(engine.pool).__name__,
+        pool_size=app.config["SQLALCHEMY_ENGINE_OPTIONS"].get("pool_size")
+    ))
@@ -0,0 +1,81 @@
+import hashlib
+import os
+from typing import List
+import msgspec
+
+"""
+    Used for :
+        _PDF text extraction functions run inside the extraction process pool.
+         Kept free of Flask/DB imports so pool workers start quickly.
+        _An on-disk cache of extracted page text keyed by the SHA-256 of the PDF bytes
+"""
+
+def count_pages(path):
+    from PyPDF2 import PdfReader # Imported in the pool workers only
+    return len(PdfReader(path).pages)
+
+"""explain: Extracts the text of pages [start, stop) of the PDF at `path`. Missing text comes back as an empty string."""
+def extract_pages(path, start, stop):
+    from PyPDF2 import PdfReader
+    reader = PdfReader(path)
+    return [reader.pages[index].extract_text() or "" for index in range(start, stop)]
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache():
+    """
+    Used for :
+        _Skipping extraction when the same PDF is uploaded again (to any chat)
+        _One JSON file of page texts per document; file mtime is the LRU clock,
+         and the least recently used entries are evicted once the directory exceeds max_bytes
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.json")
+
+    """explain: Returns the cached page texts for a document digest, or None."""
+    def get(self, digest):
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                pages = msgspec.json.decode(f.read(), type=List[str])
+            os.utime(path, None) # Mark as recently used
+            return pages
+        except (OSError, msgspec.DecodeError):
+            return None
+
+    def put(self, digest, pages):
+        if self.max_bytes <= 0:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(digest)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(msgspec.json.encode(pages))
+        os.replace(tmp_path, path) # Atomic, so readers never see a partial entry
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass # Evicted concurrently by another process
+            total_bytes -= size
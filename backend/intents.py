@@ -0,0 +1,173 @@
+import json
+import logging
+import string
+from config import AppConfig
+from logs import fields
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _Detecting what a chat message asks for (e.g. restaurant search) and pulling out keywords (e.g. cuisines)
+         in one pass over the message, with whole-word matching ("eat" no longer matches "great", nor "pho" "phone")
+         that still accepts plurals ("burgers", "pizzas", "bakeries")
+        _Keyword sets and intents come from DEFAULT_KEYWORD_SETS / DEFAULT_INTENTS, extended or overridden by the
+         JSON file at INTENTS_CONFIG: {"keyword_sets": {name: [phrases]}, "intents": {name: {"requires": [set names]}}}
+"""
+
+DEFAULT_KEYWORD_SETS = {
+    "food": [
+        'restaurant', 'restaurants', 'eat', 'eating', 'food', 'dinner', 'lunch', 'meal', 'meals',
+        'cuisine', 'dining'
+    ],
+    "find": [
+        'near me', 'find', 'where', 'suggest', 'recommend', 'looking for', 'want to eat', 'nearby', 'around here'
+    ],
+    "cuisine": [
+        'italian', 'chinese', 'japanese', 'mexican', 'indian', 'american', 'french',
+        'mediterranean', 'middle eastern', 'vietnamese', 'pho', 'thai', 'greek', 'spanish',
+        'german', 'russian', 'african', 'caribbean', 'south american', 'korean', 'bbq',
+        'pizza', 'burger', 'sandwiches', 'sushi', 'ramen', 'tapas', 'steak', 'seafood',
+        'vegetarian', 'vegan', 'gluten-free', 'bakery', 'cafe', 'coffee', 'dessert', 'brunch'
+    ],
+}
+
+# An intent matches when every keyword set it requires has at least one match
+DEFAULT_INTENTS = {
+    "restaurant": {"requires": ["food", "find"]},
+}
+
+
+# Punctuation (hyphens included, so "gluten-free" is two words) separates words like whitespace does.
+# Messages are split as UTF-8 bytes: bytes.translate and bytes.split are several times cheaper than their str
+# counterparts, and only messages with non-ASCII text pay for the str table
+ASCII_PUNCTUATION = bytes.maketrans(string.punctuation.encode(), b" " * len(string.punctuation))
+UNICODE_PUNCTUATION = str.maketrans({c: " " for c in "\u2018\u2019\u201c\u201d\u2013\u2014\u2026"})
+
+
+"""explain: Lowercased words of a text as UTF-8 bytes."""
+def split_words(text):
+    text = text.lower()
+    if not text.isascii():
+        text = text.translate(UNICODE_PUNCTUATION)
+    return text.encode().translate(ASCII_PUNCTUATION).split()
+
+
+"""explain: Plural forms of a word, and the singular forms of a plural one (burger -> burgers, bakery -> bakeries, sandwiches -> sandwich)."""
+def inflections(word):
+    forms = []
+    if word.endswith(("ss", "x", "z", "ch", "sh")):
+        forms.append(word + "es")
+    elif word.endswith("y") and word[-2:-1] not in "aeiou":
+        forms.append(word[:-1] + "ies")
+    elif not word.endswith("s"):
+        forms.append(word + "s")
+        if word.endswith("o"):
+            forms.append(word + "es")
+    if word.endswith("ies"):
+        forms.append(word[:-3] + "y")
+    elif word.endswith(("sses", "xes", "zes", "ches", "shes")):
+        forms.append(word[:-2])
+    elif word.endswith("s") and not word.endswith("ss"):
+        forms.append(word[:-1])
+    return forms
+
+
+class MessageIntents():
+    """
+    Used for :
+        _The result of IntentRouter.analyze: matched intents (in configuration order) and keywords per set
+    """
+    def __init__(self, intents, keywords):
+        self.intents = intents
+        self.keywords = keywords
+
+    def has(self, intent):
+        return intent in self.intents
+
+    def get(self, keyword_set):
+        return self.keywords.get(keyword_set, [])
+
+
+class IntentRouter():
+    """
+    Used for :
+        _All keyword sets compiled once into a table keyed by the accepted forms of each phrase's first word
+         (the word itself and its inflections). A message is split into words once; a set intersection finds
+         the words that start some phrase, and only their phrases are searched for in the re-joined words.
+         Every phrase is reported, so overlapping phrases ("want to eat" and "eat") both count
+    """
+    def __init__(self, keyword_sets, intents):
+        self.intents = intents
+        phrases = {} # phrase words (tuple) -> (phrase text, set of keyword set names)
+        for name, keywords in keyword_sets.items():
+            for phrase in keywords:
+                words = tuple(split_words(phrase))
+                if words:
+                    phrases.setdefault(words, (phrase.lower().strip(), set()))[1].add(name)
+
+        vocabulary = {word for words in phrases for word in words}
+        owners = {word: word for word in vocabulary} # word form -> phrase word; exact words win
+        for word in sorted(vocabulary):
+            for form in inflections(word.decode()):
+                owners.setdefault(form.encode(), word)
+        spellings = {} # phrase word -> its accepted forms
+        for form, word in owners.items():
+            spellings.setdefault(word, []).append(form)
+
+        # first word form -> [(b" words of the phrase ", phrase text, keyword set names)]; a single word may be
+        # inflected ("pizzas"), and so may the last word of a longer phrase ("south americans")
+        self.entries = {}
+        for words, (text, names) in phrases.items():
+            names = tuple(sorted(names))
+            lasts = spellings[words[-1]] if len(words) > 1 else [None]
+            for first in spellings[words[0]] if len(words) == 1 else [words[0]]:
+                for last in lasts:
+                    spelled = (first,) + words[1:-1] + (last,) if last else (first,)
+                    self.entries.setdefault(first, []).append((b" %s " % b" ".join(spelled), text, names))
+        self.first_forms = frozenset(self.entries)
+
+    @classmethod
+    def from_config(cls, path=None):
+        keyword_sets = dict(DEFAULT_KEYWORD_SETS)
+        intents = dict(DEFAULT_INTENTS)
+        if path:
+            try:
+                with open(path) as f:
+                    config = json.load(f)
+                keyword_sets.update(config.get("keyword_sets", {}))
+                intents.update(config.get("intents", {}))
+            except (OSError, ValueError) as e:
+                logger.error("Error loading intents config, using defaults", extra=fields(path=path, error=e))
+        return cls(keyword_sets, intents)
+
+    """explain: Returns the matched keywords per keyword set, in message order and without duplicates. Keywords are reported as configured, whatever form the message used."""
+    def match(self, message):
+        keywords = {}
+        words = split_words(message)
+        hits = self.first_forms.intersection(words)
+        if not hits:
+            return keywords # The common case: no phrase starts with any word of the message
+        joined = b" %s " % b" ".join(words)
+        found = [ # (offset in joined, phrase text, keyword set names)
+            (offset, text, names) for form in hits for spelled, text, names in self.entries[form]
+            if (offset := joined.find(spelled)) >= 0
+        ]
+        found.sort()
+        for _, text, names in found:
+            for name in names:
+                matched = keywords.setdefault(name, [])
+                if text not in matched:
+                    matched.append(text)
+        return keywords
+
+    def analyze(self, message):
+        keywords = self.match(message)
+        intents = [
+            name for name, rule in self.intents.items()
+            if rule.get("requires") and all(keywords.get(required) for required in rule["requires"])
+        ]
+        return MessageIntents(intents, keywords)
+
+
+intent_router = IntentRouter.from_config(AppConfig.INTENTS_CONFIG)
@@ -0,0 +1,201 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+from config import AppConfig
+from extraction import ExtractionCache, count_pages, extract_pages, file_sha256
+from models import Chat, Document, UploadJobFile
+from retrieval import build_chunks
+from metrics import pdf_page_seconds, pdf_pages_total
+from logs import fields, request_id_var
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _SQLite-backed queue of uploaded PDFs waiting for text extraction (upload_job / upload_job_file tables)
+        _A background thread per process, started by the first request it serves, that claims queued files and
+         extracts them (page count included) on a process pool, reusing cached page text when the same PDF bytes
+         were extracted before
+"""
+
+
+def spool_path(job_file_id):
+    return os.path.join(AppConfig.UPLOAD_SPOOL_DIR, f"{job_file_id}.pdf")
+
+
+class ExtractionQueue():
+    def __init__(self):
+        self.app = None
+        self.thread = None
+        self.executor = None
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+
+    """explain: Registers the worker with the app. The first request each process serves starts it (uploads and status polls included), so files queued before a restart, or claimed by a worker that died, are picked up without a new upload."""
+    def init_app(self, app):
+        self.app = app
+        app.before_request(self.ensure_running)
+
+    def ensure_running(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.start(self.app)
+
+    """explain: Starts the worker thread on first use and wakes it up to look for queued files."""
+    def start(self, app):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.app = app
+                self.thread = threading.Thread(target=self._run, name="pdf-extraction", daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def get_executor(self):
+        if self.executor is None:
+            # spawn: forking a process that runs threads and holds DB connections is unsafe
+            self.executor = ProcessPoolExecutor(
+                max_workers=AppConfig.PDF_EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    def _run(self):
+        while True:
+            claimed = False
+            with self.app.app_context():
+                try:
+                    job_file = self._claim_next()
+                    if job_file is not None:
+                        claimed = True
+                        request_id_var.set(f"upload-{job_file.job_id}") # Log lines of this file carry its job id
+                        self._process(job_file)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("PDF extraction worker error")
+                finally:
+                    request_id_var.set("-")
+                    db.session.remove()
+            if not claimed:
+                self.wakeup.wait(AppConfig.PDF_JOB_POLL_SECONDS)
+                self.wakeup.clear()
+
+    """explain: Claims the oldest queued file (or one whose worker stopped reporting progress). The conditional UPDATE makes the claim safe across processes."""
+    def _claim_next(self):
+        stale_before = datetime.utcnow() - timedelta(seconds=AppConfig.PDF_JOB_STALE_SECONDS)
+        candidate = UploadJobFile.query.filter(
+            db.or_(
+                UploadJobFile.status == 'queued',
+                db.and_(UploadJobFile.status == 'processing', UploadJobFile.updated_at < stale_before)
+            )
+        ).order_by(UploadJobFile.id).first()
+        if candidate is None:
+            return None
+
+        claimed = UploadJobFile.query.filter_by(
+            id=candidate.id, status=candidate.status, updated_at=candidate.updated_at
+        ).update({"status": "processing", "updated_at": datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return None # Another worker got there first
+        return db.session.get(UploadJobFile, candidate.id)
+
+    def _process(self, job_file):
+        path = spool_path(job_file.id)
+        try:
+            digest = file_sha256(path)
+            pages = extraction_cache.get(digest)
+            if pages is not None:
+                job_file.pages_total = job_file.pages_done = len(pages)
+                pdf_pages_total.inc(len(pages), source="cache")
+            else:
+                started = time.perf_counter()
+                pages = self._extract(job_file, path)
+                elapsed = time.perf_counter() - started
+                if pages:
+                    pdf_page_seconds.observe(elapsed / len(pages))
+                    pdf_pages_total.inc(len(pages), source="extracted")
+                logger.info("PDF extracted", extra=fields(
+                    filename=job_file.filename, pages=len(pages), seconds=round(elapsed, 3)
+                ))
+                extraction_cache.put(digest, pages)
+
+            extracted_text = "".join(page_text + "\n\n" for page_text in pages if page_text)
+            document = Document(
+                chat_id=job_file.chat_id,
+                filename=job_file.filename,
+                sha256=digest,
+                page_count=len(pages),
+                byte_size=os.path.getsize(path),
+                text=extracted_text
+            )
+            self._complete(job_file, document)
+        except Exception as e:
+            db.session.rollback()
+            if isinstance(e, BrokenProcessPool):
+                self.executor = None # A pool worker died; start a fresh pool for the next file
+            logger.exception("Error processing PDF", extra=fields(filename=job_file.filename))
+            self._fail(job_file, f"Error processing PDF '{job_file.filename}': {str(e)}")
+
+        if job_file.status in ('done', 'failed') and os.path.exists(path):
+            os.remove(path)
+
+    """explain: Fans the PDF's pages out over the process pool in PDF_PAGES_PER_TASK batches, recording progress as batches finish."""
+    def _extract(self, job_file, path):
+        executor = self.get_executor()
+        page_total = executor.submit(count_pages, path).result() # Keeps PDF parsing out of this process
+        job_file.pages_total = page_total
+        job_file.pages_done = 0
+        db.session.commit()
+
+        pages_per_task = max(1, AppConfig.PDF_PAGES_PER_TASK)
+        futures = {
+            executor.submit(extract_pages, path, start, min(start + pages_per_task, page_total)): start
+            for start in range(0, page_total, pages_per_task)
+        }
+        pages = [""] * page_total
+        for future in as_completed(futures):
+            start = futures[future]
+            page_texts = future.result()
+            pages[start:start + len(page_texts)] = page_texts
+            job_file.pages_done += len(page_texts)
+            job_file.updated_at = datetime.utcnow() # Doubles as the heartbeat for stale claims
+            db.session.commit()
+        return pages
+
+    """explain: Adds the document and its chunks to the chat and marks the file done in a single transaction."""
+    def _complete(self, job_file, document):
+        if not document.text:
+            return self._fail(job_file, f"Could not extract text from '{job_file.filename}'.")
+        if not db.session.get(Chat, job_file.chat_id):
+            return self._fail(job_file, "Chat no longer exists.")
+
+        db.session.add(document)
+        db.session.add_all(build_chunks(document.chat_id, document.filename, document.text))
+        Chat.bump_documents_version(document.chat_id)
+        job_file.status = 'done'
+        job_file.updated_at = datetime.utcnow()
+        try:
+            db.session.commit()
+        except IntegrityError: # Unique (chat_id, filename): the same name was added meanwhile
+            db.session.rollback()
+            self._fail(job_file, f"'{job_file.filename}' is already uploaded to this chat.")
+
+    def _fail(self, job_file, error):
+        job_file.status = 'failed'
+        job_file.error = error
+        job_file.updated_at = datetime.utcnow()
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("DB error marking PDF job file failed", extra=fields(job_file_id=job_file.id))
+
+
+extraction_cache = ExtractionCache(AppConfig.PDF_CACHE_DIR, AppConfig.PDF_CACHE_MAX_BYTES)
+extraction_queue = ExtractionQueue()
@@ -1,5 +1 @@
-from main import app
 from location.routes import location_bp
-
-
-app.register_blueprint(location_bp)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from flask import request,jsonify,Blueprint
+from app import db
 from middleware import *
 from utils import LocationHandle
 
@@ -12,7 +13,7 @@ def update_user_location():
     if not data:
         return jsonify({"error": "Request must be JSON"}), 400
     user = request.user
-    location_handle = LocationHandle(data,user)
+    location_handle = LocationHandle(data,user,db)
     latitude,longitude = location_handle.getLocation()
 
     # Set to None if null was explicitly passed, otherwise keep the value
@@ -0,0 +1,247 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import g, request
+from config import AppConfig
+
+"""
+    Used for :
+        _Structured logging in place of print(): one JSON object per line (LOG_FORMAT=json, the default) or
+         "time level logger [request id] message key=value ..." (LOG_FORMAT=text)
+        _Log calls only enqueue the record (QueueHandler); a QueueListener thread formats and writes them, so
+         request threads never wait on stderr. When LOG_QUEUE_SIZE records are pending, new ones are dropped and counted
+        _Per-module levels from LOG_LEVELS ("turns=DEBUG,httpx=WARNING"); DEBUG records are sampled (LOG_DEBUG_SAMPLE_RATE)
+        _A request id per HTTP request (the client's X-Request-ID or a new one), attached to every log line written
+         while the request is served and echoed back in the X-Request-ID response header
+        _Extra fields are passed as extra=fields(chat_id=..., ...)
+"""
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+
+def fields(**kwargs):
+    return {"fields": kwargs}
+
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Used for :
+        _Keeping one in every `every` records at or below `max_level` per call site (logger and message template),
+         always the first one; kept records carry the sampling factor as "sampled"
+    """
+    def __init__(self, rate, max_level=logging.DEBUG):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self.max_level = max_level
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level or self.every == 1:
+            return True
+        if not self.every:
+            return False
+        key = (record.name, record.msg)
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if getattr(record, "sampled", None):
+            entry["sampled"] = record.sampled
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class KeyValueFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        record.message = record.getMessage()
+        record.asctime = self.formatTime(record) # Formatter.format() sets it; formatMessage() alone does not
+        if not hasattr(record, "request_id"):
+            record.request_id = "-"
+        line = self.formatMessage(record)
+        extra = dict(getattr(record, "fields", None) or {})
+        if getattr(record, "sampled", None):
+            extra["sampled"] = record.sampled
+        if extra:
+            line += " " + " ".join(f"{key}={self._value(value)}" for key, value in extra.items())
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+    def _value(self, value):
+        text = str(value)
+        return f'"{text}"' if not text or " " in text or "=" in text else text
+
+
+class BufferedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Used for :
+        _Enqueuing records without formatting them: only the message, the traceback text and the request id are
+         resolved in the calling thread (they depend on its state), the JSON/text rendering happens on the listener
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1 # Never block a request on logging
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel) # Waits for room in a full queue instead of raising
+
+
+listener = None
+queue_handler = None
+
+
+def parse_levels(spec):
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _start_listener():
+    global listener
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(KeyValueFormatter() if AppConfig.LOG_FORMAT == "text" else JsonFormatter())
+    listener = DrainingQueueListener(queue_handler.queue, output, respect_handler_level=False)
+    listener.start()
+
+
+def _stop_listener():
+    global listener
+    if listener is not None:
+        listener.stop() # Drains the queue before returning
+        listener = None
+
+
+"""explain: Installs the queue handler on the root logger once per process and starts its listener thread; levels come from LOG_LEVEL and LOG_LEVELS."""
+def configure_logging():
+    global queue_handler
+    if queue_handler is not None:
+        return
+    # Skip the LogRecord attributes no formatter here prints (the "Optimization" list of the logging docs)
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.logAsyncioTasks = False
+    queue_handler = BufferedQueueHandler(queue.Queue(AppConfig.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter(AppConfig.LOG_DEBUG_SAMPLE_RATE))
+    queue_handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(AppConfig.LOG_LEVEL)
+    for name, level in parse_levels(AppConfig.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+    _start_listener()
+    atexit.register(_stop_listener)
+    # The listener thread does not survive fork(); a forked worker starts its own on a fresh queue
+    os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def _restart_in_child():
+    queue_handler.queue = queue.Queue(AppConfig.LOG_QUEUE_SIZE)
+    queue_handler.dropped = 0
+    _start_listener()
+
+
+def stats():
+    return {
+        "queued": queue_handler.queue.qsize() if queue_handler else 0,
+        "dropped": queue_handler.dropped if queue_handler else 0,
+    }
+
+
+"""explain: Request hooks: picks up or creates the request id, and logs one line per finished request with its duration and the stage timings collected in g.timings."""
+def init_app(app):
+    configure_logging()
+    logger = logging.getLogger("http")
+
+    @app.before_request
+    def start_request():
+        g.request_started = time.perf_counter()
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or new_request_id()
+        g.request_id_token = request_id_var.set(g.request_id)
+
+    @app.after_request
+    def finish_request(response):
+        request_id = g.get("request_id")
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        started = g.get("request_started")
+        if started is not None:
+            logger.info("Request finished", extra=fields(
+                method=request.method, path=request.path, status=response.status_code,
+                duration_ms=round((time.perf_counter() - started) * 1000, 1), **g.get("timings", {})
+            ))
+        return response
+
+    @app.teardown_request
+    def end_request(error=None):
+        token = g.pop("request_id_token", None)
+        if token is not None:
+            try:
+                request_id_var.reset(token)
+            except ValueError:
+                request_id_var.set("-") # Torn down in another context than the one it was set in
@@ -0,0 +1,259 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import Blueprint, Response, g, request, jsonify
+from config import AppConfig
+import logs
+from logs import fields
+
+"""
+    Used for :
+        _Counters and histograms for the app (chat turn stages, tokens, PDF extraction, HTTP requests),
+         exposed with the component stats (upstreams, caches, rate limiter) at GET /metrics in Prometheus text format
+        _Values are per process: with several workers, scrape each one or aggregate in Prometheus
+        _Set METRICS_TOKEN to require "Authorization: Bearer <METRICS_TOKEN>" on /metrics
+"""
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+logger = logging.getLogger(__name__)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter():
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {} # label values -> count
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram():
+    def __init__(self, name, help_text, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {} # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + ('+Inf',))} {series[-1]}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {round(series[-2], 6)}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry():
+    """
+    Used for :
+        _The metrics owned by this module plus collectors: callables returning
+         [(name, type, help, [(labels dict, value) or (name suffix, labels dict, value), ...]), ...]
+         built from other components' stats() at scrape time
+    """
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=STAGE_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                logger.warning("Metrics collector failed", extra=fields(collector=collect.__name__, error=e))
+                continue
+            for name, metric_type, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for sample in samples:
+                    suffix, labels, value = sample if len(sample) == 3 else ("", *sample)
+                    lines.append(f"{name}{suffix}{format_labels(tuple(labels), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "merlin_stage_seconds", "Time spent in each stage of a request (auth, history, prompt, places, openai, openai_first_token, db_commit)", ("stage",)
+)
+tokens_total = registry.counter(
+    "merlin_tokens_total", "Tokens reported by completion usage, by kind (prompt, cached, completion)", ("model", "kind")
+)
+pdf_page_seconds = registry.histogram(
+    "merlin_pdf_extraction_seconds_per_page", "PDF text extraction time per page, averaged over each file", buckets=PAGE_BUCKETS
+)
+pdf_pages_total = registry.counter("merlin_pdf_pages_total", "PDF pages processed, by source (extracted, cache)", ("source",))
+http_requests_total = registry.counter("merlin_http_requests_total", "HTTP requests served", ("method", "endpoint", "status"))
+http_request_seconds = registry.histogram(
+    "merlin_http_request_seconds", "Time to response headers per endpoint", ("method", "endpoint")
+)
+
+
+"""explain: Times a block into merlin_stage_seconds; with `timings` (a dict) the duration is also added to it as <stage>_ms, for per-request log lines."""
+@contextmanager
+def timed(stage, timings=None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, timings)
+
+
+def record_stage(stage, seconds, timings=None):
+    stage_seconds.observe(seconds, stage=stage)
+    if timings is not None:
+        timings[f"{stage}_ms"] = round(timings.get(f"{stage}_ms", 0) + seconds * 1000, 2)
+
+
+def record_token_usage(model, usage):
+    for kind in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+        if usage.get(kind):
+            tokens_total.inc(usage[kind], model=model, kind=kind[:-len("_tokens")])
+
+
+@registry.collector
+def upstream_metrics():
+    from service import clients
+    stats = clients.metrics()
+    families = []
+    for field, metric_type, help_text in (
+        ("requests", "counter", "Outbound requests per upstream"),
+        ("retries", "counter", "Retried attempts per upstream"),
+        ("failures", "counter", "Failed outbound requests per upstream"),
+        ("rejected", "counter", "Requests rejected by an open circuit breaker"),
+        ("circuit_opened", "counter", "Times the circuit breaker opened"),
+    ):
+        families.append((f"merlin_upstream_{field}_total", metric_type, help_text,
+                         [({"upstream": name}, upstream[field]) for name, upstream in stats.items()]))
+    latency = []
+    for name, upstream in stats.items():
+        cumulative = 0
+        for bound, count in upstream["latency_buckets"].items():
+            cumulative += count
+            latency.append(("_bucket", {"upstream": name, "le": bound}, cumulative))
+        latency.append(("_bucket", {"upstream": name, "le": "+Inf"}, upstream["requests"]))
+        latency.append(("_sum", {"upstream": name}, upstream["latency_sum"]))
+        latency.append(("_count", {"upstream": name}, upstream["requests"]))
+    families.append(("merlin_upstream_latency_seconds", "histogram", "Outbound request latency, all attempts included", latency))
+    families.append(("merlin_upstream_circuit_open", "gauge", "1 while the circuit breaker is not closed",
+                     [({"upstream": name}, int(upstream["circuit"] != "closed")) for name, upstream in stats.items()]))
+    return families
+
+
+@registry.collector
+def component_metrics():
+    from middleware import token_cache
+    from places import places_cache, place_index
+    from ratelimit import completion_limiter
+    from response_cache import response_cache
+    from writer import group_commit
+    families = []
+    for component, stats in (
+        ("token_cache", token_cache.stats()),
+        ("places_cache", places_cache.stats()),
+        ("place_index", place_index.stats()),
+        ("response_cache", response_cache.stats()),
+        ("write_behind", group_commit.stats()),
+    ):
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            families.append((f"merlin_{component}_{key}", "gauge", f"{component} {key.replace('_', ' ')}", [({}, value)]))
+    logging_stats = logs.stats()
+    families.append(("merlin_log_records_dropped_total", "counter", "Log records dropped because the log queue was full", [({}, logging_stats["dropped"])]))
+    families.append(("merlin_log_queue_size", "gauge", "Log records waiting to be written", [({}, logging_stats["queued"])]))
+    limiter = completion_limiter.stats()
+    families.append(("merlin_rate_limit_admitted_total", "counter", "Completions admitted by the rate limiter", [({}, limiter["admitted"])]))
+    families.append(("merlin_rate_limit_rejected_total", "counter", "Completions rejected with 429, by reason",
+                     [({"reason": "rate"}, limiter["rejected_rate"]), ({"reason": "concurrency"}, limiter["rejected_concurrency"])]))
+    families.append(("merlin_completions_in_flight", "gauge", "Completions holding a rate limiter slot, by model",
+                     [({"model": model}, count) for model, count in limiter["in_flight_by_model"].items()]))
+    return families
+
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if AppConfig.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {AppConfig.METRICS_TOKEN}":
+        return jsonify({"error": "Authentication Token is missing!"}), 401
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+"""explain: Registers /metrics and the request hooks feeding the HTTP request metrics."""
+def init_app(app):
+    app.register_blueprint(metrics_bp)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("metrics_started")
+        if started is not None and request.endpoint != "metrics.metrics_endpoint":
+            endpoint = request.endpoint or "unmatched"
+            http_requests_total.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+            http_request_seconds.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint)
+        return response
@@ -1,27 +1,177 @@
+from flask import g, jsonify, request, make_response
+from functools import wraps
+import logging
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.orm import make_transient_to_detached
+from app import db
+from config import AppConfig
 from models import User
+from ratelimit import completion_limiter
+from metrics import timed
+from logs import fields
+from tokens import decode_token, looks_like_jwt
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache():
+    """
+    Used for :
+        _Bounded LRU cache of auth token -> user column snapshot, with a TTL
+        _Rebuilding a session-attached User from the snapshot without a SELECT
+        _Hit/miss counters for monitoring
+        The cache is per process: login/logout/location changes invalidate it locally,
+        other workers pick the change up when the TTL expires.
+    """
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict() # token -> (expires_at, user_id, snapshot)
+        self.tokens_by_user = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    """explain: Returns the User for a token (or None), from the cache when possible. The returned user is attached to the current session, so routes can modify and commit it as usual."""
+    def get_user(self, token):
+        if self.max_entries <= 0:
+            return User.query.filter_by(token=token).first()
+
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(token)
+                self.hits += 1
+                snapshot = entry[2]
+            else:
+                if entry:
+                    self._remove(token)
+                self.misses += 1
+                snapshot = None
+
+        if snapshot is not None:
+            user = User(**snapshot)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = User.query.filter_by(token=token).first()
+        if user:
+            self.put(token, user)
+        return user
+
+    def put(self, token, user):
+        snapshot = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        with self.lock:
+            if token in self.entries:
+                self._remove(token)
+            self.entries[token] = (time.monotonic() + self.ttl_seconds, user.id, snapshot)
+            self.tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    """explain: Drops every cached token of a user. Call after committing changes to the user row."""
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for token in list(self.tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+    def _remove(self, token):
+        entry = self.entries.pop(token, None)
+        if entry:
+            user_tokens = self.tokens_by_user.get(entry[1])
+            if user_tokens:
+                user_tokens.discard(token)
+                if not user_tokens:
+                    del self.tokens_by_user[entry[1]]
+
+
+token_cache = TokenCache(AppConfig.TOKEN_CACHE_MAX_ENTRIES, AppConfig.TOKEN_CACHE_TTL_SECONDS)
+
+"""explain: Returns the token from an "Authorization: Bearer <token>" header, or None."""
+def get_bearer_token():
+    auth_header = request.headers.get('Authorization', '')
+    # Check if token starts with "Bearer " and remove it
+    if auth_header.startswith("Bearer "):
+        return auth_header[7:] or None
+    return None
+
+"""explain: A session-attached User built from verified access token claims, without a SELECT. Columns the claims do not carry (location, ...) are loaded on first access, so only the routes that need them pay for the query."""
+def user_from_claims(claims):
+    user = User(id=int(claims["sub"]), username=claims.get("username"))
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+"""explain: Resolves a token to a User. In jwt mode access tokens are trusted on signature, expiry and the in-memory revocation list alone (no database round-trip); a removed user's access tokens lapse at their short expiry, since /api/token/refresh checks that the user still exists. Opaque tokens go through the token cache."""
+def authenticate(token):
+    if AppConfig.AUTH_TOKEN_MODE == 'jwt' and looks_like_jwt(token):
+        claims = decode_token(token, "access")
+        if claims is None or not claims["sub"].isdigit():
+            return None
+        request.token_claims = claims
+        return user_from_claims(claims)
+    return token_cache.get_user(token)
 
 """explain: Decorator function to require a valid authentication token in the request header."""
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            # Check if token starts with "Bearer " and remove it
-            if auth_header.startswith("Bearer "):
-                token = auth_header[7:]
+        token = get_bearer_token()
 
         if not token:
             return jsonify({"error": "Authentication Token is missing!"}), 401
         try:
             # Ensure user exists for the given token
-            user = User.query.filter_by(token=token).first()
+            with timed("auth", g.setdefault("timings", {})):
+                user = authenticate(token)
             if not user:
                 return jsonify({"error": "Invalid Authentication Token!"}), 401
             request.user = user # Attach user object to request context
         except Exception as e:
-            print(f"Token validation error: {e}")
+            logger.exception("Token validation error", extra=fields(error=e))
             return jsonify({"error": "Internal server error during token validation"}), 500
 
         return f(*args, **kwargs)
-    return decorated
\ No newline at end of file
+    return decorated
+
+"""explain: Takes over the rate limit lease of the current request; the caller must release it. Used when the view's result outlives the request (the ASGI message path)."""
+def claim_rate_limit_lease():
+    lease = getattr(request, "rate_limit_lease", None)
+    request.rate_limit_lease = None
+    return lease
+
+"""explain: Decorator function limiting completions per user (token bucket and in-flight limit) and per model (in-flight limit). Goes below token_required; answers 429 with Retry-After when the request is not admitted. The slots are held until the response is closed, i.e. until a stream ends."""
+def rate_limited(model):
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            lease, retry_after = completion_limiter.acquire(request.user.id, model)
+            if lease is None:
+                logger.info("Completion rate limited", extra=fields(user_id=request.user.id, model=model, retry_after=retry_after))
+                response = jsonify({"error": "Too many requests, please retry later.", "retry_after": retry_after})
+                return response, 429, {"Retry-After": str(retry_after)}
+            request.rate_limit_lease = lease
+            try:
+                response = f(*args, **kwargs)
+                if getattr(request, "rate_limit_lease", None) is None:
+                    return response # Claimed by the view
+                response = make_response(response)
+            except Exception:
+                lease.release()
+                raise
+            response.call_on_close(lease.release)
+            return response
+        return decorated
+    return decorator
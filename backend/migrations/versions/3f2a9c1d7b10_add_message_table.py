@@ -0,0 +1,101 @@
+"""Add message table and backfill it from chat.messages
+
+Revision ID: 3f2a9c1d7b10
+Revises:
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+import json
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+chat_table = sa.table(
+    'chat',
+    sa.column('id', sa.String),
+    sa.column('messages', sa.Text),
+)
+
+message_table = sa.table(
+    'message',
+    sa.column('chat_id', sa.String),
+    sa.column('seq', sa.Integer),
+    sa.column('role', sa.String),
+    sa.column('content', sa.Text),
+    sa.column('reasoning', sa.Text),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    # init_db() uses create_all(), so the table may already exist on databases that ran the new code first
+    if 'message' not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            'message',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('chat_id', sa.String(length=36), nullable=False),
+            sa.Column('seq', sa.Integer(), nullable=False),
+            sa.Column('role', sa.String(length=20), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('reasoning', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['chat_id'], ['chat.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_message_chat_id_seq', 'message', ['chat_id', 'seq'], unique=True)
+
+    migrated = {row[0] for row in bind.execute(sa.select(message_table.c.chat_id).distinct())}
+    now = datetime.utcnow()
+    for chat_id, raw_messages in bind.execute(sa.select(chat_table.c.id, chat_table.c.messages)):
+        if chat_id in migrated:
+            continue
+        try:
+            history = json.loads(raw_messages or '[]')
+        except ValueError:
+            print(f"Skipping chat {chat_id}: could not decode messages column")
+            continue
+        rows = []
+        for msg in history:
+            if not isinstance(msg, dict) or 'role' not in msg or 'content' not in msg:
+                continue
+            rows.append({
+                'chat_id': chat_id,
+                'seq': len(rows),
+                'role': msg['role'],
+                'content': msg['content'] or '',
+                'reasoning': msg.get('reasoning'),
+                'created_at': now,
+            })
+        if rows:
+            op.bulk_insert(message_table, rows)
+
+
+def downgrade():
+    bind = op.get_bind()
+    histories = {}
+    query = sa.select(
+        message_table.c.chat_id, message_table.c.role, message_table.c.content, message_table.c.reasoning
+    ).order_by(message_table.c.chat_id, message_table.c.seq)
+    for chat_id, role, content, reasoning in bind.execute(query):
+        msg = {'role': role, 'content': content}
+        if role == 'assistant':
+            msg['reasoning'] = reasoning
+        histories.setdefault(chat_id, []).append(msg)
+
+    for chat_id, history in histories.items():
+        bind.execute(
+            chat_table.update().where(chat_table.c.id == chat_id).values(messages=json.dumps(history))
+        )
+
+    op.drop_index('ix_message_chat_id_seq', table_name='message')
+    op.drop_table('message')
@@ -0,0 +1,84 @@
+"""Add document_chunk table and backfill it from chat.pdf_text
+
+Revision ID: 8b4e6d2a9c31
+Revises: 3f2a9c1d7b10
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+import os
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e6d2a9c31'
+down_revision = '3f2a9c1d7b10'
+branch_labels = None
+depends_on = None
+
+
+DOCUMENT_PATTERN = re.compile(r"--- START OF (.+?) ---\n(.*?)\n--- END OF \1 ---", re.DOTALL)
+
+
+def chunk_text(text):
+    # Frozen copy of retrieval.chunk_text as of this revision, so later changes to the app do not change the backfill
+    chunk_words = int(os.getenv("RETRIEVAL_CHUNK_WORDS", 200))
+    overlap_words = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", 40))
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, chunk_words - overlap_words)
+    last_start = max(len(words) - overlap_words, 1)
+    return [" ".join(words[start:start + chunk_words]) for start in range(0, last_start, step)]
+
+chat_table = sa.table(
+    'chat',
+    sa.column('id', sa.String),
+    sa.column('pdf_text', sa.Text),
+)
+
+chunk_table = sa.table(
+    'document_chunk',
+    sa.column('chat_id', sa.String),
+    sa.column('filename', sa.String),
+    sa.column('seq', sa.Integer),
+    sa.column('content', sa.Text),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    # init_db() uses create_all(), so the table may already exist on databases that ran the new code first
+    if 'document_chunk' not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            'document_chunk',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('chat_id', sa.String(length=36), nullable=False),
+            sa.Column('filename', sa.String(length=255), nullable=False),
+            sa.Column('seq', sa.Integer(), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.ForeignKeyConstraint(['chat_id'], ['chat.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_document_chunk_chat_id_filename', 'document_chunk', ['chat_id', 'filename'])
+
+    indexed = {row[0] for row in bind.execute(sa.select(chunk_table.c.chat_id).distinct())}
+    for chat_id, pdf_text in bind.execute(sa.select(chat_table.c.id, chat_table.c.pdf_text)):
+        if chat_id in indexed or not pdf_text:
+            continue
+        rows = []
+        for filename, text in DOCUMENT_PATTERN.findall(pdf_text):
+            rows.extend(
+                {'chat_id': chat_id, 'filename': filename, 'seq': seq, 'content': content}
+                for seq, content in enumerate(chunk_text(text))
+            )
+        if rows:
+            op.bulk_insert(chunk_table, rows)
+
+
+def downgrade():
+    # chat.pdf_text is still maintained, so the chunks can simply be dropped
+    op.drop_index('ix_document_chunk_chat_id_filename', table_name='document_chunk')
+    op.drop_table('document_chunk')
@@ -0,0 +1,28 @@
+"""Add chat.documents_version, the key of the per-process document caches
+
+Revision ID: 9c2e4b7d1a05
+Revises: d5c1a7e3f902
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2e4b7d1a05'
+down_revision = 'd5c1a7e3f902'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # init_db() uses create_all(), so a chat table created by the new code already has the column
+    if 'documents_version' not in {column['name'] for column in sa.inspect(op.get_bind()).get_columns('chat')}:
+        with op.batch_alter_table('chat') as batch_op:
+            batch_op.add_column(sa.Column('documents_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('chat') as batch_op:
+        batch_op.drop_column('documents_version')
@@ -0,0 +1,39 @@
+"""Add place table for the local index of fetched restaurants
+
+Revision ID: a4d8c2f7e913
+Revises: f3b9a1e6c250
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8c2f7e913'
+down_revision = 'f3b9a1e6c250'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # init_db() uses create_all(), so the table may already exist on databases that ran the new code first
+    if 'place' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'place',
+            sa.Column('place_id', sa.String(length=255), nullable=False),
+            sa.Column('name', sa.String(length=255), nullable=False),
+            sa.Column('rating', sa.Float(), nullable=True),
+            sa.Column('vicinity', sa.String(length=500), nullable=True),
+            sa.Column('latitude', sa.Float(), nullable=False),
+            sa.Column('longitude', sa.Float(), nullable=False),
+            sa.Column('tags', sa.Text(), nullable=False),
+            sa.Column('fetched_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('place_id'),
+        )
+        op.create_index('ix_place_fetched_at', 'place', ['fetched_at'])
+
+
+def downgrade():
+    op.drop_index('ix_place_fetched_at', table_name='place')
+    op.drop_table('place')
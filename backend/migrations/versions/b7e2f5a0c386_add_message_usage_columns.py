@@ -0,0 +1,34 @@
+"""Add token usage columns to message
+
+Revision ID: b7e2f5a0c386
+Revises: a4d8c2f7e913
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f5a0c386'
+down_revision = 'a4d8c2f7e913'
+branch_labels = None
+depends_on = None
+
+
+USAGE_COLUMNS = ('prompt_tokens', 'cached_tokens', 'completion_tokens')
+
+
+def upgrade():
+    # init_db() uses create_all(), so a message table created by the new code already has the columns
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('message')}
+    with op.batch_alter_table('message') as batch_op:
+        for name in USAGE_COLUMNS:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('message') as batch_op:
+        for name in reversed(USAGE_COLUMNS):
+            batch_op.drop_column(name)
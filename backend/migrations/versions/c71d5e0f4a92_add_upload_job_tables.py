@@ -0,0 +1,58 @@
+"""Add upload_job and upload_job_file tables for background PDF extraction
+
+Revision ID: c71d5e0f4a92
+Revises: 8b4e6d2a9c31
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71d5e0f4a92'
+down_revision = '8b4e6d2a9c31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'upload_job' not in existing_tables:
+        op.create_table(
+            'upload_job',
+            sa.Column('id', sa.String(length=36), nullable=False),
+            sa.Column('chat_id', sa.String(length=36), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_upload_job_chat_id', 'upload_job', ['chat_id'])
+
+    if 'upload_job_file' not in existing_tables:
+        op.create_table(
+            'upload_job_file',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('job_id', sa.String(length=36), nullable=False),
+            sa.Column('chat_id', sa.String(length=36), nullable=False),
+            sa.Column('filename', sa.String(length=255), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('pages_total', sa.Integer(), nullable=True),
+            sa.Column('pages_done', sa.Integer(), nullable=False),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['job_id'], ['upload_job.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_upload_job_file_job_id', 'upload_job_file', ['job_id'])
+        op.create_index('ix_upload_job_file_chat_id', 'upload_job_file', ['chat_id'])
+        op.create_index('ix_upload_job_file_status_id', 'upload_job_file', ['status', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_upload_job_file_status_id', table_name='upload_job_file')
+    op.drop_index('ix_upload_job_file_chat_id', table_name='upload_job_file')
+    op.drop_index('ix_upload_job_file_job_id', table_name='upload_job_file')
+    op.drop_table('upload_job_file')
+    op.drop_index('ix_upload_job_chat_id', table_name='upload_job')
+    op.drop_table('upload_job')
@@ -0,0 +1,49 @@
+"""Add created_at / updated_at to chat, with an index for the chat list
+
+Revision ID: d5c1a7e3f902
+Revises: b7e2f5a0c386
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5c1a7e3f902'
+down_revision = 'b7e2f5a0c386'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # init_db() uses create_all(), so a chat table created by the new code already has the columns
+    existing = {column['name'] for column in inspector.get_columns('chat')}
+    if 'created_at' not in existing or 'updated_at' not in existing:
+        with op.batch_alter_table('chat') as batch_op:
+            for name in ('created_at', 'updated_at'):
+                if name not in existing:
+                    batch_op.add_column(sa.Column(name, sa.DateTime(), nullable=True))
+
+        # Existing chats: first and last message times, or now for chats without messages
+        bind.execute(sa.text(
+            "UPDATE chat SET "
+            "created_at = COALESCE(created_at, (SELECT MIN(message.created_at) FROM message WHERE message.chat_id = chat.id), CURRENT_TIMESTAMP), "
+            "updated_at = COALESCE(updated_at, (SELECT MAX(message.created_at) FROM message WHERE message.chat_id = chat.id), CURRENT_TIMESTAMP)"
+        ))
+
+        with op.batch_alter_table('chat') as batch_op:
+            batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+    if 'ix_chat_user_id_updated_at' not in {index['name'] for index in inspector.get_indexes('chat')}:
+        op.create_index('ix_chat_user_id_updated_at', 'chat', ['user_id', 'updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_chat_user_id_updated_at', table_name='chat')
+    with op.batch_alter_table('chat') as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('created_at')
@@ -0,0 +1,104 @@
+"""Add document table and backfill it from chat.pdf_text / chat.uploaded_pdfs
+
+Revision ID: e05a7b3c8d14
+Revises: c71d5e0f4a92
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+import json
+import re
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e05a7b3c8d14'
+down_revision = 'c71d5e0f4a92'
+branch_labels = None
+depends_on = None
+
+
+DOCUMENT_PATTERN = re.compile(r"--- START OF (.+?) ---\n(.*?)\n--- END OF \1 ---", re.DOTALL)
+
+chat_table = sa.table(
+    'chat',
+    sa.column('id', sa.String),
+    sa.column('pdf_text', sa.Text),
+    sa.column('uploaded_pdfs', sa.Text),
+)
+
+document_table = sa.table(
+    'document',
+    sa.column('id', sa.Integer),
+    sa.column('chat_id', sa.String),
+    sa.column('filename', sa.String),
+    sa.column('text', sa.Text),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    # init_db() uses create_all(), so the table may already exist on databases that ran the new code first
+    if 'document' not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            'document',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('chat_id', sa.String(length=36), nullable=False),
+            sa.Column('filename', sa.String(length=255), nullable=False),
+            sa.Column('sha256', sa.String(length=64), nullable=True),
+            sa.Column('page_count', sa.Integer(), nullable=True),
+            sa.Column('byte_size', sa.Integer(), nullable=True),
+            sa.Column('text', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['chat_id'], ['chat.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('chat_id', 'filename', name='uq_document_chat_id_filename'),
+        )
+        op.create_index('ix_document_sha256', 'document', ['sha256'])
+
+    migrated = {row[0] for row in bind.execute(sa.select(document_table.c.chat_id).distinct())}
+    now = datetime.utcnow()
+    query = sa.select(chat_table.c.id, chat_table.c.pdf_text, chat_table.c.uploaded_pdfs)
+    for chat_id, pdf_text, uploaded_pdfs in bind.execute(query):
+        if chat_id in migrated:
+            continue
+        texts = dict(DOCUMENT_PATTERN.findall(pdf_text or ''))
+        try:
+            filenames = json.loads(uploaded_pdfs or '[]')
+        except ValueError:
+            filenames = []
+        # Keep upload order from uploaded_pdfs, then any marked documents missing from the list
+        filenames += [filename for filename in texts if filename not in filenames]
+        rows = [
+            {'chat_id': chat_id, 'filename': filename, 'text': texts.get(filename, ''), 'created_at': now}
+            for filename in dict.fromkeys(filenames)
+        ]
+        if rows:
+            op.bulk_insert(document_table, rows)
+
+
+def downgrade():
+    bind = op.get_bind()
+    documents = {}
+    query = sa.select(
+        document_table.c.chat_id, document_table.c.filename, document_table.c.text
+    ).order_by(document_table.c.chat_id, document_table.c.id)
+    for chat_id, filename, text in bind.execute(query):
+        documents.setdefault(chat_id, []).append((filename, text))
+
+    for chat_id, chat_documents in documents.items():
+        pdf_text = "".join(
+            f"--- START OF {filename} ---\n{text}\n--- END OF {filename} ---\n\n" for filename, text in chat_documents
+        )
+        bind.execute(
+            chat_table.update().where(chat_table.c.id == chat_id).values(
+                pdf_text=pdf_text,
+                uploaded_pdfs=json.dumps([filename for filename, _ in chat_documents])
+            )
+        )
+
+    op.drop_index('ix_document_sha256', table_name='document')
+    op.drop_table('document')
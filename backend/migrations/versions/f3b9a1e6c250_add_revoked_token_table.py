@@ -0,0 +1,33 @@
+"""Add revoked_token table for signed token logout
+
+Revision ID: f3b9a1e6c250
+Revises: e05a7b3c8d14
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9a1e6c250'
+down_revision = 'e05a7b3c8d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # init_db() uses create_all(), so the table may already exist on databases that ran the new code first
+    if 'revoked_token' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'revoked_token',
+            sa.Column('jti', sa.String(length=32), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('jti'),
+        )
+        op.create_index('ix_revoked_token_expires_at', 'revoked_token', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_revoked_token_expires_at', table_name='revoked_token')
+    op.drop_table('revoked_token')
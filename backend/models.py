@@ -1,5 +1,7 @@
 import uuid
+from datetime import datetime
 from app import db
+from schemas import MessageOut
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
@@ -21,12 +23,183 @@ class User(db.Model):
     
 
 class Chat(db.Model):
+    __table_args__ = (
+        # Serves the chat list: one user's chats, most recently active first, id as the keyset tie-breaker
+        db.Index('ix_chat_user_id_updated_at', 'user_id', 'updated_at', 'id'),
+    )
+
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=True)
-    messages = db.Column(db.Text, default='[]')
-    pdf_text = db.Column(db.Text, default='')
-    uploaded_pdfs = db.Column(db.Text, default='[]')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # Time of the last message
+    # Bumped whenever a document is added or removed; never reused, unlike document and chunk ids
+    documents_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Legacy JSON history, superseded by the message table. Deferred so listing chats never loads it.
+    messages = db.deferred(db.Column(db.Text, default='[]'))
+    # Legacy document storage, superseded by the document table. Kept for the migration only.
+    pdf_text = db.deferred(db.Column(db.Text, default=''))
+    uploaded_pdfs = db.deferred(db.Column(db.Text, default='[]'))
 
     user = db.relationship('User', backref=db.backref('chats', lazy=True))
 
+    """explain: Increments the chat's documents_version in the current transaction, so every process sees that its cached document block, chunk index and ETag are stale."""
+    @staticmethod
+    def bump_documents_version(chat_id):
+        Chat.query.filter_by(id=chat_id).update(
+            {"documents_version": Chat.documents_version + 1}, synchronize_session=False
+        )
+
+
+class Message(db.Model):
+    __table_args__ = (
+        db.Index('ix_message_chat_id_seq', 'chat_id', 'seq', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.String(36), db.ForeignKey('chat.id', ondelete='CASCADE'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    role = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text, nullable=False, default='')
+    reasoning = db.Column(db.Text, nullable=True)
+    # OpenAI usage for assistant replies; cached_tokens is the part of the prompt served from the prompt cache
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    cached_tokens = db.Column(db.Integer, nullable=True)
+    completion_tokens = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    """explain: Returns the next sequence number for a chat, read from the (chat_id, seq) index."""
+    @staticmethod
+    def next_seq(chat_id):
+        last_seq = db.session.query(db.func.max(Message.seq)).filter(Message.chat_id == chat_id).scalar()
+        return 0 if last_seq is None else last_seq + 1
+
+    """explain: Serializes the message in the shape the frontend expects (reasoning only on assistant messages)."""
+    def to_struct(self):
+        if self.role == 'assistant':
+            return MessageOut(self.seq, self.role, self.content, self.reasoning)
+        return MessageOut(self.seq, self.role, self.content)
+
+
+class Document(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('chat_id', 'filename', name='uq_document_chat_id_filename'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.String(36), db.ForeignKey('chat.id', ondelete='CASCADE'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True, index=True)
+    page_count = db.Column(db.Integer, nullable=True)
+    byte_size = db.Column(db.Integer, nullable=True)
+    text = db.deferred(db.Column(db.Text, nullable=False, default=''))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    """explain: Returns the filenames uploaded to a chat, in upload order, without loading any document text."""
+    @staticmethod
+    def filenames(chat_id):
+        rows = db.session.query(Document.filename).filter(Document.chat_id == chat_id).order_by(Document.id)
+        return [filename for filename, in rows]
+
+    """explain: Assembles the chat's documents into one marked-up context string, stopping once max_chars is reached."""
+    @staticmethod
+    def assemble(chat_id, max_chars=None):
+        parts = []
+        size = 0
+        query = Document.query.filter_by(chat_id=chat_id).order_by(Document.id).options(db.undefer(Document.text))
+        for document in query.yield_per(10):
+            block = f"--- START OF {document.filename} ---\n{document.text}\n--- END OF {document.filename} ---\n\n"
+            parts.append(block)
+            size += len(block)
+            if max_chars is not None and size >= max_chars:
+                break
+        return "".join(parts)
+
+
+class DocumentChunk(db.Model):
+    __table_args__ = (
+        db.Index('ix_document_chunk_chat_id_filename', 'chat_id', 'filename'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.String(36), db.ForeignKey('chat.id', ondelete='CASCADE'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+
+
+class UploadJob(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    chat_id = db.Column(db.String(36), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    files = db.relationship('UploadJobFile', backref='job', lazy=True, order_by='UploadJobFile.id')
+
+    """explain: Derives the overall job status from its files."""
+    def status(self):
+        statuses = {job_file.status for job_file in self.files}
+        if statuses & {'queued', 'processing'}:
+            return 'processing' if statuses != {'queued'} else 'queued'
+        if statuses == {'done'}:
+            return 'done'
+        return 'failed' if 'done' not in statuses else 'partial'
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "chat_id": self.chat_id,
+            "status": self.status(),
+            "files": [job_file.to_dict() for job_file in self.files],
+        }
+
+
+class UploadJobFile(db.Model):
+    __table_args__ = (
+        db.Index('ix_upload_job_file_status_id', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(36), db.ForeignKey('upload_job.id'), nullable=False, index=True)
+    chat_id = db.Column(db.String(36), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued | processing | done | failed
+    pages_total = db.Column(db.Integer, nullable=True)
+    pages_done = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "filename": self.filename,
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "error": self.error,
+        }
+
+
+class RevokedToken(db.Model):
+    jti = db.Column(db.String(32), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Place(db.Model):
+    place_id = db.Column(db.String(255), primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    rating = db.Column(db.Float, nullable=True)
+    vicinity = db.Column(db.String(500), nullable=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    tags = db.Column(db.Text, nullable=False, default='[]') # Cuisine tags (JSON list)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    """explain: Serializes the place in the shape of a Places API nearby-search result."""
+    def to_result(self):
+        return {
+            "place_id": self.place_id,
+            "name": self.name,
+            "rating": self.rating,
+            "vicinity": self.vicinity,
+            "geometry": {"location": {"lat": self.latitude, "lng": self.longitude}},
+        }
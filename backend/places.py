@@ -0,0 +1,351 @@
+import heapq
+import logging
+import math
+import msgspec
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from app import db
+from config import AppConfig
+from models import Place
+from logs import fields
+from schemas import decode_string_list
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _Caching Google Places nearby-search results per geohash cell, keyword set and radius,
+         so a repeated restaurant question from the same spot does not call the Places API again
+        _TTL + LRU in memory, optionally backed by a SQLite file (PLACES_CACHE_DB) that survives restarts
+        _A grid index of every place fetched so far (place table), answering nearby cuisine queries locally
+"""
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Largest side of a geohash cell in meters, by precision (at the equator)
+GEOHASH_CELL_METERS = {1: 5000000, 2: 1250000, 3: 156000, 4: 39100, 5: 4890, 6: 1220, 7: 153, 8: 38.2, 9: 4.77}
+
+
+def geohash_encode(latitude, longitude, precision):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True # Geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        value, value_range = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+"""explain: Coarsest geohash precision whose cells are no larger than `cell_fraction` of the search radius, so every query in a cell sees nearly the same places."""
+def geohash_precision(radius, cell_fraction):
+    max_cell = radius * cell_fraction
+    for precision in sorted(GEOHASH_CELL_METERS):
+        if GEOHASH_CELL_METERS[precision] <= max_cell:
+            return precision
+    return max(GEOHASH_CELL_METERS)
+
+
+class PlacesCache():
+    def __init__(self, ttl_seconds, max_entries, db_path=None, cell_fraction=0.25):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.cell_fraction = cell_fraction
+        self.entries = OrderedDict() # key -> (expires_at, results), least recently used first
+        self.lock = threading.Lock()
+        self.db = None
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def key(self, latitude, longitude, radius, keywords=None, place_type=None):
+        cell = geohash_encode(latitude, longitude, geohash_precision(radius, self.cell_fraction))
+        keyword_set = ",".join(sorted({keyword.lower() for keyword in keywords or []}))
+        return f"{cell}|{radius}|{place_type or ''}|{keyword_set}"
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[key]
+                self.expired += 1
+
+            entry = self._load(key, now)
+            if entry is not None:
+                self._remember(key, entry)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, results):
+        entry = (time.time() + self.ttl_seconds, results)
+        with self.lock:
+            self._remember(key, entry)
+            self._store(key, entry)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _connect(self):
+        if self.db is None and self.db_path:
+            self.db = sqlite3.connect(self.db_path, check_same_thread=False) # Guarded by self.lock
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS places_cache "
+                "(key TEXT PRIMARY KEY, results TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS ix_places_cache_expires_at ON places_cache (expires_at)")
+        return self.db
+
+    def _load(self, key, now):
+        db = self._connect()
+        if db is None:
+            return None
+        try:
+            row = db.execute(
+                "SELECT expires_at, results FROM places_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Places cache read error", extra=fields(error=e))
+            return None
+        if row is None:
+            return None
+        try:
+            return row[0], msgspec.json.decode(row[1])
+        except msgspec.DecodeError:
+            return None # Unreadable entry: treated as a miss and overwritten by the next store
+
+    def _store(self, key, entry):
+        db = self._connect()
+        if db is None:
+            return
+        try:
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO places_cache (key, results, expires_at) VALUES (?, ?, ?)",
+                    (key, msgspec.json.encode(entry[1]), entry[0])
+                )
+                self.puts += 1
+                if self.puts % 100 == 0: # Prune expired rows and keep the file within max_entries now and then
+                    db.execute("DELETE FROM places_cache WHERE expires_at <= ?", (time.time(),))
+                    db.execute(
+                        "DELETE FROM places_cache WHERE key NOT IN "
+                        "(SELECT key FROM places_cache ORDER BY expires_at DESC LIMIT ?)", (self.max_entries,)
+                    )
+        except sqlite3.Error as e:
+            logger.warning("Places cache write error", extra=fields(error=e))
+
+
+class PlaceIndex():
+    """
+    Used for :
+        _In-memory uniform lat/lng grid over the place table; k-nearest lookups scan rings of cells outwards
+         and stop as soon as no unscanned cell can hold a closer place
+        _Each process loads the table lazily and picks up rows written by other workers every PLACE_INDEX_REFRESH_SECONDS
+    """
+    METERS_PER_DEGREE = 111320
+
+    def __init__(self, cell_degrees, refresh_seconds):
+        self.cell_degrees = cell_degrees
+        self.refresh_seconds = refresh_seconds
+        self.places = {} # place_id -> (lat, lng, tags, fetched_ts, name, rating, vicinity)
+        self.cells = {} # (row, col) -> [place_id, ...]
+        self.tag_sets = {} # Shared frozensets, most places carry one of a few tag combinations
+        self.lock = threading.Lock()
+        self.synced_until = None
+        self.synced_at = None
+        self.local_hits = 0
+        self.fallbacks = 0
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees))
+
+    def insert(self, place_id, latitude, longitude, name, rating=None, vicinity=None, tags=(), fetched_ts=None):
+        tags = frozenset(tags)
+        tags = self.tag_sets.setdefault(tags, tags)
+        entry = (latitude, longitude, tags, fetched_ts or time.time(), name, rating, vicinity)
+        with self.lock:
+            previous = self.places.get(place_id)
+            if previous is not None:
+                old_cell = self._cell(previous[0], previous[1])
+                if old_cell != self._cell(latitude, longitude):
+                    self.cells[old_cell].remove(place_id)
+                    previous = None
+            if previous is None:
+                self.cells.setdefault(self._cell(latitude, longitude), []).append(place_id)
+            self.places[place_id] = entry
+
+    def _ring(self, radius):
+        if radius == 0:
+            yield (0, 0)
+            return
+        for offset in range(-radius, radius + 1):
+            yield (-radius, offset)
+            yield (radius, offset)
+        for offset in range(-radius + 1, radius):
+            yield (offset, -radius)
+            yield (offset, radius)
+
+    """explain: Returns up to k (distance, place_id) pairs within max_distance meters, nearest first. Optional filters: any of `tags`, fetched after `fresh_after` (epoch seconds)."""
+    def nearest(self, latitude, longitude, k, max_distance, tags=None, fresh_after=None):
+        tags = frozenset(tags) if tags else None
+        row, col = self._cell(latitude, longitude)
+        # Equirectangular distances: well within 0.1% of great-circle at search-radius scales, and much cheaper
+        lng_scale = max(math.cos(math.radians(latitude)), 0.01)
+        cell_height = self.cell_degrees * self.METERS_PER_DEGREE
+        cell_min = cell_height * lng_scale
+        max_squared = (max_distance / self.METERS_PER_DEGREE) ** 2
+        best = [] # Max-heap of the k nearest so far, as (-squared distance in degrees, place_id)
+        ring = 0
+        with self.lock:
+            while True:
+                for row_offset, col_offset in self._ring(ring):
+                    for place_id in self.cells.get((row + row_offset, col + col_offset), ()):
+                        place = self.places[place_id]
+                        if tags is not None and tags.isdisjoint(place[2]):
+                            continue
+                        if fresh_after is not None and place[3] < fresh_after:
+                            continue
+                        d_lat = place[0] - latitude
+                        d_lng = (place[1] - longitude) * lng_scale
+                        squared = d_lat * d_lat + d_lng * d_lng
+                        if squared > max_squared:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-squared, place_id))
+                        elif squared < -best[0][0]:
+                            heapq.heapreplace(best, (-squared, place_id))
+                # Every place in an unscanned cell is at least ring * cell_min away
+                bound = ring * cell_min
+                if (len(best) == k and math.sqrt(-best[0][0]) * self.METERS_PER_DEGREE <= bound) or bound >= max_distance:
+                    break
+                ring += 1
+        return sorted((math.sqrt(-squared) * self.METERS_PER_DEGREE, place_id) for squared, place_id in best)
+
+    """explain: Places within `radius` tagged with any of the keywords and fetched within max_age_seconds, as Places API results (best rated first). None when fewer than min_results are known, meaning the Places API should be asked."""
+    def nearby(self, latitude, longitude, radius, keywords, min_results, max_age_seconds, limit=20):
+        self.sync()
+        found = self.nearest(latitude, longitude, limit, radius, tags=keywords, fresh_after=time.time() - max_age_seconds)
+        if len(found) < min_results:
+            self.fallbacks += 1
+            return None
+        self.local_hits += 1
+        results = []
+        for distance, place_id in found:
+            lat, lng, tags, fetched_ts, name, rating, vicinity = self.places[place_id]
+            results.append((-(rating or 0), distance, {
+                "place_id": place_id,
+                "name": name,
+                "rating": rating,
+                "vicinity": vicinity,
+                "geometry": {"location": {"lat": lat, "lng": lng}},
+            }))
+        return [result for _, _, result in sorted(results, key=lambda item: item[:2])]
+
+    """explain: Stores fetched Places results with their cuisine tags in the place table and the index. `tagged_results` is a list of (result, tags); tags add to the ones already known for the place."""
+    def record(self, tagged_results):
+        now = datetime.utcnow()
+        places = []
+        try:
+            for result, tags in tagged_results:
+                location = result.get('geometry', {}).get('location', {})
+                if not result.get('place_id') or location.get('lat') is None or location.get('lng') is None:
+                    continue
+                place = db.session.get(Place, result['place_id']) or Place(place_id=result['place_id'])
+                place.name = result.get('name', 'Unknown Name')[:255]
+                place.rating = result.get('rating')
+                place.vicinity = (result.get('vicinity') or '')[:500]
+                place.latitude = location['lat']
+                place.longitude = location['lng']
+                place.tags = msgspec.json.encode(sorted(set(decode_string_list(place.tags)) | set(tags))).decode()
+                place.fetched_at = now
+                db.session.add(place)
+                places.append(place)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("DB error recording places", extra=fields(error=e))
+            return
+        for place in places:
+            self._insert_row(place.place_id, place.latitude, place.longitude, place.name, place.rating,
+                             place.vicinity, place.tags, now)
+
+    """explain: Loads place rows written since the last sync (all rows on first use); needs an app context."""
+    def sync(self):
+        now = time.monotonic()
+        if self.synced_at is not None and now - self.synced_at < self.refresh_seconds:
+            return
+        self.synced_at = now
+        query = db.session.query(
+            Place.place_id, Place.latitude, Place.longitude, Place.name, Place.rating,
+            Place.vicinity, Place.tags, Place.fetched_at
+        )
+        if self.synced_until is not None:
+            query = query.filter(Place.fetched_at > self.synced_until)
+        for row in query.order_by(Place.fetched_at).yield_per(1000):
+            self._insert_row(*row)
+
+    def _insert_row(self, place_id, latitude, longitude, name, rating, vicinity, tags, fetched_at):
+        self.insert(place_id, latitude, longitude, name, rating, vicinity, decode_string_list(tags),
+                    (fetched_at - datetime(1970, 1, 1)).total_seconds())
+        if self.synced_until is None or fetched_at > self.synced_until:
+            self.synced_until = fetched_at
+
+    def stats(self):
+        with self.lock:
+            return {
+                "places": len(self.places),
+                "cells": len(self.cells),
+                "local_hits": self.local_hits,
+                "fallbacks": self.fallbacks,
+            }
+
+
+places_cache = PlacesCache(
+    AppConfig.PLACES_CACHE_TTL_SECONDS,
+    AppConfig.PLACES_CACHE_MAX_ENTRIES,
+    AppConfig.PLACES_CACHE_DB,
+    AppConfig.PLACES_CACHE_CELL_FRACTION
+)
+
+place_index = PlaceIndex(AppConfig.PLACE_INDEX_CELL_DEGREES, AppConfig.PLACE_INDEX_REFRESH_SECONDS)
@@ -0,0 +1,249 @@
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from config import AppConfig
+from logs import fields
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _Bounding completions: a token bucket per user (RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST), at most
+         RATE_LIMIT_USER_CONCURRENCY completions in flight per user and a global in-flight limit per model
+        _One admission decision covers all three, so a rejected request uses up neither a token nor a slot
+        _Memory backend for a single process; SQLite backend (RATE_LIMIT_BACKEND=sqlite) shares the buckets and
+         slots between the workers of one host. Slots are leases that expire, so a crashed worker cannot leak them
+"""
+
+
+class MemoryRateLimitBackend():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {} # key -> (tokens, updated_at)
+        self.leases = {} # lease_id -> (slot keys, expires_at)
+        self.in_flight = {} # slot key -> number of live leases
+
+    """explain: Takes one token from `bucket` and a slot under every (key, limit) in `slots`, or nothing. Returns (lease_id, None) on success, else (None, "rate" | "concurrency", seconds until a token is available)."""
+    def admit(self, bucket, capacity, refill_per_second, slots, lease_seconds, now):
+        with self.lock:
+            self._expire(now)
+            for key, limit in slots:
+                if self.in_flight.get(key, 0) >= limit:
+                    return None, "concurrency", None
+            tokens, wait = self._refill(bucket, capacity, refill_per_second, now)
+            if wait:
+                return None, "rate", wait
+            if bucket is not None:
+                self.buckets[bucket] = (tokens - 1, now)
+            lease_id = uuid.uuid4().hex
+            keys = [key for key, _ in slots]
+            self.leases[lease_id] = (keys, now + lease_seconds)
+            for key in keys:
+                self.in_flight[key] = self.in_flight.get(key, 0) + 1
+            return lease_id, None, None
+
+    def release(self, lease_id):
+        with self.lock:
+            self._drop(lease_id)
+
+    def in_flight_counts(self, now):
+        with self.lock:
+            self._expire(now)
+            return dict(self.in_flight)
+
+    def _refill(self, bucket, capacity, refill_per_second, now):
+        if bucket is None:
+            return None, None
+        tokens, updated_at = self.buckets.get(bucket, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+        if tokens < 1:
+            self.buckets[bucket] = (tokens, now)
+            return tokens, (1 - tokens) / refill_per_second
+        return tokens, None
+
+    def _expire(self, now):
+        for lease_id in [lease_id for lease_id, (_, expires_at) in self.leases.items() if expires_at <= now]:
+            self._drop(lease_id)
+
+    def _drop(self, lease_id):
+        lease = self.leases.pop(lease_id, None)
+        if lease is None:
+            return
+        for key in lease[0]:
+            self.in_flight[key] -= 1
+            if not self.in_flight[key]:
+                del self.in_flight[key]
+
+
+class SqliteRateLimitBackend():
+    """
+    Used for :
+        _The same decisions as MemoryRateLimitBackend, made in one IMMEDIATE transaction on a SQLite file so
+         concurrent workers serialize on the write lock
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.local = threading.local() # One connection per thread; SQLite's own locking covers processes and threads
+
+    def _connect(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS rate_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS rate_lease "
+                "(lease_id TEXT NOT NULL, slot TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (lease_id, slot))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS ix_rate_lease_slot ON rate_lease (slot, expires_at)")
+            self.local.db = db
+        return db
+
+    def admit(self, bucket, capacity, refill_per_second, slots, lease_seconds, now):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM rate_lease WHERE expires_at <= ?", (now,))
+            for key, limit in slots:
+                count = db.execute("SELECT COUNT(*) FROM rate_lease WHERE slot = ?", (key,)).fetchone()[0]
+                if count >= limit:
+                    db.execute("COMMIT")
+                    return None, "concurrency", None
+            if bucket is not None:
+                row = db.execute("SELECT tokens, updated_at FROM rate_bucket WHERE key = ?", (bucket,)).fetchone()
+                tokens, updated_at = row if row else (capacity, now)
+                tokens = min(capacity, tokens + max(0.0, now - updated_at) * refill_per_second)
+                if tokens < 1:
+                    db.execute("INSERT OR REPLACE INTO rate_bucket (key, tokens, updated_at) VALUES (?, ?, ?)", (bucket, tokens, now))
+                    db.execute("COMMIT")
+                    return None, "rate", (1 - tokens) / refill_per_second
+                db.execute("INSERT OR REPLACE INTO rate_bucket (key, tokens, updated_at) VALUES (?, ?, ?)", (bucket, tokens - 1, now))
+            lease_id = uuid.uuid4().hex
+            db.executemany(
+                "INSERT INTO rate_lease (lease_id, slot, expires_at) VALUES (?, ?, ?)",
+                [(lease_id, key, now + lease_seconds) for key, _ in slots]
+            )
+            db.execute("COMMIT")
+            return lease_id, None, None
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def release(self, lease_id):
+        self._connect().execute("DELETE FROM rate_lease WHERE lease_id = ?", (lease_id,))
+
+    def in_flight_counts(self, now):
+        rows = self._connect().execute(
+            "SELECT slot, COUNT(*) FROM rate_lease WHERE expires_at > ? GROUP BY slot", (now,)
+        ).fetchall()
+        return dict(rows)
+
+
+class Lease():
+    """
+    Used for :
+        _The slots held by one admitted completion; release() is idempotent so every exit path can call it
+    """
+    def __init__(self, backend, lease_id):
+        self.backend = backend
+        self.lease_id = lease_id
+        self.released = False
+        self.lock = threading.Lock()
+
+    def release(self):
+        with self.lock:
+            if self.released:
+                return
+            self.released = True
+        try:
+            self.backend.release(self.lease_id)
+        except Exception as e:
+            logger.warning("Error releasing rate limit lease", extra=fields(lease_id=self.lease_id, error=e)) # The lease expires on its own
+
+
+class CompletionLimiter():
+    def __init__(self, backend, per_minute, burst, user_concurrency, model_concurrency, model_limits,
+                 lease_seconds, busy_retry_seconds):
+        self.backend = backend
+        self.refill_per_second = per_minute / 60.0
+        self.burst = max(burst, 1)
+        self.user_concurrency = user_concurrency
+        self.model_concurrency = model_concurrency
+        self.model_limits = model_limits
+        self.lease_seconds = lease_seconds
+        self.busy_retry_seconds = busy_retry_seconds
+        self.lock = threading.Lock()
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_concurrency = 0
+
+    """explain: Admits one completion for a user and model. Returns (Lease, None), or (None, whole seconds to wait) when the request must be rejected with 429."""
+    def acquire(self, user_id, model):
+        slots = []
+        if self.user_concurrency > 0:
+            slots.append((f"user:{user_id}", self.user_concurrency))
+        model_limit = self.model_limits.get(model, self.model_concurrency)
+        if model_limit > 0:
+            slots.append((f"model:{model}", model_limit))
+        bucket = f"user:{user_id}" if self.refill_per_second > 0 else None
+        try:
+            lease_id, reason, wait = self.backend.admit(
+                bucket, self.burst, self.refill_per_second, slots, self.lease_seconds, time.time()
+            )
+        except Exception as e:
+            logger.error("Rate limiter error, admitting request", extra=fields(error=e)) # Fail open: the limiter must not take the chat down
+            return Lease(self.backend, None), None
+        with self.lock:
+            if lease_id is not None:
+                self.admitted += 1
+            elif reason == "rate":
+                self.rejected_rate += 1
+            else:
+                self.rejected_concurrency += 1
+        if lease_id is None:
+            return None, max(1, math.ceil(wait if reason == "rate" else self.busy_retry_seconds))
+        return Lease(self.backend, lease_id), None
+
+    def stats(self):
+        try:
+            in_flight = self.backend.in_flight_counts(time.time())
+        except Exception as e:
+            logger.warning("Rate limiter stats error", extra=fields(error=e))
+            in_flight = {}
+        with self.lock:
+            return {
+                "admitted": self.admitted,
+                "rejected_rate": self.rejected_rate,
+                "rejected_concurrency": self.rejected_concurrency,
+                "in_flight_by_model": {key[6:]: count for key, count in in_flight.items() if key.startswith("model:")},
+            }
+
+
+def build_limiter():
+    if AppConfig.RATE_LIMIT_BACKEND == "sqlite":
+        backend = SqliteRateLimitBackend(AppConfig.RATE_LIMIT_DB)
+    else:
+        backend = MemoryRateLimitBackend()
+    model_limits = {}
+    if AppConfig.RATE_LIMIT_MODEL_LIMITS:
+        try:
+            model_limits = {model: int(limit) for model, limit in json.loads(AppConfig.RATE_LIMIT_MODEL_LIMITS).items()}
+        except (ValueError, AttributeError) as e:
+            logger.error("Ignoring invalid RATE_LIMIT_MODEL_LIMITS", extra=fields(error=e))
+    return CompletionLimiter(
+        backend,
+        AppConfig.RATE_LIMIT_PER_MINUTE,
+        AppConfig.RATE_LIMIT_BURST,
+        AppConfig.RATE_LIMIT_USER_CONCURRENCY,
+        AppConfig.RATE_LIMIT_MODEL_CONCURRENCY,
+        model_limits,
+        AppConfig.RATE_LIMIT_LEASE_SECONDS,
+        AppConfig.RATE_LIMIT_BUSY_RETRY_SECONDS
+    )
+
+
+completion_limiter = build_limiter()
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from config import AppConfig
+from logs import fields
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _Answering a repeated question from a stored completion instead of calling OpenAI again, e.g. many users
+         asking "summarize this PDF" about the same uploaded documents
+        _Exact matching only: the key hashes the model, the normalized system prompt, the document hash, the last
+         few history messages, the user message and the reasoning flag, so any difference is a miss
+        _Stored in a SQLite file shared by all workers, with a TTL and eviction of the least recently used entries
+         beyond RESPONSE_CACHE_MAX_ENTRIES / RESPONSE_CACHE_MAX_BYTES. Off unless RESPONSE_CACHE_ENABLED=true
+"""
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    return WHITESPACE.sub(" ", text or "").strip()
+
+
+class ResponseCache():
+    PRUNE_EVERY = 100 # Puts between two pruning passes
+
+    def __init__(self, enabled, db_path, ttl_seconds, max_entries, max_bytes, history_messages):
+        self.enabled = enabled
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.history_messages = history_messages
+        self.lock = threading.Lock()
+        self.db = None
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+
+    """explain: Cache key of a prepared request. `messages` is the OpenAI message list; only its system text, the last `history_messages` user/assistant messages and the final user message count."""
+    def key(self, model, system_prompt, document_hash, messages, user_message, use_reasoning, max_tokens):
+        history = [
+            [message["role"], normalize_text(message["content"])]
+            for message in messages[:-1] if message["role"] != "system"
+        ]
+        history = history[-self.history_messages:] if self.history_messages > 0 else []
+        material = json.dumps([
+            model, max_tokens, bool(use_reasoning), normalize_text(system_prompt), document_hash or "",
+            history, normalize_text(user_message)
+        ], ensure_ascii=False)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    """explain: Returns the stored {"reasoning", "response"} payload for a key, or None on a miss."""
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            db = self._connect()
+            if db is None:
+                return None
+            try:
+                with db:
+                    row = db.execute(
+                        "SELECT reasoning, response FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+                    ).fetchone()
+                    if row is not None:
+                        db.execute(
+                            "UPDATE response_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key)
+                        )
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.warning("Response cache read error", extra=fields(error=e))
+                return None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {"reasoning": row[0], "response": row[1]}
+
+    def put(self, key, model, reasoning, response):
+        now = time.time()
+        size = len((reasoning or "").encode()) + len(response.encode())
+        with self.lock:
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO response_cache "
+                        "(key, model, reasoning, response, size, created_at, last_used_at, expires_at, hits) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                        (key, model, reasoning, response, size, now, now, now + self.ttl_seconds)
+                    )
+                    self.stores += 1
+                    if self.stores % self.PRUNE_EVERY == 0:
+                        self._prune(db, now)
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.warning("Response cache write error", extra=fields(error=e))
+
+    """explain: Counts a turn that is never looked up (e.g. restaurant queries, which depend on location and live data)."""
+    def bypass(self):
+        with self.lock:
+            self.bypassed += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    """explain: Drops expired entries, then the least recently used ones until both the entry and byte limits hold."""
+    def _prune(self, db, now):
+        evicted = db.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,)).rowcount
+        evicted += db.execute(
+            "DELETE FROM response_cache WHERE key NOT IN "
+            "(SELECT key FROM response_cache ORDER BY last_used_at DESC LIMIT ?)", (self.max_entries,)
+        ).rowcount
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+        if total > self.max_bytes:
+            # Keep the most recently used entries whose running size stays within max_bytes
+            kept = 0
+            stale = []
+            for key, size in db.execute("SELECT key, size FROM response_cache ORDER BY last_used_at DESC"):
+                kept += size
+                if kept > self.max_bytes:
+                    stale.append((key,))
+            db.executemany("DELETE FROM response_cache WHERE key = ?", stale)
+            evicted += len(stale)
+        self.evictions += evicted
+
+    def _connect(self):
+        if self.db is None and self.enabled and self.db_path:
+            try:
+                # Guarded by self.lock; other workers share the file, so wait for their writes instead of failing
+                self.db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+                self.db.execute("PRAGMA journal_mode=WAL")
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, model TEXT NOT NULL, "
+                    "reasoning TEXT, response TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, "
+                    "last_used_at REAL NOT NULL, expires_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+                )
+                self.db.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_last_used_at ON response_cache (last_used_at)")
+            except sqlite3.Error as e:
+                logger.error("Response cache disabled, cannot open its database", extra=fields(path=self.db_path, error=e))
+                self.db = None
+                self.enabled = False
+        return self.db
+
+
+response_cache = ResponseCache(
+    AppConfig.RESPONSE_CACHE_ENABLED,
+    AppConfig.RESPONSE_CACHE_DB,
+    AppConfig.RESPONSE_CACHE_TTL_SECONDS,
+    AppConfig.RESPONSE_CACHE_MAX_ENTRIES,
+    AppConfig.RESPONSE_CACHE_MAX_BYTES,
+    AppConfig.RESPONSE_CACHE_HISTORY_MESSAGES
+)
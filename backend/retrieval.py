@@ -0,0 +1,206 @@
+import hashlib
+import heapq
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from app import db
+from config import AppConfig
+from context import count_tokens
+from models import Chat, Document, DocumentChunk
+
+"""
+    Used for :
+        _Splitting uploaded document text into overlapping chunks
+        _A local BM25 index over a chat's chunks, cached in-process per chat
+        _Retrieving the top-k chunks relevant to the current question
+        _Memoizing each chat's full document block (text, hash, token count) for the stable prompt prefix
+"""
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have how i if in into is it its me my of on or so
+    that the their there these this to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+"""explain: Splits text into windows of `chunk_words` words, each overlapping the previous one by `overlap_words`."""
+def chunk_text(text, chunk_words=None, overlap_words=None):
+    chunk_words = chunk_words or AppConfig.RETRIEVAL_CHUNK_WORDS
+    overlap_words = AppConfig.RETRIEVAL_CHUNK_OVERLAP if overlap_words is None else overlap_words
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, chunk_words - overlap_words)
+    last_start = max(len(words) - overlap_words, 1)
+    return [" ".join(words[start:start + chunk_words]) for start in range(0, last_start, step)]
+
+
+"""explain: Builds DocumentChunk rows for one uploaded file."""
+def build_chunks(chat_id, filename, text):
+    return [
+        DocumentChunk(chat_id=chat_id, filename=filename, seq=seq, content=content)
+        for seq, content in enumerate(chunk_text(text))
+    ]
+
+
+class BM25Index():
+    """
+    Used for :
+        _Okapi BM25 ranking over a fixed list of (key, text) documents, held as an inverted index
+    """
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.keys = []
+        self.postings = {}
+        doc_lengths = []
+        for idx, (key, text) in enumerate(documents):
+            term_counts = Counter(tokenize(text))
+            self.keys.append(key)
+            doc_lengths.append(sum(term_counts.values()))
+            for term, tf in term_counts.items():
+                self.postings.setdefault(term, []).append((idx, tf))
+
+        doc_count = len(self.keys)
+        avg_length = (sum(doc_lengths) / doc_count) if doc_count else 1
+        self.idf = {
+            term: math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+        self.length_norms = [k1 * (1 - b + b * length / (avg_length or 1)) for length in doc_lengths]
+
+    def __len__(self):
+        return len(self.keys)
+
+    """explain: Returns up to k (key, score) pairs for the query, best first."""
+    def search(self, query, k):
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf[term]
+            for idx, tf in posting:
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.length_norms[idx])
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.keys[idx], score) for idx, score in best]
+
+
+def documents_version(chat_id):
+    return db.session.query(Chat.documents_version).filter(Chat.id == chat_id).scalar()
+
+
+class ChunkIndexCache():
+    """
+    Used for :
+        _Keeping built BM25 indexes for the most recently used chats
+        _Rebuilding a chat's index when its chunk set changes (detected by chat.documents_version, which every
+         upload and removal bumps; chunk ids alone are reused by SQLite once the highest one is deleted)
+    """
+    def __init__(self, max_chats):
+        self.max_chats = max_chats
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    """explain: The chat's BM25 index, or None when the chat has no chunks."""
+    def get(self, chat_id):
+        version = documents_version(chat_id)
+        if version is None:
+            self.invalidate(chat_id)
+            return None
+
+        with self.lock:
+            cached = self.entries.get(chat_id)
+            if cached and cached[0] == version:
+                self.entries.move_to_end(chat_id)
+                return cached[1]
+
+        # Read after the version: a change committed in between only makes the next call rebuild again
+        rows = db.session.query(DocumentChunk.id, DocumentChunk.content).filter(DocumentChunk.chat_id == chat_id).all()
+        index = BM25Index(rows) if rows else None
+        with self.lock:
+            self.entries[chat_id] = (version, index)
+            self.entries.move_to_end(chat_id)
+            while len(self.entries) > self.max_chats:
+                self.entries.popitem(last=False)
+        return index
+
+    def invalidate(self, chat_id):
+        with self.lock:
+            self.entries.pop(chat_id, None)
+
+
+chunk_index_cache = ChunkIndexCache(AppConfig.RETRIEVAL_INDEX_CACHE_CHATS)
+
+
+class DocumentBlock():
+    def __init__(self, text, tokens, budget):
+        self.text = text
+        self.sha256 = hashlib.sha256(text.encode()).hexdigest()
+        self.tokens = tokens
+        self.fits = tokens <= budget # Whole document set fits the document budget
+
+
+class DocumentBlockCache():
+    """
+    Used for :
+        _Assembling a chat's documents into one block (and hashing and counting it) once per document set,
+         instead of re-concatenating every upload on each turn
+        _Rebuilding when the chat's documents change (detected by chat.documents_version) or the budget does
+    """
+    def __init__(self, max_chats):
+        self.max_chats = max_chats
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    """explain: The chat's document block for the given token budget, or None when the chat has no documents."""
+    def get(self, chat_id, budget):
+        version = documents_version(chat_id)
+        if version is None:
+            self.invalidate(chat_id)
+            return None
+        version = (version, budget)
+
+        with self.lock:
+            cached = self.entries.get(chat_id)
+            if cached and cached[0] == version:
+                self.entries.move_to_end(chat_id)
+                return cached[1]
+
+        # A few characters per token: enough text to tell whether the documents fit, without loading all of them
+        text = Document.assemble(chat_id, max_chars=budget * 8)
+        block = DocumentBlock(text, count_tokens(text), budget) if text else None
+        with self.lock:
+            self.entries[chat_id] = (version, block)
+            self.entries.move_to_end(chat_id)
+            while len(self.entries) > self.max_chats:
+                self.entries.popitem(last=False)
+        return block
+
+    def invalidate(self, chat_id):
+        with self.lock:
+            self.entries.pop(chat_id, None)
+
+
+document_block_cache = DocumentBlockCache(AppConfig.RETRIEVAL_INDEX_CACHE_CHATS)
+
+
+"""explain: Returns the chat's chunks most relevant to the query, best first. Empty if the chat has no chunks or nothing matches."""
+def retrieve_chunks(chat_id, query, k=None):
+    index = chunk_index_cache.get(chat_id)
+    if index is None:
+        return []
+    ranked_ids = [chunk_id for chunk_id, _ in index.search(query, k or AppConfig.RETRIEVAL_TOP_K)]
+    if not ranked_ids:
+        return []
+    chunks = {chunk.id: chunk for chunk in DocumentChunk.query.filter(DocumentChunk.id.in_(ranked_ids))}
+    return [chunks[chunk_id] for chunk_id in ranked_ids if chunk_id in chunks]
+
+
+"""explain: Formats retrieved chunks as document context for the system prompt."""
+def format_chunks(chunks):
+    return "\n\n".join(f"[From {chunk.filename}, excerpt {chunk.seq + 1}]\n{chunk.content}" for chunk in chunks)
@@ -0,0 +1,64 @@
+from datetime import datetime
+from typing import List, Optional, Union
+import msgspec
+from flask import Response
+
+"""
+    Used for :
+        _Typed msgspec Structs for what the chat API sends and receives, encoded straight to JSON bytes
+         (no intermediate dicts, no key sorting) and decoded with validation in the same pass
+        _Fields left UNSET are omitted from the output, so ?fields= selections serialize only what was asked for
+        _Typed decoders for the JSON stored in columns and cache files (tags, extracted page texts)
+"""
+
+
+class MessageOut(msgspec.Struct):
+    seq: int
+    role: str
+    content: str
+    reasoning: Union[Optional[str], msgspec.UnsetType] = msgspec.UNSET # Assistant messages only
+
+
+class ChatSummary(msgspec.Struct):
+    id: str
+    name: str
+    updated_at: Union[datetime, msgspec.UnsetType] = msgspec.UNSET
+
+
+class ChatDetail(msgspec.Struct):
+    id: Union[str, msgspec.UnsetType] = msgspec.UNSET
+    name: Union[str, msgspec.UnsetType] = msgspec.UNSET
+    messages: Union[List[MessageOut], msgspec.UnsetType] = msgspec.UNSET
+    has_more: Union[bool, msgspec.UnsetType] = msgspec.UNSET
+    next_before_seq: Union[Optional[int], msgspec.UnsetType] = msgspec.UNSET
+    next_after_seq: Union[Optional[int], msgspec.UnsetType] = msgspec.UNSET
+    pdf_text: Union[str, msgspec.UnsetType] = msgspec.UNSET
+    uploaded_pdfs: Union[List[str], msgspec.UnsetType] = msgspec.UNSET
+
+
+class RenameChat(msgspec.Struct):
+    name: str
+
+
+encoder = msgspec.json.Encoder()
+rename_decoder = msgspec.json.Decoder(RenameChat)
+string_list_decoder = msgspec.json.Decoder(List[str])
+
+
+def encode(data):
+    return encoder.encode(data)
+
+
+"""explain: Response with `data` (Structs, dicts, lists) encoded by msgspec; the replacement for jsonify on the larger payloads."""
+def json_response(data, status=200):
+    return Response(encoder.encode(data), status=status, mimetype="application/json")
+
+
+"""explain: Decodes a JSON list of strings from a column; None, empty or malformed values give []."""
+def decode_string_list(raw):
+    if not raw:
+        return []
+    try:
+        return string_list_decoder.decode(raw)
+    except msgspec.DecodeError:
+        return []
@@ -1,29 +1,117 @@
 from config import AppConfig
-import googlemaps # Add this import for Google Maps Places API
-from openai import OpenAI
+import threading
 from models import User,Chat
+from upstream import Upstream
+import logging
 import os
+
+logger = logging.getLogger(__name__)
 """
     Used for : 
         _Service Init with GGMap and OpenAI
+        _One registry of outbound clients per process, all built on the pooled, retrying httpx clients from upstream.py
 """
 class GoogleMapService: 
-    def __init__(self):
-        if not AppConfig.gmaps_api_key: 
-            print("Warning: GOOGLE_API_KEY not found in environment variables. Location features will be limited.")
-            self.gmaps = None
+    def __init__(self, upstream):
+        self.GOOGLE_MAPS_API_KEY = AppConfig.gmaps_api_key
+        if not self.GOOGLE_MAPS_API_KEY: 
+            logger.warning("GOOGLE_API_KEY not found in environment variables. Location features will be limited.")
+            self.http = None
         else: 
-            self.gmaps = googlemaps.Client(key = AppConfig.gmaps_api_key)
-            self.GOOGLE_MAPS_API_KEY = self.gmaps
-    def getGmaps(self):
-        return self.gmaps, self.GOOGLE_MAPS_API_KEY
-    
+            self.http = upstream.client(base_url=AppConfig.GOOGLE_MAPS_BASE_URL)
+
+    """explain: Calls the Places Nearby Search web service; returns the list of results (empty on ZERO_RESULTS)."""
+    def places_nearby(self, location, radius, type=None, keyword=None):
+        params = {"location": f"{location[0]},{location[1]}", "radius": radius, "key": self.GOOGLE_MAPS_API_KEY}
+        if type:
+            params["type"] = type
+        if keyword:
+            params["keyword"] = keyword
+        response = self.http.get("/maps/api/place/nearbysearch/json", params=params)
+        response.raise_for_status()
+        body = response.json()
+        if body.get("status") not in ("OK", "ZERO_RESULTS"):
+            raise RuntimeError(f"Places API error {body.get('status')}: {body.get('error_message', '')}")
+        return body.get("results", [])
+
 class OpenAiService: 
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=AppConfig.open_ai_key)
+    def __init__(self, upstream):
+        from openai import OpenAI # Deferred: the SDK is slow to import and only needed once a chat message arrives
+        # Retries are done by the transport (jittered backoff + circuit breaker), not by the SDK
+        self.openai_client = OpenAI(
+            api_key=AppConfig.open_ai_key,
+            base_url=AppConfig.OPENAI_BASE_URL,
+            http_client=upstream.client(),
+            timeout=upstream.timeout,
+            max_retries=0
+        )
     def getOpenAiClient(self): 
         return self.openai_client
 
+class ClientRegistry: 
+    """
+    Used for : 
+        _Lazily building each outbound client once per process and handing out the same instance everywhere
+        _reset() drops the clients while keeping the per-upstream breakers and metrics; it runs in every forked
+         worker, so connection pools are never shared with the parent (safe with a preloading WSGI server)
+    """
+    def __init__(self):
+        self.upstreams = {
+            "openai": Upstream(
+                "openai", AppConfig.OPENAI_CONNECT_TIMEOUT, AppConfig.OPENAI_READ_TIMEOUT, AppConfig.OPENAI_MAX_CONNECTIONS,
+                AppConfig.UPSTREAM_MAX_RETRIES, AppConfig.UPSTREAM_BACKOFF_BASE_SECONDS, AppConfig.UPSTREAM_BACKOFF_MAX_SECONDS,
+                AppConfig.CIRCUIT_BREAKER_FAILURES, AppConfig.CIRCUIT_BREAKER_RESET_SECONDS
+            ),
+            "google_maps": Upstream(
+                "google_maps", AppConfig.GOOGLE_MAPS_CONNECT_TIMEOUT, AppConfig.GOOGLE_MAPS_READ_TIMEOUT, AppConfig.GOOGLE_MAPS_MAX_CONNECTIONS,
+                AppConfig.UPSTREAM_MAX_RETRIES, AppConfig.UPSTREAM_BACKOFF_BASE_SECONDS, AppConfig.UPSTREAM_BACKOFF_MAX_SECONDS,
+                AppConfig.CIRCUIT_BREAKER_FAILURES, AppConfig.CIRCUIT_BREAKER_RESET_SECONDS
+            ),
+        }
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def _get(self, name, factory):
+        client = self.clients.get(name)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(name)
+                if client is None:
+                    client = self.clients[name] = factory()
+        return client
+
+    def openai(self):
+        return self._get("openai", lambda: OpenAiService(self.upstreams["openai"]).getOpenAiClient())
+
+    """explain: AsyncOpenAI client for the ASGI path. Its connections belong to the event loop that first uses it, i.e. the worker's serving loop."""
+    def async_openai(self):
+        from openai import AsyncOpenAI
+        upstream = self.upstreams["openai"]
+        return self._get("async_openai", lambda: AsyncOpenAI(
+            api_key=AppConfig.open_ai_key,
+            base_url=AppConfig.OPENAI_BASE_URL,
+            http_client=upstream.async_client(),
+            timeout=upstream.timeout,
+            max_retries=0
+        ))
+
+    def maps(self):
+        return self._get("google_maps", lambda: GoogleMapService(self.upstreams["google_maps"]))
+
+    def metrics(self):
+        return {
+            name: dict(upstream.metrics.snapshot(), circuit=upstream.breaker.state)
+            for name, upstream in self.upstreams.items()
+        }
+
+    def reset(self):
+        self.lock = threading.Lock() # Also replaces a lock that was held by another thread at fork time
+        self.clients = {}
+
+
+clients = ClientRegistry()
+os.register_at_fork(after_in_child=clients.reset)
+
 
 
 class initDB: 
@@ -33,19 +121,19 @@ class initDB:
     """explain: Initializes the database schema and creates a default admin user if one doesn't exist."""
     def init_db(self):
         with self.app.app_context():
-            print("Initializing database...")
+            logger.info("Initializing database...")
             try:
                 self.db.create_all()
                 if not User.query.filter_by(username='admin').first():
-                    print("Creating default admin user...")
+                    logger.info("Creating default admin user...")
                     admin_password = os.getenv('ADMIN_PASSWORD', 'Password@123')
                     admin = User(username='admin')
                     admin.set_password(admin_password)
                     self.db.session.add(admin)
                     self.db.session.commit()
-                    print("Default admin user created.")
+                    logger.info("Default admin user created.")
                 else:
-                    print("Admin user already exists.")
-                print("Database initialized successfully.")
-            except Exception as e:
-                print(f"Error during database initialization: {e}")
+                    logger.info("Admin user already exists.")
+                logger.info("Database initialized successfully.")
+            except Exception:
+                logger.exception("Error during database initialization")
@@ -0,0 +1,235 @@
+import contextlib
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+"""
+    Used for :
+        _Running the backend against a temporary SQLite database and a local stand-in for the OpenAI API
+        _The environment is set before any backend module is imported, since AppConfig reads it at import time
+"""
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+class StubOpenAI():
+    """
+    Used for :
+        _A local chat.completions endpoint: each request pops the next reply queued with reply(*chunks)
+        _Streamed requests get one chunked-transfer SSE frame per chunk, then a usage chunk and [DONE]
+        _Unstreamed requests get the chunks joined into one completion
+    """
+    def __init__(self):
+        self.replies = []
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, name="stub-openai", daemon=True).start()
+
+    def reply(self, *chunks):
+        with self.lock:
+            self.replies.append(list(chunks))
+
+    def reset(self):
+        with self.lock:
+            self.replies.clear()
+            self.requests.clear()
+
+    def _next(self, body):
+        with self.lock:
+            self.requests.append(body)
+            return self.replies.pop(0) if self.replies else ["ok"]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                chunks = stub._next(body)
+                usage = {"prompt_tokens": 10, "completion_tokens": len(chunks), "total_tokens": 10 + len(chunks)}
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for text in chunks:
+                        self._chunk({"choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]})
+                    self._chunk({"choices": [], "usage": usage})
+                    self._write(b"data: [DONE]\n\n")
+                    self._write(b"")
+                    return
+                payload = json.dumps({
+                    "id": "stub", "object": "chat.completion", "created": 0, "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(chunks)}, "finish_reason": "stop"}],
+                    "usage": usage,
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _chunk(self, data):
+                data = dict(id="stub", object="chat.completion.chunk", created=0, model="stub", **data)
+                self._write(f"data: {json.dumps(data)}\n\n".encode())
+
+            def _write(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+TMP_DIR = tempfile.mkdtemp(prefix="merlin-tests-")
+DB_PATH = os.path.join(TMP_DIR, "site.db")
+stub = StubOpenAI()
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{DB_PATH}",
+    OPENAI_API_KEY="test-key",
+    OPENAI_BASE_URL=stub.base_url,
+    UPLOAD_SPOOL_DIR=os.path.join(TMP_DIR, "upload_spool"),
+    PDF_CACHE_DIR=os.path.join(TMP_DIR, "pdf_cache"),
+    RESPONSE_CACHE_DB=os.path.join(TMP_DIR, "response_cache.db"),
+    RATE_LIMIT_DB=os.path.join(TMP_DIR, "rate_limits.db"),
+    RATE_LIMIT_PER_MINUTE="0",
+    RATE_LIMIT_USER_CONCURRENCY="0",
+    RATE_LIMIT_MODEL_CONCURRENCY="0",
+    PDF_EXTRACTION_WORKERS="1",
+    PDF_JOB_POLL_SECONDS="0.2",
+    LOG_LEVEL="WARNING",
+)
+
+
+"""explain: Splits server-sent event frames into (event, decoded data) pairs."""
+def parse_sse(frames):
+    events = []
+    for frame in "".join(frames).split("\n\n"):
+        if not frame.strip():
+            continue
+        fields = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+"""explain: (role, content, reasoning) rows of a chat, read outside the app's session as another worker would see them."""
+def stored_messages(chat_id):
+    with sqlite3.connect(DB_PATH) as conn:
+        return conn.execute(
+            "SELECT role, content, reasoning FROM message WHERE chat_id = ? ORDER BY seq", (chat_id,)
+        ).fetchall()
+
+
+"""explain: A minimal PDF with one line of Helvetica text per page, readable by PyPDF2."""
+def make_pdf(*pages):
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+"""explain: Uploads one PDF through the API and waits for its extraction job to finish; returns the final job status."""
+def upload_pdf(client, auth_headers, chat_id, filename, *pages, timeout=60):
+    response = client.post(
+        f"/api/chats/{chat_id}/upload-pdfs",
+        data={"pdfs": (io.BytesIO(make_pdf(*pages)), filename)},
+        headers=auth_headers,
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 202, response.get_json()
+    return wait_for_job(client, auth_headers, response.get_json()["status_url"], timeout)
+
+
+def wait_for_job(client, auth_headers, status_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(status_url, headers=auth_headers).get_json()
+        if job["status"] not in ("queued", "processing") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+"""explain: Records the SQL statements the app runs while the block executes; user_selects() keeps the reads of the user table."""
+@contextlib.contextmanager
+def recorded_queries(app):
+    from sqlalchemy import event
+    from app import db
+    with app.app_context():
+        engine = db.engine
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def user_selects(statements):
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT") and re.search(r'\bFROM "?user"?(\s|$)', s)]
+
+
+@pytest.fixture(scope="session")
+def app():
+    from main import app as flask_app
+    from app import db
+    from service import initDB
+    initDB(db, flask_app).init_db()
+    return flask_app
+
+
+@pytest.fixture
+def stub_openai():
+    stub.reset()
+    yield stub
+    stub.reset()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    response = client.post("/api/login", json={"username": "admin", "password": os.getenv("ADMIN_PASSWORD", "Password@123")})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+
+@pytest.fixture
+def chat_id(client, auth_headers):
+    response = client.post("/api/chats", headers=auth_headers)
+    assert response.status_code == 201
+    return response.get_json()["id"]
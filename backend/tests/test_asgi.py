@@ -0,0 +1,66 @@
+import asyncio
+import httpx
+import pytest
+from asgi import ChatAsgiApp
+from service import clients
+from conftest import parse_sse, stored_messages
+
+
+@pytest.fixture
+def asgi_app(app):
+    chat_app = ChatAsgiApp(app)
+    yield chat_app
+    clients.clients.pop("async_openai", None) # Its connections belong to the test's event loop
+    chat_app.db_executor.shutdown(wait=True)
+
+
+def request(asgi_app, method, path, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+
+def test_asgi_answers_messages_with_the_async_client(asgi_app, auth_headers, chat_id, stub_openai):
+    stub_openai.reply("Hello ", "there.")
+
+    response = request(asgi_app, "POST", f"/api/chats/{chat_id}/messages", data={"message": "hi"}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.json() == {"reasoning": None, "response": "Hello there."}
+    assert stub_openai.requests[-1].get("stream") is None
+    assert stored_messages(chat_id) == [("user", "hi", None), ("assistant", "Hello there.", None)]
+
+
+def test_asgi_streams_messages_as_sse(asgi_app, auth_headers, chat_id, stub_openai):
+    stub_openai.reply("<reasoning>Why", "</reasoning><answer>Be", "cause.</answer>")
+
+    response = request(
+        asgi_app, "POST", f"/api/chats/{chat_id}/messages",
+        data={"message": "why?", "stream": "true", "use_reasoning": "true"}, headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse([response.text])
+    assert events[-1] == ("done", {"reasoning": "Why", "response": "Because."})
+    assert stored_messages(chat_id)[-1] == ("assistant", "Because.", "Why")
+
+
+def test_asgi_rejects_unauthenticated_messages(asgi_app, chat_id, stub_openai):
+    response = request(asgi_app, "POST", f"/api/chats/{chat_id}/messages", data={"message": "hi"})
+
+    assert response.status_code == 401
+    assert stub_openai.requests == []
+
+
+def test_asgi_hands_other_routes_to_flask(asgi_app, auth_headers, chat_id):
+    listed = request(asgi_app, "GET", "/api/chats", headers=auth_headers)
+    renamed = request(asgi_app, "PUT", f"/api/chats/{chat_id}", json={"name": "Through ASGI"}, headers=auth_headers)
+    detail = request(asgi_app, "GET", f"/api/chats/{chat_id}?fields=name", headers=auth_headers)
+
+    assert listed.status_code == 200
+    assert chat_id in [chat["id"] for chat in listed.json()]
+    assert renamed.status_code == 200
+    assert detail.json() == {"name": "Through ASGI"}
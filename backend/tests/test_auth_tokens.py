@@ -0,0 +1,115 @@
+import sqlite3
+import time
+import uuid
+import jwt
+import pytest
+from config import AppConfig
+from tokens import check_settings
+from conftest import DB_PATH, recorded_queries, user_selects
+
+
+def forge(secret, sub="1", token_type="access"):
+    now = int(time.time())
+    claims = {"sub": sub, "type": token_type, "jti": uuid.uuid4().hex, "iat": now, "exp": now + 600}
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def jwt_mode(monkeypatch):
+    monkeypatch.setattr(AppConfig, "AUTH_TOKEN_MODE", "jwt")
+    monkeypatch.setattr(AppConfig, "JWT_SECRET_KEY", "test-only-jwt-secret-0123456789abcdef")
+
+
+def login(client):
+    response = client.post("/api/login", json={"username": "admin", "password": "Password@123"})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_opaque_mode_rejects_signed_tokens(client):
+    token = forge(AppConfig.DEFAULT_SECRET_KEY)
+
+    assert client.get("/api/chats", headers=bearer(token)).status_code == 401
+    assert client.get("/api/check-login", headers=bearer(token)).status_code == 401
+
+
+def test_opaque_mode_has_no_token_refresh(client):
+    response = client.post("/api/token/refresh", json={"refresh_token": forge(AppConfig.DEFAULT_SECRET_KEY, token_type="refresh")})
+
+    assert response.status_code == 404
+    assert "token" not in response.get_json()
+
+
+def test_jwt_mode_accepts_its_own_tokens(client, jwt_mode):
+    tokens = login(client)
+
+    assert client.get("/api/chats", headers=bearer(tokens["token"])).status_code == 200
+
+    refreshed = client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert refreshed.status_code == 200
+    assert client.get("/api/chats", headers=bearer(refreshed.get_json()["token"])).status_code == 200
+    # Rotation: a refresh token works once
+    assert client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_jwt_mode_rejects_tokens_signed_with_another_key(client, jwt_mode):
+    assert client.get("/api/chats", headers=bearer(forge(AppConfig.DEFAULT_SECRET_KEY))).status_code == 401
+    response = client.post("/api/token/refresh", json={"refresh_token": forge(AppConfig.DEFAULT_SECRET_KEY, token_type="refresh")})
+    assert response.status_code == 401
+
+
+def test_jwt_mode_verifies_access_tokens_without_reading_the_user(app, client, jwt_mode):
+    headers = bearer(login(client)["token"])
+    client.get("/api/check-login", headers=headers) # Loads the revocation list
+
+    with recorded_queries(app) as statements:
+        assert client.get("/api/check-login", headers=headers).status_code == 200
+        assert client.get("/api/chats", headers=headers).status_code == 200
+
+    assert user_selects(statements) == []
+
+
+def test_jwt_mode_user_can_update_its_location(client, jwt_mode):
+    headers = bearer(login(client)["token"])
+
+    response = client.put("/api/users/location", json={"latitude": 1.5, "longitude": 2.5}, headers=headers)
+
+    assert response.status_code == 200
+    with sqlite3.connect(DB_PATH) as conn:
+        assert conn.execute("SELECT latitude, longitude FROM user WHERE username = 'admin'").fetchone() == (1.5, 2.5)
+
+
+def test_jwt_mode_rejects_revoked_access_tokens(client, jwt_mode):
+    tokens = login(client)
+    headers = bearer(tokens["token"])
+
+    assert client.post("/api/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers).status_code == 200
+
+    assert client.get("/api/chats", headers=headers).status_code == 401
+    assert client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_jwt_mode_does_not_refresh_tokens_of_unknown_users(client, jwt_mode):
+    response = client.post("/api/token/refresh", json={"refresh_token": forge(AppConfig.JWT_SECRET_KEY, sub="987654", token_type="refresh")})
+
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize("secret", [None, "", AppConfig.DEFAULT_SECRET_KEY])
+def test_jwt_mode_refuses_to_start_without_a_private_secret(monkeypatch, secret):
+    monkeypatch.setattr(AppConfig, "AUTH_TOKEN_MODE", "jwt")
+    monkeypatch.setattr(AppConfig, "JWT_SECRET_KEY", secret)
+
+    with pytest.raises(RuntimeError):
+        check_settings()
+
+
+def test_settings_check_accepts_opaque_mode_and_a_private_jwt_secret(monkeypatch, jwt_mode):
+    check_settings()
+    monkeypatch.setattr(AppConfig, "AUTH_TOKEN_MODE", "opaque")
+    monkeypatch.setattr(AppConfig, "JWT_SECRET_KEY", None)
+    check_settings()
@@ -0,0 +1,86 @@
+import sqlite3
+from app import db
+from config import AppConfig
+from models import Message
+from conftest import DB_PATH, stored_messages, upload_pdf
+
+
+def add_messages(app, chat_id, count):
+    with app.app_context():
+        db.session.add_all(
+            Message(chat_id=chat_id, seq=seq, role="user" if seq % 2 == 0 else "assistant", content=f"message {seq}")
+            for seq in range(count)
+        )
+        db.session.commit()
+
+
+def test_detail_without_paging_returns_the_whole_history(app, client, auth_headers, chat_id):
+    count = AppConfig.MESSAGE_PAGE_SIZE + 10
+    add_messages(app, chat_id, count)
+
+    data = client.get(f"/api/chats/{chat_id}", headers=auth_headers).get_json()
+
+    assert [m["content"] for m in data["messages"]] == [f"message {seq}" for seq in range(count)]
+    assert data["has_more"] is False
+    assert data["next_before_seq"] is None
+    assert data["next_after_seq"] == count - 1
+
+
+def test_detail_pages_backwards_when_asked(app, client, auth_headers, chat_id):
+    add_messages(app, chat_id, 25)
+
+    first = client.get(f"/api/chats/{chat_id}?fields=messages&limit=10", headers=auth_headers).get_json()
+    older = client.get(
+        f"/api/chats/{chat_id}?fields=messages&limit=10&before_seq={first['next_before_seq']}", headers=auth_headers
+    ).get_json()
+    oldest = client.get(
+        f"/api/chats/{chat_id}?fields=messages&limit=10&before_seq={older['next_before_seq']}", headers=auth_headers
+    ).get_json()
+
+    assert [m["seq"] for m in first["messages"]] == list(range(15, 25))
+    assert [m["seq"] for m in older["messages"]] == list(range(5, 15))
+    assert [m["seq"] for m in oldest["messages"]] == list(range(0, 5))
+    assert (first["has_more"], older["has_more"], oldest["has_more"]) == (True, True, False)
+
+
+def test_detail_after_seq_returns_only_newer_messages(app, client, auth_headers, chat_id):
+    add_messages(app, chat_id, 6)
+
+    data = client.get(f"/api/chats/{chat_id}?fields=messages&after_seq=3", headers=auth_headers).get_json()
+
+    assert [m["seq"] for m in data["messages"]] == [4, 5]
+    assert data["next_after_seq"] == 5
+
+
+def test_etag_changes_after_a_remove_then_upload(client, auth_headers, chat_id):
+    url = f"/api/chats/{chat_id}?fields=uploaded_pdfs"
+    upload_pdf(client, auth_headers, chat_id, "a.pdf", "alpha apples")
+    upload_pdf(client, auth_headers, chat_id, "b.pdf", "SECRET bravo")
+    first = client.get(url, headers=auth_headers)
+    assert first.get_json()["uploaded_pdfs"] == ["a.pdf", "b.pdf"]
+    conditional = {**auth_headers, "If-None-Match": first.headers["ETag"]}
+    assert client.get(url, headers=conditional).status_code == 304
+
+    client.post(f"/api/chats/{chat_id}/remove-pdf", json={"pdf_name": "b.pdf"}, headers=auth_headers)
+    upload_pdf(client, auth_headers, chat_id, "c.pdf", "charlie cherries") # Gets b.pdf's document id
+
+    again = client.get(url, headers=conditional)
+    assert again.status_code == 200
+    assert again.get_json()["uploaded_pdfs"] == ["a.pdf", "c.pdf"]
+
+
+def test_each_turn_appends_two_rows_and_leaves_the_legacy_column_alone(client, auth_headers, chat_id, stub_openai):
+    stub_openai.reply("first answer")
+    stub_openai.reply("second answer")
+
+    for message in ("first question", "second question"):
+        response = client.post(f"/api/chats/{chat_id}/messages", data={"message": message}, headers=auth_headers)
+        assert response.status_code == 200
+
+    assert stored_messages(chat_id) == [
+        ("user", "first question", None), ("assistant", "first answer", None),
+        ("user", "second question", None), ("assistant", "second answer", None),
+    ]
+    with sqlite3.connect(DB_PATH) as conn:
+        assert conn.execute("SELECT seq FROM message WHERE chat_id = ? ORDER BY seq", (chat_id,)).fetchall() == [(0,), (1,), (2,), (3,)]
+        assert conn.execute("SELECT messages FROM chat WHERE id = ?", (chat_id,)).fetchone()[0] in (None, "[]")
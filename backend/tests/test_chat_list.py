@@ -0,0 +1,38 @@
+from app import db
+from config import AppConfig
+from models import Chat, User
+
+
+def add_chats(app, count):
+    with app.app_context():
+        user = User.query.filter_by(username="admin").one()
+        ids = [f"list-{len(Chat.query.all())}-{n}" for n in range(count)]
+        db.session.add_all(Chat(id=chat_id, user_id=user.id, name=chat_id) for chat_id in ids)
+        db.session.commit()
+        return ids
+
+
+def test_list_without_paging_returns_every_chat(app, client, auth_headers):
+    ids = add_chats(app, AppConfig.CHAT_PAGE_SIZE + 5)
+
+    response = client.get("/api/chats", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert set(ids) <= {chat["id"] for chat in response.get_json()}
+    assert "X-Next-Before" not in response.headers
+
+
+def test_list_pages_follow_the_cursor(app, client, auth_headers):
+    add_chats(app, 25)
+    everything = [chat["id"] for chat in client.get("/api/chats", headers=auth_headers).get_json()]
+
+    paged, url = [], "/api/chats?limit=10"
+    while url:
+        response = client.get(url, headers=auth_headers)
+        page = [chat["id"] for chat in response.get_json()]
+        assert len(page) <= 10
+        paged += page
+        cursor = response.headers.get("X-Next-Before")
+        url = f"/api/chats?limit=10&before={cursor}" if cursor else None
+
+    assert paged == everything
@@ -0,0 +1,85 @@
+from context import ContextBuilder, MESSAGE_OVERHEAD_TOKENS, count_tokens, truncate_to_tokens
+
+
+"""explain: `count` question/answer turns, newest first as the message table is read."""
+def turns(count):
+    history = []
+    for n in range(count):
+        history.append({"role": "user", "content": f"question {n} about topic {n}"})
+        history.append({"role": "assistant", "content": f"answer {n} " + "detail " * 20})
+    return history[::-1]
+
+
+def cost(msg):
+    return count_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_history_that_fits_is_replayed_in_order():
+    history = turns(3)
+
+    messages, stats = ContextBuilder(history_budget=10000).build("system", history, "next question")
+
+    assert messages[0] == {"role": "system", "content": "system"}
+    assert messages[1:-1] == history[::-1]
+    assert messages[-1] == {"role": "user", "content": "next question"}
+    assert (stats["history_messages"], stats["omitted_messages"], stats["summary_tokens"]) == (6, 0, 0)
+    assert stats["total_tokens"] == stats["system_tokens"] + stats["history_tokens"] + stats["user_tokens"]
+
+
+def test_older_turns_are_summarized_when_the_budget_runs_out():
+    history = turns(10)
+    user_tokens = count_tokens("next question") + MESSAGE_OVERHEAD_TOKENS
+    # Room for the newest turn and the assistant reply before it: that reply would be orphaned
+    budget = user_tokens + sum(cost(msg) for msg in history[:3])
+
+    messages, stats = ContextBuilder(history_budget=budget, summary_messages=3).build("system", history, "next question")
+
+    assert messages[2:-1] == [history[1], history[0]]
+    assert messages[1]["role"] == "system"
+    assert messages[1]["content"].endswith("- question 6 about topic 6\n- question 7 about topic 7\n- question 8 about topic 8")
+    assert stats["history_messages"] == 2
+    assert stats["history_tokens"] + stats["user_tokens"] <= budget
+
+
+def test_history_is_read_lazily():
+    read = []
+    def history():
+        for msg in turns(500):
+            read.append(msg)
+            yield msg
+
+    ContextBuilder(history_budget=200, summary_messages=2).build("system", history(), "next question")
+
+    assert len(read) < 20
+
+
+def test_suffix_goes_right_before_the_user_message_and_keeps_the_prefix():
+    builder = ContextBuilder(history_budget=10000)
+    plain, _ = builder.build("system", turns(1), "next question")
+    with_suffix, stats = builder.build("system", turns(1), "next question", suffix="use the documents")
+
+    assert with_suffix[:-2] == plain[:-1]
+    assert with_suffix[-2] == {"role": "system", "content": "use the documents"}
+    assert stats["prefix_tokens"] == count_tokens("system") + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_documents_are_capped_to_their_budget():
+    text = "word " * 5000
+
+    documents, tokens = ContextBuilder(document_budget=100).build_documents(text)
+
+    assert documents.startswith("word word")
+    assert documents.endswith("[Document context truncated to fit the context window]")
+    assert tokens < 150
+    assert ContextBuilder(document_budget=100).build_documents("short text") == ("short text", count_tokens("short text"))
+
+
+def test_truncation_keeps_the_beginning_within_budget():
+    text = " ".join(f"token{n}" for n in range(1000))
+
+    cut = truncate_to_tokens(text, 50)
+
+    assert text.startswith(cut)
+    assert 0 < count_tokens(cut) <= 50
+    assert truncate_to_tokens(text, 0) == ""
+    assert truncate_to_tokens("short", 50) == "short"
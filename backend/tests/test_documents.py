@@ -0,0 +1,42 @@
+import hashlib
+import sqlite3
+from conftest import DB_PATH, make_pdf, upload_pdf
+
+
+def rows(query, *params):
+    with sqlite3.connect(DB_PATH) as conn:
+        return conn.execute(query, params).fetchall()
+
+
+def test_upload_stores_one_document_row(client, auth_headers, chat_id):
+    upload_pdf(client, auth_headers, chat_id, "notes.pdf", "first page", "second page")
+
+    [(sha256, page_count, byte_size, text)] = rows(
+        "SELECT sha256, page_count, byte_size, text FROM document WHERE chat_id = ? AND filename = 'notes.pdf'", chat_id
+    )
+    pdf = make_pdf("first page", "second page")
+    assert (sha256, page_count, byte_size) == (hashlib.sha256(pdf).hexdigest(), 2, len(pdf))
+    assert text.split() == ["first", "page", "second", "page"]
+    assert client.get(f"/api/chats/{chat_id}", headers=auth_headers).get_json()["uploaded_pdfs"] == ["notes.pdf"]
+
+
+def test_remove_deletes_the_document_and_its_chunks(client, auth_headers, chat_id):
+    upload_pdf(client, auth_headers, chat_id, "keep.pdf", "kept text")
+    upload_pdf(client, auth_headers, chat_id, "drop.pdf", "dropped text")
+
+    response = client.post(f"/api/chats/{chat_id}/remove-pdf", json={"pdf_name": "drop.pdf"}, headers=auth_headers)
+    missing = client.post(f"/api/chats/{chat_id}/remove-pdf", json={"pdf_name": "drop.pdf"}, headers=auth_headers)
+
+    assert (response.status_code, missing.status_code) == (200, 404)
+    assert rows("SELECT filename FROM document WHERE chat_id = ?", chat_id) == [("keep.pdf",)]
+    assert rows("SELECT DISTINCT filename FROM document_chunk WHERE chat_id = ?", chat_id) == [("keep.pdf",)]
+
+
+def test_deleting_a_chat_deletes_its_documents_chunks_and_messages(client, auth_headers, chat_id, stub_openai):
+    upload_pdf(client, auth_headers, chat_id, "notes.pdf", "some text")
+    client.post(f"/api/chats/{chat_id}/messages", data={"message": "hello"}, headers=auth_headers)
+
+    assert client.delete(f"/api/chats/{chat_id}", headers=auth_headers).status_code == 200
+
+    for table in ("document", "document_chunk", "message"):
+        assert rows(f"SELECT COUNT(*) FROM {table} WHERE chat_id = ?", chat_id) == [(0,)]
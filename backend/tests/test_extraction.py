@@ -0,0 +1,73 @@
+import hashlib
+import os
+from extraction import ExtractionCache, count_pages, extract_pages, file_sha256
+from metrics import pdf_pages_total
+from conftest import make_pdf, upload_pdf
+
+
+def cached_pages():
+    return pdf_pages_total.values.get(("cache",), 0)
+
+
+def test_pdf_pages_are_counted_and_extracted_by_range(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf("page one", "page two", "page three"))
+
+    assert count_pages(str(path)) == 3
+    assert [text.strip() for text in extract_pages(str(path), 1, 3)] == ["page two", "page three"]
+    assert file_sha256(str(path), block_size=7) == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_cache_returns_what_was_put(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+
+    assert cache.get("abc") is None
+    cache.put("abc", ["first page", ""])
+    assert cache.get("abc") == ["first page", ""]
+
+
+def test_unreadable_entries_are_misses(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=1024 * 1024)
+    (tmp_path / "abc.json").write_text('{"not": "a page list"}')
+    (tmp_path / "def.json").write_text("[truncated")
+
+    assert cache.get("abc") is None
+    assert cache.get("def") is None
+
+
+def test_zero_max_bytes_disables_the_cache(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache"), max_bytes=0)
+
+    cache.put("abc", ["text"])
+
+    assert cache.get("abc") is None
+    assert not os.path.exists(tmp_path / "cache")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=250) # Room for two 104-byte entries
+    cache.put("read", ["x" * 100])
+    cache.put("unread", ["x" * 100])
+    os.utime(tmp_path / "read.json", (1000, 1000))
+    os.utime(tmp_path / "unread.json", (2000, 2000))
+    assert cache.get("read") is not None # Marks it as recently used
+
+    cache.put("new", ["x" * 100])
+
+    assert sorted(os.listdir(tmp_path)) == ["new.json", "read.json"]
+
+
+def test_reupload_of_the_same_pdf_is_served_from_the_cache(client, auth_headers, chat_id):
+    other_chat = client.post("/api/chats", headers=auth_headers).get_json()["id"]
+    before = cached_pages()
+
+    first = upload_pdf(client, auth_headers, chat_id, "report.pdf", "cached once", "then reused")
+    again = upload_pdf(client, auth_headers, other_chat, "copy.pdf", "cached once", "then reused")
+
+    assert first["status"] == again["status"] == "done"
+    assert cached_pages() - before == 2
+    names = [
+        client.get(f"/api/chats/{chat}", headers=auth_headers).get_json()["uploaded_pdfs"]
+        for chat in (chat_id, other_chat)
+    ]
+    assert names == [["report.pdf"], ["copy.pdf"]]
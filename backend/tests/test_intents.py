@@ -0,0 +1,68 @@
+import json
+import pytest
+from intents import IntentRouter, inflections, intent_router
+
+
+@pytest.mark.parametrize("message, cuisines", [
+    ("Any good burgers around?", ["burger"]),
+    ("We want pizzas tonight", ["pizza"]),
+    ("Bakeries or desserts?", ["bakery", "dessert"]),
+    ("A sandwich, please", ["sandwiches"]),
+    ("Pizza's fine, so is sushi", ["pizza", "sushi"]),
+    ("Gluten free or gluten-free", ["gluten-free"]),
+    ("Two South Americans", ["south american", "american"]),
+])
+def test_plural_and_singular_forms_match_the_configured_keyword(message, cuisines):
+    assert intent_router.match(message).get("cuisine") == cuisines
+
+
+@pytest.mark.parametrize("message", [
+    "That was a great phone call",
+    "The pizzeria report is done",
+    "Please feature the steakhouse photos",
+])
+def test_keywords_inside_other_words_do_not_match(message):
+    assert intent_router.match(message) == {}
+
+
+def test_restaurant_intent_needs_a_food_word_and_a_find_phrase():
+    assert intent_router.analyze("Where can I eat burgers?").has("restaurant")
+    assert intent_router.analyze("I want to eat").has("restaurant") # "want to eat" and "eat" overlap
+    assert not intent_router.analyze("Where is the great report?").has("restaurant")
+    assert not intent_router.analyze("I had dinner yesterday").has("restaurant")
+
+
+def test_keywords_come_in_message_order_without_duplicates():
+    analysis = intent_router.analyze("Thai, then pizzas, then pizza again, then Thai near me")
+
+    assert analysis.get("cuisine") == ["thai", "pizza"]
+    assert analysis.get("find") == ["near me"]
+    assert analysis.get("food") == []
+
+
+def test_inflections_go_both_ways():
+    assert inflections("burger") == ["burgers"]
+    assert inflections("bakery") == ["bakeries"]
+    assert inflections("sandwiches") == ["sandwich"]
+    assert inflections("brunch") == ["brunches"]
+    assert inflections("bbq") == ["bbqs"]
+
+
+def test_config_file_adds_keyword_sets_and_intents(tmp_path):
+    path = tmp_path / "intents.json"
+    path.write_text(json.dumps({
+        "keyword_sets": {"weather": ["forecast", "rain"], "when": ["tomorrow"]},
+        "intents": {"weather": {"requires": ["weather", "when"]}},
+    }))
+
+    router = IntentRouter.from_config(str(path))
+
+    assert router.analyze("Forecasts for tomorrow?").intents == ["weather"]
+    assert router.analyze("Where can I eat?").has("restaurant")
+
+
+def test_unreadable_config_falls_back_to_the_defaults(tmp_path):
+    path = tmp_path / "intents.json"
+    path.write_text("{not json")
+
+    assert IntentRouter.from_config(str(path)).analyze("Where can I eat?").has("restaurant")
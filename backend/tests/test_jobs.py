@@ -0,0 +1,81 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import uuid
+from conftest import make_pdf, upload_pdf, wait_for_job
+
+
+def test_upload_job_reports_each_file_until_done(client, auth_headers, chat_id):
+    job = upload_pdf(client, auth_headers, chat_id, "report.pdf", "page one", "page two", "page three")
+
+    assert job["status"] == "done"
+    assert job["files"] == [{"filename": "report.pdf", "status": "done", "pages_total": 3, "pages_done": 3, "error": None}]
+    detail = client.get(f"/api/chats/{chat_id}?fields=uploaded_pdfs,pdf_text", headers=auth_headers).get_json()
+    assert detail["uploaded_pdfs"] == ["report.pdf"]
+    assert "page two" in detail["pdf_text"]
+
+
+def test_upload_job_fails_a_file_without_text(client, auth_headers, chat_id):
+    job = upload_pdf(client, auth_headers, chat_id, "blank.pdf", "")
+
+    assert job["status"] == "failed"
+    assert "Could not extract text" in job["files"][0]["error"]
+
+
+def test_upload_rejects_a_name_already_in_the_chat(client, auth_headers, chat_id):
+    upload_pdf(client, auth_headers, chat_id, "same.pdf", "first")
+    upload_pdf_again = client.post(
+        f"/api/chats/{chat_id}/upload-pdfs",
+        data={"pdfs": (io.BytesIO(make_pdf("second")), "same.pdf")},
+        headers=auth_headers, content_type="multipart/form-data",
+    )
+
+    assert upload_pdf_again.status_code == 400
+    assert "already uploaded" in upload_pdf_again.get_json()["error"]
+
+
+def serve_a_job_left_queued(results):
+    # A fresh process on its own database: the job is queued before the process has a worker thread
+    tmp_dir = tempfile.mkdtemp(prefix="merlin-jobs-")
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'site.db')}",
+        UPLOAD_SPOOL_DIR=os.path.join(tmp_dir, "upload_spool"),
+        PDF_CACHE_DIR=os.path.join(tmp_dir, "pdf_cache"),
+    )
+    from main import app
+    from app import db
+    from jobs import extraction_queue, spool_path
+    from models import Chat, UploadJob, UploadJobFile, User
+    from service import initDB
+    initDB(db, app).init_db()
+    with app.app_context():
+        chat = Chat(id=str(uuid.uuid4()), user_id=User.query.filter_by(username="admin").one().id)
+        job = UploadJob(chat_id=chat.id)
+        job_file = UploadJobFile(job=job, chat_id=chat.id, filename="left.pdf", status="queued")
+        db.session.add_all([chat, job, job_file])
+        db.session.commit()
+        os.makedirs(os.path.dirname(spool_path(job_file.id)), exist_ok=True)
+        with open(spool_path(job_file.id), "wb") as f:
+            f.write(make_pdf("left over from the previous process"))
+        status_url = f"/api/chats/{chat.id}/upload-jobs/{job.id}"
+    started_before = extraction_queue.thread is not None
+
+    client = app.test_client()
+    token = client.post("/api/login", json={"username": "admin", "password": "Password@123"}).get_json()["token"]
+    job = wait_for_job(client, {"Authorization": f"Bearer {token}"}, status_url, timeout=30) # Only polls
+    if extraction_queue.executor is not None:
+        extraction_queue.executor.shutdown() # Its pool processes would otherwise keep this process from exiting
+    results.put((started_before, job["status"]))
+
+
+def test_job_queued_before_the_worker_started_is_processed(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=serve_a_job_left_queued, args=(results,))
+    process.start()
+    started_before, status = results.get(timeout=90)
+    process.join(timeout=30)
+
+    assert started_before is False
+    assert status == "done"
@@ -0,0 +1,30 @@
+import json
+import logging
+from logs import JsonFormatter, KeyValueFormatter, fields
+
+
+def make_record(msg="sent %s", args=("reply",), **extra):
+    record = logging.LogRecord("chats", logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_text_format_renders_time_request_id_and_fields():
+    record = make_record(request_id="abc123", fields={"chat_id": "c1", "note": "two words"})
+
+    line = KeyValueFormatter().format(record)
+
+    assert line.startswith(logging.Formatter().formatTime(record))
+    assert line.endswith(' INFO chats [abc123] sent reply chat_id=c1 note="two words"')
+
+
+def test_text_format_accepts_records_without_a_request_id():
+    line = KeyValueFormatter().format(make_record())
+
+    assert line.endswith(" INFO chats [-] sent reply")
+
+
+def test_json_format_keeps_fields_at_top_level():
+    entry = json.loads(JsonFormatter().format(make_record(request_id="abc123", fields={"chat_id": "c1"})))
+
+    assert (entry["message"], entry["request_id"], entry["chat_id"]) == ("sent reply", "abc123", "c1")
@@ -0,0 +1,90 @@
+import metrics
+from config import AppConfig
+from metrics import Counter, Histogram, MetricsRegistry, stage_seconds, timed, tokens_total
+
+
+def count(histogram, *key):
+    series = histogram.values.get(key)
+    return series[-1] if series else 0
+
+
+def test_counter_renders_one_escaped_sample_per_label_set():
+    counter = Counter("merlin_test_total", "Test counter", ("kind",))
+    counter.inc(kind="a")
+    counter.inc(2, kind="a")
+    counter.inc(kind='say "hi"\n')
+
+    assert counter.render() == [
+        "# HELP merlin_test_total Test counter",
+        "# TYPE merlin_test_total counter",
+        'merlin_test_total{kind="a"} 3',
+        'merlin_test_total{kind="say \\"hi\\"\\n"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("merlin_test_seconds", "Test histogram", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value)
+
+    assert histogram.render()[2:] == [
+        'merlin_test_seconds_bucket{le="0.1"} 1',
+        'merlin_test_seconds_bucket{le="1"} 3',
+        'merlin_test_seconds_bucket{le="+Inf"} 4',
+        "merlin_test_seconds_sum 4.25",
+        "merlin_test_seconds_count 4",
+    ]
+
+
+def test_registry_renders_collectors_and_skips_failing_ones():
+    registry = MetricsRegistry()
+    registry.counter("merlin_test_total", "Test counter").inc()
+
+    @registry.collector
+    def broken():
+        raise RuntimeError("stats unavailable")
+
+    @registry.collector
+    def component():
+        return [("merlin_test_latency_seconds", "histogram", "Latency", [("_count", {"upstream": "x"}, 2), ({"upstream": "x"}, 1)])]
+
+    lines = registry.render().splitlines()
+    assert "merlin_test_total 1" in lines
+    assert 'merlin_test_latency_seconds_count{upstream="x"} 2' in lines
+    assert 'merlin_test_latency_seconds{upstream="x"} 1' in lines
+
+
+def test_timed_adds_up_stage_durations():
+    timings = {}
+    before = count(stage_seconds, "test_stage")
+    for _ in range(2):
+        with timed("test_stage", timings):
+            pass
+
+    assert count(stage_seconds, "test_stage") == before + 2
+    assert list(timings) == ["test_stage_ms"] and timings["test_stage_ms"] >= 0
+
+
+def test_chat_turn_records_its_stages_and_token_usage(client, auth_headers, chat_id, stub_openai):
+    stages = ("auth", "history", "prompt", "openai", "db_commit")
+    before = {stage: count(stage_seconds, stage) for stage in stages}
+    prompt_tokens = sum(value for (model, kind), value in tokens_total.values.items() if kind == "prompt")
+
+    response = client.post(f"/api/chats/{chat_id}/messages", data={"message": "hello"}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert all(count(stage_seconds, stage) > before[stage] for stage in stages)
+    assert sum(value for (model, kind), value in tokens_total.values.items() if kind == "prompt") == prompt_tokens + 10
+
+
+def test_metrics_endpoint_counts_requests_and_honours_the_token(client, auth_headers, monkeypatch):
+    client.get("/api/check-login", headers=auth_headers)
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert 'merlin_http_requests_total{method="GET",endpoint="auth.check_login",status="200"}' in body
+    assert "merlin_upstream_requests_total" in body and "merlin_response_cache_hits" in body
+
+    monkeypatch.setattr(AppConfig, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+    assert metrics.http_requests_total.values.get(("GET", "metrics.metrics_endpoint", 200)) is None # Scrapes are not counted
@@ -0,0 +1,122 @@
+import importlib.util
+import json
+import os
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+VERSIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations", "versions")
+
+
+def load_revision(filename):
+    spec = importlib.util.spec_from_file_location(filename[:-3], os.path.join(VERSIONS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def upgrade(engine, revision):
+    with engine.begin() as conn:
+        with Operations.context(MigrationContext.configure(conn)):
+            revision.upgrade()
+
+
+def downgrade(engine, revision):
+    with engine.begin() as conn:
+        with Operations.context(MigrationContext.configure(conn)):
+            revision.downgrade()
+
+
+def test_message_backfill_copies_legacy_histories_and_downgrade_restores_them(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    revision = load_revision("3f2a9c1d7b10_add_message_table.py")
+    history = [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "reasoning": "greeting", "content": "hello"},
+        {"role": "user"}, # No content: skipped
+    ]
+    with engine.begin() as conn:
+        conn.execute(sa.text("CREATE TABLE chat (id VARCHAR(36) PRIMARY KEY, messages TEXT)"))
+        conn.execute(sa.text("INSERT INTO chat VALUES ('c1', :history), ('c2', 'not json'), ('c3', NULL)"), {
+            "history": json.dumps(history)
+        })
+
+    upgrade(engine, revision)
+    upgrade(engine, revision) # Chats already copied are left alone
+
+    with engine.connect() as conn:
+        rows = conn.execute(sa.text("SELECT chat_id, seq, role, content, reasoning FROM message ORDER BY id")).all()
+    assert [tuple(row) for row in rows] == [("c1", 0, "user", "hi", None), ("c1", 1, "assistant", "hello", "greeting")]
+
+    with engine.begin() as conn:
+        conn.execute(sa.text("UPDATE chat SET messages = '[]'"))
+    downgrade(engine, revision)
+
+    with engine.connect() as conn:
+        assert "message" not in sa.inspect(conn).get_table_names()
+        restored = conn.execute(sa.text("SELECT messages FROM chat WHERE id = 'c1'")).scalar()
+    assert json.loads(restored) == history[:2]
+
+
+def test_chunk_backfill_splits_legacy_pdf_text_per_file(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    words = " ".join(f"w{n}" for n in range(250))
+    with engine.begin() as conn:
+        conn.execute(sa.text("CREATE TABLE chat (id VARCHAR(36) PRIMARY KEY, pdf_text TEXT)"))
+        conn.execute(sa.text("INSERT INTO chat VALUES ('c1', :text), ('c2', '')"), {"text": (
+            f"--- START OF a.pdf ---\n{words}\n--- END OF a.pdf ---\n\n"
+            "--- START OF b.pdf ---\nshort text\n--- END OF b.pdf ---\n\n"
+        )})
+
+    upgrade(engine, load_revision("8b4e6d2a9c31_add_document_chunk_table.py"))
+
+    with engine.connect() as conn:
+        rows = conn.execute(sa.text("SELECT chat_id, filename, seq, content FROM document_chunk ORDER BY id")).all()
+    assert [row[:3] for row in rows] == [("c1", "a.pdf", 0), ("c1", "a.pdf", 1), ("c1", "b.pdf", 0)]
+    assert rows[0][3].split() == words.split()[:200]
+    assert rows[1][3].split() == words.split()[160:] # 40 words of overlap
+    assert rows[2][3] == "short text"
+
+
+def test_chunk_backfill_skips_chats_already_indexed(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    revision = load_revision("8b4e6d2a9c31_add_document_chunk_table.py")
+    with engine.begin() as conn:
+        conn.execute(sa.text("CREATE TABLE chat (id VARCHAR(36) PRIMARY KEY, pdf_text TEXT)"))
+        conn.execute(sa.text("INSERT INTO chat VALUES ('c1', '--- START OF a.pdf ---\nalpha\n--- END OF a.pdf ---')"))
+
+    upgrade(engine, revision)
+    upgrade(engine, revision)
+
+    with engine.connect() as conn:
+        assert conn.execute(sa.text("SELECT COUNT(*) FROM document_chunk")).scalar() == 1
+
+
+def test_document_backfill_splits_legacy_pdf_text_and_downgrade_joins_it_back(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    revision = load_revision("e05a7b3c8d14_add_document_table.py")
+    pdf_text = (
+        "--- START OF a.pdf ---\nalpha text\n--- END OF a.pdf ---\n\n"
+        "--- START OF b.pdf ---\nbravo text\n--- END OF b.pdf ---\n\n"
+    )
+    with engine.begin() as conn:
+        conn.execute(sa.text("CREATE TABLE chat (id VARCHAR(36) PRIMARY KEY, pdf_text TEXT, uploaded_pdfs TEXT)"))
+        # b.pdf listed first; a.pdf only has text; c.pdf is listed without text
+        conn.execute(sa.text("INSERT INTO chat VALUES ('c1', :text, :names)"), {
+            "text": pdf_text, "names": json.dumps(["b.pdf", "c.pdf"])
+        })
+
+    upgrade(engine, revision)
+    upgrade(engine, revision)
+
+    with engine.connect() as conn:
+        documents = conn.execute(sa.text("SELECT chat_id, filename, text FROM document ORDER BY id")).all()
+    assert [tuple(row) for row in documents] == [("c1", "b.pdf", "bravo text"), ("c1", "c.pdf", ""), ("c1", "a.pdf", "alpha text")]
+
+    downgrade(engine, revision)
+
+    with engine.connect() as conn:
+        assert "document" not in sa.inspect(conn).get_table_names()
+        restored_text, restored_names = conn.execute(sa.text("SELECT pdf_text, uploaded_pdfs FROM chat")).one()
+    assert json.loads(restored_names) == ["b.pdf", "c.pdf", "a.pdf"]
+    assert "--- START OF a.pdf ---\nalpha text\n--- END OF a.pdf ---" in restored_text
@@ -0,0 +1,101 @@
+import math
+import random
+import time
+import utils
+from places import PlaceIndex, PlacesCache
+from test_places_cache import FakeMaps
+
+CUISINES = ["pizza", "sushi", "thai", "burger"]
+
+
+def random_index(rng, count, cell_degrees=0.002):
+    index = PlaceIndex(cell_degrees, refresh_seconds=60)
+    now = time.time()
+    for n in range(count):
+        index.insert(
+            f"p{n}", 40.70 + rng.random() * 0.1, -74.05 + rng.random() * 0.1, f"Place {n}",
+            tags=rng.sample(CUISINES, rng.randint(1, 2)), fetched_ts=now - rng.random() * 1000
+        )
+    return index
+
+
+"""explain: The same equirectangular distance as PlaceIndex.nearest, over every place."""
+def brute_force(index, latitude, longitude, k, max_distance, tags=None, fresh_after=None):
+    lng_scale = max(math.cos(math.radians(latitude)), 0.01)
+    found = []
+    for place_id, (lat, lng, place_tags, fetched_ts, *_) in index.places.items():
+        if tags and place_tags.isdisjoint(tags):
+            continue
+        if fresh_after is not None and fetched_ts < fresh_after:
+            continue
+        distance = math.hypot(lat - latitude, (lng - longitude) * lng_scale) * PlaceIndex.METERS_PER_DEGREE
+        if distance <= max_distance:
+            found.append((distance, place_id))
+    return sorted(found)[:k]
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(14)
+    index = random_index(rng, 3000)
+
+    for _ in range(200):
+        latitude, longitude = 40.70 + rng.random() * 0.1, -74.05 + rng.random() * 0.1
+        k, max_distance = rng.choice([1, 5, 10]), rng.choice([200, 800, 3000])
+        got = index.nearest(latitude, longitude, k, max_distance)
+        expected = brute_force(index, latitude, longitude, k, max_distance)
+        assert [place_id for _, place_id in got] == [place_id for _, place_id in expected]
+        assert all(math.isclose(a, b) for (a, _), (b, _) in zip(got, expected))
+
+
+def test_nearest_filters_by_tag_and_age_like_brute_force():
+    rng = random.Random(15)
+    index = random_index(rng, 2000)
+    fresh_after = time.time() - 500
+
+    for _ in range(100):
+        latitude, longitude = 40.70 + rng.random() * 0.1, -74.05 + rng.random() * 0.1
+        tags = rng.sample(CUISINES, 1)
+        got = index.nearest(latitude, longitude, 10, 2000, tags=tags, fresh_after=fresh_after)
+        expected = brute_force(index, latitude, longitude, 10, 2000, tags=frozenset(tags), fresh_after=fresh_after)
+        assert [place_id for _, place_id in got] == [place_id for _, place_id in expected]
+
+
+def test_moved_place_is_found_at_its_new_position_only():
+    index = PlaceIndex(0.005, refresh_seconds=60)
+    index.insert("p1", 40.0, -74.0, "Moving")
+    index.insert("p1", 40.1, -74.1, "Moving")
+
+    assert index.nearest(40.0, -74.0, 5, 1000) == []
+    assert [place_id for _, place_id in index.nearest(40.1, -74.1, 5, 1000)] == ["p1"]
+    assert index.stats()["places"] == 1
+
+
+def test_nearby_needs_enough_fresh_places_and_ranks_by_rating():
+    index = PlaceIndex(0.005, refresh_seconds=3600)
+    index.synced_at = time.monotonic() # Nothing to load from the database
+    index.insert("near", 40.0, -74.0, "Near", rating=3.5, tags=["pizza"])
+    index.insert("good", 40.001, -74.0, "Good", rating=4.8, tags=["pizza"])
+    index.insert("stale", 40.0, -74.001, "Stale", rating=5.0, tags=["pizza"], fetched_ts=time.time() - 7200)
+    index.insert("sushi", 40.0, -74.0, "Sushi", rating=4.9, tags=["sushi"])
+
+    assert index.nearby(40.0, -74.0, 1000, ["pizza"], min_results=3, max_age_seconds=3600) is None
+    results = index.nearby(40.0, -74.0, 1000, ["pizza"], min_results=2, max_age_seconds=3600)
+    assert [result["place_id"] for result in results] == ["good", "near"]
+    assert index.stats()["local_hits"] == index.stats()["fallbacks"] == 1
+
+
+def test_known_cuisine_nearby_is_answered_from_recorded_places(app, monkeypatch):
+    maps = FakeMaps()
+    index = PlaceIndex(0.005, refresh_seconds=0)
+    monkeypatch.setattr(utils.clients, "maps", lambda: maps)
+    monkeypatch.setattr(utils, "places_cache", PlacesCache(ttl_seconds=60, max_entries=10))
+    monkeypatch.setattr(utils, "place_index", index)
+    monkeypatch.setattr(utils.AppConfig, "PLACE_INDEX_MIN_RESULTS", 1)
+
+    with app.app_context():
+        fetched = utils.RestaurantHandle().get_restaurants(35.68950, 139.69170, keywords=["ramen"], radius=1000)
+        # Another geohash cell, so not a cache hit, but within the radius of the recorded place
+        local = utils.RestaurantHandle().get_restaurants(35.69350, 139.69170, keywords=["ramen"], radius=1000)
+
+    assert len(maps.calls) == 1
+    assert [result["place_id"] for result in local] == [fetched[0]["place_id"]]
@@ -0,0 +1,81 @@
+import sqlite3
+import utils
+from places import PlacesCache, geohash_encode, geohash_precision
+
+RESULTS = [{"place_id": "p1", "name": "Pho Place"}]
+
+
+def test_geohash_matches_the_reference_encoding():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash_encode(-25.382708, -49.265506, 6) == "6gkzwg"
+
+
+def test_precision_keeps_cells_below_a_fraction_of_the_radius():
+    assert geohash_precision(1500, 0.25) == 7 # 153 m cells for a 375 m limit
+    assert geohash_precision(50000, 0.25) == 5
+    assert geohash_precision(1, 0.25) == 9 # Finest available
+
+
+def test_key_is_stable_within_a_cell_and_for_keyword_order():
+    cache = PlacesCache(ttl_seconds=60, max_entries=10)
+    key = cache.key(48.85661, 2.35222, 1500, ["Pizza", "sushi"])
+
+    assert cache.key(48.85662, 2.35223, 1500, ["sushi", "pizza", "PIZZA"]) == key
+    assert cache.key(48.86661, 2.35222, 1500, ["pizza", "sushi"]) != key # About 1 km north
+    assert cache.key(48.85661, 2.35222, 3000, ["pizza", "sushi"]) != key
+    assert cache.key(48.85661, 2.35222, 1500, ["pizza"]) != key
+    assert cache.key(48.85661, 2.35222, 1500, ["pizza", "sushi"], place_type="cafe") != key
+
+
+def test_entries_expire_and_the_least_recently_used_is_evicted():
+    cache = PlacesCache(ttl_seconds=60, max_entries=2)
+    cache.put("a", RESULTS)
+    cache.put("b", RESULTS)
+    assert cache.get("a") == RESULTS # b is now the least recently used
+
+    cache.put("c", RESULTS)
+
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (RESULTS, None, RESULTS)
+    expiring = PlacesCache(ttl_seconds=0, max_entries=2)
+    expiring.put("a", RESULTS)
+    assert expiring.get("a") is None
+    assert (cache.stats()["evictions"], expiring.stats()["expired"]) == (1, 1)
+
+
+def test_sqlite_file_survives_a_restart_and_ignores_unreadable_rows(tmp_path):
+    path = str(tmp_path / "places_cache.db")
+    PlacesCache(ttl_seconds=60, max_entries=10, db_path=path).put("key", RESULTS)
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO places_cache VALUES ('broken', '{not json', 9e12)")
+
+    restarted = PlacesCache(ttl_seconds=60, max_entries=10, db_path=path)
+
+    assert restarted.get("key") == RESULTS
+    assert restarted.get("broken") is None
+    assert restarted.stats()["hits"] == 1
+
+
+class FakeMaps():
+    http = True
+
+    def __init__(self):
+        self.calls = []
+
+    def places_nearby(self, **params):
+        self.calls.append(params)
+        return [dict(RESULTS[0], geometry={"location": {"lat": params["location"][0], "lng": params["location"][1]}})]
+
+
+def test_repeated_search_from_the_same_cell_skips_the_places_api(app, monkeypatch):
+    maps = FakeMaps()
+    monkeypatch.setattr(utils.clients, "maps", lambda: maps)
+    monkeypatch.setattr(utils, "places_cache", PlacesCache(ttl_seconds=60, max_entries=10))
+
+    with app.app_context():
+        first = utils.RestaurantHandle().get_restaurants(40.71280, -74.00600, radius=1000)
+        again = utils.RestaurantHandle().get_restaurants(40.71281, -74.00601, radius=1000)
+        farther = utils.RestaurantHandle().get_restaurants(40.75280, -74.00600, radius=1000)
+
+    assert again == first
+    assert farther != first
+    assert len(maps.calls) == 2
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import pytest
+import middleware
+from ratelimit import CompletionLimiter, MemoryRateLimitBackend, SqliteRateLimitBackend
+
+NOW = 1_000_000.0
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryRateLimitBackend()
+    return SqliteRateLimitBackend(str(tmp_path / "rate_limits.db"))
+
+
+def test_bucket_admits_the_burst_then_reports_the_wait(backend):
+    for _ in range(3):
+        lease_id, reason, wait = backend.admit("user:1", 3, 0.5, [], 60, NOW)
+        assert lease_id is not None and reason is None
+
+    assert backend.admit("user:1", 3, 0.5, [], 60, NOW) == (None, "rate", 2.0)
+    assert backend.admit("user:1", 3, 0.5, [], 60, NOW + 2)[0] is not None # One token refilled
+    assert backend.admit("user:2", 3, 0.5, [], 60, NOW)[0] is not None # Buckets are per key
+
+
+def test_slots_are_held_until_released(backend):
+    slots = [("user:1", 2), ("model:gpt-4o", 10)]
+    first = backend.admit(None, 1, 0, slots, 60, NOW)[0]
+    backend.admit(None, 1, 0, slots, 60, NOW)
+
+    assert backend.admit(None, 1, 0, slots, 60, NOW) == (None, "concurrency", None)
+    assert backend.in_flight_counts(NOW) == {"user:1": 2, "model:gpt-4o": 2}
+
+    backend.release(first)
+    assert backend.admit(None, 1, 0, slots, 60, NOW)[0] is not None
+
+
+def test_model_slot_is_shared_between_users(backend):
+    backend.admit(None, 1, 0, [("user:1", 5), ("model:gpt-4o", 1)], 60, NOW)
+
+    assert backend.admit(None, 1, 0, [("user:2", 5), ("model:gpt-4o", 1)], 60, NOW)[1] == "concurrency"
+
+
+def test_rejected_request_uses_up_no_token(backend):
+    slots = [("user:1", 1)]
+    first = backend.admit("user:1", 2, 0.01, slots, 60, NOW)[0]
+
+    assert backend.admit("user:1", 2, 0.01, slots, 60, NOW)[1] == "concurrency"
+    backend.release(first)
+    second = backend.admit("user:1", 2, 0.01, slots, 60, NOW)[0]
+    assert second is not None # The rejected attempt left the second token in the bucket
+    backend.release(second)
+    assert backend.admit("user:1", 2, 0.01, slots, 60, NOW)[1] == "rate"
+
+
+def test_expired_leases_free_their_slots(backend):
+    backend.admit(None, 1, 0, [("user:1", 1)], 30, NOW)
+
+    assert backend.admit(None, 1, 0, [("user:1", 1)], 30, NOW + 29)[1] == "concurrency"
+    assert backend.admit(None, 1, 0, [("user:1", 1)], 30, NOW + 30)[0] is not None
+
+
+def test_sqlite_backend_instances_share_state(tmp_path):
+    path = str(tmp_path / "rate_limits.db")
+    worker_a, worker_b = SqliteRateLimitBackend(path), SqliteRateLimitBackend(path)
+
+    lease_id = worker_a.admit("user:1", 1, 0.1, [("model:gpt-4o", 1)], 60, NOW)[0]
+    assert worker_b.admit("user:2", 1, 0.1, [("model:gpt-4o", 1)], 60, NOW)[1] == "concurrency"
+    assert worker_b.admit("user:1", 1, 0.1, [], 60, NOW)[1] == "rate"
+
+    worker_a.release(lease_id)
+    assert worker_b.admit("user:2", 1, 0.1, [("model:gpt-4o", 1)], 60, NOW)[0] is not None
+
+
+def admit_in_worker(path, start, results):
+    start.wait()
+    lease_id, reason, _ = SqliteRateLimitBackend(path).admit(None, 1, 0, [("model:gpt-4o", 3)], 60, NOW)
+    results.put((os.getpid(), reason or "admitted"))
+
+
+def test_sqlite_backend_limits_across_processes(tmp_path):
+    path = str(tmp_path / "rate_limits.db")
+    context = multiprocessing.get_context("spawn")
+    start, results = context.Event(), context.Queue()
+    workers = [context.Process(target=admit_in_worker, args=(path, start, results)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    outcomes = [results.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join(timeout=60)
+
+    assert len({pid for pid, _ in outcomes}) == 8
+    assert sorted(reason for _, reason in outcomes) == ["admitted"] * 3 + ["concurrency"] * 5
+
+
+def make_limiter(per_minute=0, burst=1, user_concurrency=0, busy_retry_seconds=2):
+    return CompletionLimiter(MemoryRateLimitBackend(), per_minute, burst, user_concurrency, 0, {}, 60, busy_retry_seconds)
+
+
+def test_limiter_retry_after_is_whole_seconds():
+    limiter = make_limiter(per_minute=12, burst=1, user_concurrency=1, busy_retry_seconds=2.5)
+
+    lease, retry_after = limiter.acquire(1, "gpt-4o")
+    assert lease is not None and retry_after is None
+    assert limiter.acquire(1, "gpt-4o") == (None, 3) # Busy: RATE_LIMIT_BUSY_RETRY_SECONDS rounded up
+    lease.release()
+    assert limiter.acquire(1, "gpt-4o") == (None, 5) # Empty bucket: 1 token at 12/min
+    assert limiter.stats()["admitted"] == 1
+    assert (limiter.stats()["rejected_rate"], limiter.stats()["rejected_concurrency"]) == (1, 1)
+
+
+def test_send_message_answers_429_with_retry_after(client, auth_headers, chat_id, stub_openai, monkeypatch):
+    monkeypatch.setattr(middleware, "completion_limiter", make_limiter(per_minute=30, burst=1))
+
+    first = client.post(f"/api/chats/{chat_id}/messages", data={"message": "one"}, headers=auth_headers)
+    second = client.post(f"/api/chats/{chat_id}/messages", data={"message": "two"}, headers=auth_headers)
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "2"
+    assert second.get_json()["retry_after"] == 2
+    assert len(stub_openai.requests) == 1
+
+
+def test_streamed_response_holds_its_slot_until_closed(client, auth_headers, chat_id, stub_openai, monkeypatch):
+    limiter = make_limiter(user_concurrency=1)
+    monkeypatch.setattr(middleware, "completion_limiter", limiter)
+    stub_openai.reply("slow ", "reply")
+
+    streaming = client.post(f"/api/chats/{chat_id}/messages", data={"message": "one", "stream": "true"}, headers=auth_headers, buffered=False)
+    frames = iter(streaming.response)
+    assert "event: delta" in next(frames).decode()
+
+    busy = client.post(f"/api/chats/{chat_id}/messages", data={"message": "two"}, headers=auth_headers)
+    assert busy.status_code == 429
+    assert busy.headers["Retry-After"] == "2"
+
+    for _ in frames:
+        pass
+    streaming.close() # call_on_close releases the lease
+    assert limiter.backend.in_flight_counts(0) == {}
+
+    done = client.post(f"/api/chats/{chat_id}/messages", data={"message": "three"}, headers=auth_headers, buffered=True)
+    assert done.status_code == 200
+    assert limiter.backend.in_flight_counts(0) == {} # Released when the server closed the response
@@ -0,0 +1,95 @@
+import time
+import turns
+from conftest import stored_messages
+from response_cache import ResponseCache
+
+SYSTEM = "You are Merlin."
+
+
+def make_cache(tmp_path, enabled=True, ttl_seconds=60, max_entries=100, max_bytes=10**6, history_messages=2):
+    return ResponseCache(enabled, str(tmp_path / "response_cache.db"), ttl_seconds, max_entries, max_bytes, history_messages)
+
+
+def openai_messages(*history, question="What is in the report?"):
+    return [{"role": "system", "content": SYSTEM}] + [
+        {"role": "user" if n % 2 == 0 else "assistant", "content": text} for n, text in enumerate(history)
+    ] + [{"role": "user", "content": question}]
+
+
+def test_key_ignores_whitespace_and_history_beyond_the_window(tmp_path):
+    cache = make_cache(tmp_path, history_messages=2)
+    key = cache.key("gpt", SYSTEM, "doc", openai_messages("a", "b", "c", "d"), "What is in the report?", False, 500)
+
+    assert cache.key("gpt", "You are  Merlin.\n", "doc", openai_messages("x", "y", "c", " d "), " What is in\nthe report? ", False, 500) == key
+    assert cache.key("gpt", SYSTEM, "doc", openai_messages("a", "b", "c", "e"), "What is in the report?", False, 500) != key
+
+
+def test_key_changes_with_each_request_input(tmp_path):
+    cache = make_cache(tmp_path)
+    args = ["gpt", SYSTEM, "doc", openai_messages("a", "b"), "What is in the report?", False, 500]
+    key = cache.key(*args)
+
+    for position, other in enumerate(["o1", "Be brief.", "other-doc", openai_messages("a", "c"), "Who wrote it?", True, 800]):
+        changed = list(args)
+        changed[position] = other
+        assert cache.key(*changed) != key, position
+
+
+def test_stored_answers_expire_and_a_disabled_cache_stores_nothing(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("k", "gpt", "why", "answer")
+    assert cache.get("k") == {"reasoning": "why", "response": "answer"}
+    assert cache.get("other") is None
+
+    expiring = make_cache(tmp_path, ttl_seconds=0) # Same file, stores entries that are already stale
+    expiring.put("stale", "gpt", None, "answer")
+    assert cache.get("stale") is None
+
+    disabled = make_cache(tmp_path, enabled=False)
+    disabled.put("k", "gpt", None, "answer")
+    assert disabled.get("k") is None
+    assert (cache.stats()["hits"], cache.stats()["misses"], cache.stats()["hit_rate"]) == (1, 2, 0.3333)
+
+
+def test_pruning_keeps_the_most_recently_used_entries_within_both_limits(tmp_path):
+    cache = make_cache(tmp_path, max_entries=3, max_bytes=15)
+    cache.PRUNE_EVERY = 1
+    for key in "abc":
+        cache.put(key, "gpt", None, "12345")
+        time.sleep(0.01)
+    cache.get("a") # Now more recent than b and c
+    time.sleep(0.01)
+
+    cache.put("d", "gpt", None, "1234567890") # b is one entry too many, then c goes over 15 bytes
+
+    assert [cache.get(key) is not None for key in "abcd"] == [True, False, False, True]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_repeated_question_is_answered_from_the_cache(client, auth_headers, stub_openai, tmp_path, monkeypatch):
+    cache = make_cache(tmp_path)
+    monkeypatch.setattr(turns, "response_cache", cache)
+    stub_openai.reply("It is about caching.")
+    chats = [client.post("/api/chats", headers=auth_headers).get_json()["id"] for _ in range(2)]
+
+    answers = [
+        client.post(f"/api/chats/{chat_id}/messages", data={"message": "What is this about?"}, headers=auth_headers).get_json()
+        for chat_id in chats
+    ]
+
+    assert len(stub_openai.requests) == 1
+    assert answers[1]["response"] == answers[0]["response"] == "It is about caching."
+    assert stored_messages(chats[1]) == [("user", "What is this about?", None), ("assistant", "It is about caching.", None)]
+    assert (cache.stats()["stores"], cache.stats()["hits"]) == (1, 1)
+
+
+def test_restaurant_questions_bypass_the_cache(client, auth_headers, chat_id, stub_openai, tmp_path, monkeypatch):
+    cache = make_cache(tmp_path)
+    monkeypatch.setattr(turns, "response_cache", cache)
+
+    for _ in range(2):
+        response = client.post(f"/api/chats/{chat_id}/messages", data={"message": "Any pizza restaurants nearby?"}, headers=auth_headers)
+        assert response.status_code == 200
+
+    stats = cache.stats()
+    assert (stats["bypassed"], stats["hits"], stats["misses"], stats["stores"]) == (2, 0, 0, 0)
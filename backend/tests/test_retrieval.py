@@ -0,0 +1,99 @@
+import sqlite3
+from retrieval import BM25Index, chunk_text, chunk_index_cache, retrieve_chunks
+from turns import REASONING_INSTRUCTIONS
+from conftest import DB_PATH, upload_pdf
+
+
+def test_chunks_overlap_and_cover_every_word():
+    words = [f"w{n}" for n in range(25)]
+
+    chunks = chunk_text(" ".join(words), chunk_words=10, overlap_words=3)
+
+    assert chunks[0].split() == words[0:10]
+    assert chunks[1].split() == words[7:17] # Starts 3 words before the end of the previous chunk
+    assert chunks[-1].split()[-1] == "w24"
+    assert [chunk.split()[0] for chunk in chunks] == ["w0", "w7", "w14", "w21"]
+
+
+def test_short_and_empty_texts():
+    assert chunk_text("one two three", chunk_words=10, overlap_words=3) == ["one two three"]
+    assert chunk_text("  \n ", chunk_words=10, overlap_words=3) == []
+
+
+def test_bm25_ranks_rare_terms_and_ignores_stopwords():
+    index = BM25Index([
+        ("soup", "the tomato soup recipe needs tomato and basil"),
+        ("bread", "the bread recipe needs flour and water"),
+        ("note", "a note about the weather"),
+    ])
+
+    assert [key for key, _ in index.search("tomato recipe", 3)] == ["soup", "bread"]
+    assert index.search("the and of", 3) == []
+    assert [key for key, _ in index.search("weather", 1)] == ["note"]
+
+
+def test_index_follows_a_remove_then_upload(app, client, auth_headers, chat_id):
+    assert upload_pdf(client, auth_headers, chat_id, "a.pdf", "alpha apples")["status"] == "done"
+    assert upload_pdf(client, auth_headers, chat_id, "b.pdf", "SECRET bravo")["status"] == "done"
+    with app.app_context():
+        assert [chunk.filename for chunk in retrieve_chunks(chat_id, "bravo")] == ["b.pdf"]
+
+    client.post(f"/api/chats/{chat_id}/remove-pdf", json={"pdf_name": "b.pdf"}, headers=auth_headers)
+    assert upload_pdf(client, auth_headers, chat_id, "c.pdf", "charlie cherries")["status"] == "done"
+
+    with app.app_context(): # c.pdf's chunk reuses b.pdf's id, so the chunk count and max id are unchanged
+        assert [chunk.filename for chunk in retrieve_chunks(chat_id, "charlie")] == ["c.pdf"]
+        assert retrieve_chunks(chat_id, "SECRET bravo") == []
+
+
+def test_index_of_a_chat_without_documents(app, chat_id):
+    with app.app_context():
+        assert chunk_index_cache.get(chat_id) is None
+        assert retrieve_chunks(chat_id, "anything") == []
+
+
+def system_prompt(client, auth_headers, chat_id, stub_openai):
+    response = client.post(f"/api/chats/{chat_id}/messages", data={"message": "summarize"}, headers=auth_headers)
+    assert response.status_code == 200
+    return stub_openai.requests[-1]["messages"][0]["content"]
+
+
+def test_document_block_follows_a_remove_then_upload(client, auth_headers, chat_id, stub_openai):
+    upload_pdf(client, auth_headers, chat_id, "a.pdf", "alpha apples")
+    upload_pdf(client, auth_headers, chat_id, "b.pdf", "SECRET bravo")
+    assert "SECRET bravo" in system_prompt(client, auth_headers, chat_id, stub_openai)
+
+    client.post(f"/api/chats/{chat_id}/remove-pdf", json={"pdf_name": "b.pdf"}, headers=auth_headers)
+    upload_pdf(client, auth_headers, chat_id, "c.pdf", "charlie cherries")
+    prompt = system_prompt(client, auth_headers, chat_id, stub_openai)
+
+    assert "SECRET bravo" not in prompt
+    assert "alpha apples" in prompt and "charlie cherries" in prompt
+
+
+def test_document_block_is_dropped_with_the_last_document(client, auth_headers, chat_id, stub_openai):
+    upload_pdf(client, auth_headers, chat_id, "a.pdf", "alpha apples")
+    assert "alpha apples" in system_prompt(client, auth_headers, chat_id, stub_openai)
+
+    client.post(f"/api/chats/{chat_id}/remove-pdf", json={"pdf_name": "a.pdf"}, headers=auth_headers)
+
+    assert "CONTEXT FROM UPLOADED DOCUMENTS" not in system_prompt(client, auth_headers, chat_id, stub_openai)
+
+
+def test_first_message_stays_identical_across_turns(client, auth_headers, chat_id, stub_openai):
+    upload_pdf(client, auth_headers, chat_id, "a.pdf", "alpha apples")
+
+    for message, reasoning in (("first", "false"), ("second", "true"), ("third", "false")):
+        data = {"message": message, "use_reasoning": reasoning}
+        assert client.post(f"/api/chats/{chat_id}/messages", data=data, headers=auth_headers).status_code == 200
+
+    requests = [request["messages"] for request in stub_openai.requests]
+    assert requests[0][0] == requests[1][0] == requests[2][0]
+    assert "alpha apples" in requests[0][0]["content"]
+    assert REASONING_INSTRUCTIONS.strip() in requests[1][-2]["content"] # Suffix just before the user message
+    assert all(REASONING_INSTRUCTIONS.strip() not in message["content"] for message in requests[2])
+    with sqlite3.connect(DB_PATH) as conn:
+        usage = conn.execute(
+            "SELECT prompt_tokens, completion_tokens FROM message WHERE chat_id = ? AND role = 'assistant'", (chat_id,)
+        ).fetchall()
+    assert usage == [(10, 1)] * 3
@@ -0,0 +1,52 @@
+import json
+from datetime import datetime, timezone
+from schemas import ChatDetail, ChatSummary, MessageOut, decode_string_list, encode, json_response
+
+
+def test_unset_fields_are_left_out():
+    detail = ChatDetail(name="Notes", messages=[MessageOut(0, "user", "hi"), MessageOut(1, "assistant", "hello", None)])
+
+    assert json.loads(encode(detail)) == {
+        "name": "Notes",
+        "messages": [{"seq": 0, "role": "user", "content": "hi"}, {"seq": 1, "role": "assistant", "content": "hello", "reasoning": None}],
+    }
+    assert encode(ChatDetail()) == b"{}"
+
+
+def test_chat_summary_dates_are_rfc3339():
+    summary = ChatSummary("c1", "Chat", datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc))
+
+    assert encode(summary) == b'{"id":"c1","name":"Chat","updated_at":"2024-05-01T12:30:00Z"}'
+    assert encode(ChatSummary("c1", "Chat")) == b'{"id":"c1","name":"Chat"}'
+
+
+def test_json_response_carries_the_encoded_body():
+    response = json_response([ChatSummary("c1", "Chat")], 201)
+
+    assert (response.status_code, response.mimetype) == (201, "application/json")
+    assert response.get_data() == b'[{"id":"c1","name":"Chat"}]'
+
+
+def test_stored_string_lists_decode_to_empty_when_missing_or_malformed():
+    assert decode_string_list('["pizza", "sushi"]') == ["pizza", "sushi"]
+    assert decode_string_list(b'["pizza"]') == ["pizza"]
+    for raw in (None, "", "{not json", "[1, 2]", '{"a": "b"}'):
+        assert decode_string_list(raw) == []
+
+
+def test_chat_detail_serializes_only_the_requested_fields(client, auth_headers, chat_id):
+    response = client.get(f"/api/chats/{chat_id}?fields=name,uploaded_pdfs", headers=auth_headers)
+
+    assert response.mimetype == "application/json"
+    assert response.get_json() == {"name": f"New Chat {chat_id[:4]}", "uploaded_pdfs": []}
+    assert client.get(f"/api/chats/{chat_id}?fields=name,secrets", headers=auth_headers).status_code == 400
+
+
+def test_rename_validates_the_body(client, auth_headers, chat_id):
+    url = f"/api/chats/{chat_id}"
+
+    for body in ({}, {"name": 5}, {"other": "x"}):
+        assert client.put(url, json=body, headers=auth_headers).status_code == 400
+    assert client.put(url, data="{not json", headers=auth_headers).status_code == 400
+    assert client.put(url, json={"name": "  Renamed  "}, headers=auth_headers).status_code == 200
+    assert client.get(f"{url}?fields=name", headers=auth_headers).get_json() == {"name": "Renamed"}
@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+from conftest import BACKEND_DIR
+from service import clients
+
+HEAVY_MODULES = ["openai", "googlemaps", "PyPDF2", "tiktoken"]
+
+
+def test_entry_points_start_without_the_client_libraries(tmp_path):
+    code = "import json, sys, main, asgi; print(json.dumps([name for name in sys.argv[1:] if name in sys.modules]))"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}")
+
+    result = subprocess.run(
+        [sys.executable, "-c", code, *HEAVY_MODULES], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+
+def test_forked_worker_builds_its_own_clients():
+    parent_client = clients.openai()
+    read_end, write_end = os.pipe()
+
+    pid = os.fork()
+    if pid == 0: # Child: report what the registry holds, then leave without running any cleanup
+        os.write(write_end, json.dumps(sorted(clients.clients)).encode())
+        os._exit(0)
+    os.close(write_end)
+    os.waitpid(pid, 0)
+    with os.fdopen(read_end) as pipe:
+        child_clients = json.loads(pipe.read())
+
+    assert child_clients == []
+    assert clients.openai() is parent_client
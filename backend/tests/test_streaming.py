@@ -0,0 +1,88 @@
+import turns
+from conftest import parse_sse, stored_messages
+from utils import ReasoningStreamParser
+
+
+def send(client, auth_headers, chat_id, message="hello", reasoning=False, buffered=True):
+    return client.post(
+        f"/api/chats/{chat_id}/messages",
+        data={"message": message, "stream": "true", "use_reasoning": "true" if reasoning else "false"},
+        headers=auth_headers,
+        buffered=buffered,
+    )
+
+
+def test_parser_holds_back_tags_split_across_chunks():
+    parser = ReasoningStreamParser()
+    events = []
+    for delta in ["<reas", "oning>step one", "</reaso", "ning><", "answer>forty", " two</ans", "wer>"]:
+        events += parser.feed(delta)
+    events += parser.flush()
+
+    assert all("<" not in text for _, text in events)
+    assert "".join(text for section, text in events if section == "reasoning") == "step one"
+    assert "".join(text for section, text in events if section == "answer") == "forty two"
+    assert parser.result() == ("step one", "forty two")
+
+
+def test_parser_flushes_text_that_only_looked_like_a_tag():
+    parser = ReasoningStreamParser()
+    events = parser.feed("a <an") + parser.feed("swer-ish> b") + parser.flush()
+    assert "".join(text for _, text in events) == "a <answer-ish> b"
+    assert parser.result() == (None, "a <answer-ish> b")
+
+
+def test_stream_forwards_deltas_and_parses_split_tags(client, auth_headers, chat_id, stub_openai):
+    stub_openai.reply("<reason", "ing>Because.</reas", "oning>\n<ans", "wer>Forty", " two.</answer>")
+
+    response = send(client, auth_headers, chat_id, reasoning=True)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert stub_openai.requests[-1]["stream"] is True
+    events = parse_sse([response.get_data(as_text=True)])
+    deltas = [data for event, data in events if event == "delta"]
+    assert len(deltas) > 1
+    assert "".join(d["text"] for d in deltas if d["section"] == "reasoning") == "Because."
+    assert "".join(d["text"] for d in deltas if d["section"] == "answer").strip() == "Forty two."
+    assert events[-1] == ("done", {"reasoning": "Because.", "response": "Forty two."})
+    assert stored_messages(chat_id) == [("user", "hello", None), ("assistant", "Forty two.", "Because.")]
+
+
+def test_stream_without_answer_tag_keeps_text_after_reasoning(client, auth_headers, chat_id, stub_openai):
+    stub_openai.reply("<reasoning>Thinking", "</reasoning>", "The answer, untagged.")
+
+    events = parse_sse([send(client, auth_headers, chat_id, reasoning=True).get_data(as_text=True)])
+
+    assert events[-1] == ("done", {"reasoning": "Thinking", "response": "The answer, untagged."})
+    assert stored_messages(chat_id)[-1] == ("assistant", "The answer, untagged.", "Thinking")
+
+
+def test_stream_without_any_tags_saves_the_full_text(client, auth_headers, chat_id, stub_openai):
+    stub_openai.reply("No tags ", "at all.")
+
+    events = parse_sse([send(client, auth_headers, chat_id, reasoning=True).get_data(as_text=True)])
+
+    assert events[-1] == ("done", {"reasoning": None, "response": "No tags at all."})
+    assert stored_messages(chat_id)[-1] == ("assistant", "No tags at all.", None)
+
+
+def test_stream_persists_the_turn_once_at_the_end(client, auth_headers, chat_id, stub_openai, monkeypatch):
+    commits = []
+    commit_turn = turns.commit_turn
+    monkeypatch.setattr(turns, "commit_turn", lambda *args, **kwargs: commits.append(args) or commit_turn(*args, **kwargs))
+    stub_openai.reply("one ", "two ", "three")
+
+    response = send(client, auth_headers, chat_id, buffered=False)
+    frames = []
+    for frame in response.response:
+        frames.append(frame.decode() if isinstance(frame, bytes) else frame)
+        if "event: done" not in frames[-1]:
+            assert commits == []
+            assert stored_messages(chat_id) == []
+    response.close()
+
+    events = parse_sse(frames)
+    assert [event for event, _ in events] == ["delta"] * 3 + ["done"]
+    assert len(commits) == 1
+    assert stored_messages(chat_id) == [("user", "hello", None), ("assistant", "one two three", None)]
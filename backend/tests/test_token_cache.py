@@ -0,0 +1,75 @@
+import pytest
+from middleware import TokenCache, token_cache
+from models import User
+from conftest import recorded_queries, user_selects
+
+
+def test_repeated_requests_are_served_from_the_cache(app, client, auth_headers):
+    client.get("/api/check-login", headers=auth_headers) # Fills the cache
+
+    with recorded_queries(app) as statements:
+        for _ in range(3):
+            assert client.get("/api/check-login", headers=auth_headers).status_code == 200
+
+    assert user_selects(statements) == []
+
+
+def test_logout_invalidates_the_cached_token(client, auth_headers):
+    assert client.get("/api/check-login", headers=auth_headers).status_code == 200
+
+    assert client.post("/api/logout", headers=auth_headers).status_code == 200
+
+    assert client.get("/api/check-login", headers=auth_headers).status_code == 401
+
+
+def test_login_invalidates_the_previous_token(client, auth_headers):
+    assert client.get("/api/check-login", headers=auth_headers).status_code == 200
+
+    client.post("/api/login", json={"username": "admin", "password": "Password@123"})
+
+    assert client.get("/api/check-login", headers=auth_headers).status_code == 401
+
+
+def test_location_update_refreshes_the_cached_user(app, client, auth_headers):
+    client.get("/api/check-login", headers=auth_headers)
+    response = client.put("/api/users/location", json={"latitude": 10.5, "longitude": 106.25}, headers=auth_headers)
+    assert response.status_code == 200
+
+    token = auth_headers["Authorization"].split()[1]
+    with app.test_request_context():
+        user = token_cache.get_user(token)
+        assert (user.latitude, user.longitude) == (10.5, 106.25)
+
+
+@pytest.fixture
+def admin_token(app, auth_headers):
+    return auth_headers["Authorization"].split()[1]
+
+
+def test_cache_entries_expire(app, admin_token):
+    cache = TokenCache(max_entries=10, ttl_seconds=0)
+    with app.app_context():
+        cache.get_user(admin_token)
+        assert cache.get_user(admin_token).username == "admin"
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_cache_counts_hits_and_ignores_unknown_tokens(app, admin_token):
+    cache = TokenCache(max_entries=10, ttl_seconds=60)
+    with app.app_context():
+        assert cache.get_user("no-such-token") is None
+        first = cache.get_user(admin_token)
+        assert cache.get_user(admin_token).username == "admin"
+    assert (cache.hits, cache.misses, cache.stats()["entries"]) == (1, 2, 1)
+
+    cache.invalidate_user(first.id)
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_evicts_the_least_recently_used_token():
+    cache = TokenCache(max_entries=2, ttl_seconds=60)
+    for user_id in (1, 2, 3):
+        cache.put(f"token-{user_id}", User(id=user_id, username=f"user{user_id}", password_hash="x"))
+
+    assert list(cache.entries) == ["token-2", "token-3"]
+    assert set(cache.tokens_by_user) == {2, 3}
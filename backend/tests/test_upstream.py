@@ -0,0 +1,148 @@
+import asyncio
+import time
+import httpx
+import pytest
+from service import ClientRegistry
+from upstream import AsyncResilientTransport, CircuitBreaker, CircuitOpenError, ResilientTransport, Upstream
+
+
+def make_upstream(max_retries=2, failure_threshold=2, reset_seconds=0.05, backoff_max=8):
+    return Upstream(
+        "test", connect_timeout=1, read_timeout=1, max_connections=1, max_retries=max_retries,
+        backoff_base=0, backoff_max=backoff_max, failure_threshold=failure_threshold, reset_seconds=reset_seconds
+    )
+
+
+"""explain: A client whose requests get the given statuses in turn (the last one repeats); calls counts the requests that reached the handler."""
+def scripted_client(upstream, *statuses):
+    calls = []
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(statuses[min(len(calls), len(statuses)) - 1])
+    return httpx.Client(transport=ResilientTransport(upstream, httpx.MockTransport(handler))), calls
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+
+    assert breaker.record_failure() is False
+    assert breaker.record_failure() is True
+    assert (breaker.state, breaker.allow()) == ("open", False)
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow() is True
+    assert breaker.allow() is False # Only one trial at a time
+
+    assert breaker.record_failure() is False # Failed trial: open again, not a new opening
+    assert (breaker.state, breaker.allow()) == ("open", False)
+
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    breaker.record_success()
+    assert (breaker.state, breaker.allow(), breaker.failures) == ("closed", True, 0)
+
+
+def test_released_trial_frees_the_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+
+    assert breaker.allow() is True
+    breaker.release()
+    assert breaker.allow() is True
+
+
+def test_retryable_statuses_are_retried_until_success():
+    upstream = make_upstream()
+    client, calls = scripted_client(upstream, 503, 429, 200)
+
+    assert client.get("http://upstream.test/").status_code == 200
+
+    assert len(calls) == 3
+    stats = upstream.metrics.snapshot()
+    assert (stats["requests"], stats["retries"], stats["failures"]) == (1, 2, 0)
+    assert upstream.breaker.state == "closed"
+
+
+def test_other_errors_are_not_retried():
+    upstream = make_upstream()
+    client, calls = scripted_client(upstream, 400)
+
+    assert client.get("http://upstream.test/").status_code == 400
+    assert len(calls) == 1
+    assert upstream.metrics.snapshot()["failures"] == 0
+
+
+def test_failing_upstream_opens_the_circuit_and_fails_fast():
+    upstream = make_upstream(max_retries=1, failure_threshold=2)
+    client, calls = scripted_client(upstream, 503)
+
+    assert [client.get("http://upstream.test/").status_code for _ in range(2)] == [503, 503]
+    assert len(calls) == 4 # Two requests, one retry each
+
+    with pytest.raises(CircuitOpenError):
+        client.get("http://upstream.test/")
+    assert len(calls) == 4
+    stats = upstream.metrics.snapshot()
+    assert (stats["failures"], stats["rejected"], stats["circuit_opened"]) == (2, 1, 1)
+
+    time.sleep(0.06)
+    client, calls = scripted_client(upstream, 200)
+    assert client.get("http://upstream.test/").status_code == 200 # The trial closes the circuit
+    assert upstream.breaker.state == "closed"
+
+
+def test_connection_errors_are_retried_then_raised():
+    upstream = make_upstream(max_retries=2)
+    attempts = []
+    def handler(request):
+        attempts.append(request)
+        raise httpx.ConnectError("refused", request=request)
+    client = httpx.Client(transport=ResilientTransport(upstream, httpx.MockTransport(handler)))
+
+    with pytest.raises(httpx.ConnectError):
+        client.get("http://upstream.test/")
+    assert len(attempts) == 3
+    assert upstream.metrics.snapshot()["failures"] == 1
+
+
+def test_retry_delay_honours_retry_after_up_to_the_maximum():
+    upstream = make_upstream(max_retries=3, backoff_max=8)
+    request = httpx.Request("GET", "http://upstream.test/")
+
+    assert upstream.retry_delay(0, httpx.Response(429, headers={"Retry-After": "2"}, request=request)) == 2
+    assert upstream.retry_delay(0, httpx.Response(503, headers={"Retry-After": "120"}, request=request)) == 8
+    assert upstream.retry_delay(0, httpx.Response(404, request=request)) is None
+    assert upstream.retry_delay(3) is None
+
+
+def test_async_transport_retries_and_releases_cancelled_trials():
+    upstream = make_upstream(failure_threshold=1, reset_seconds=0)
+    statuses = [502, 200]
+    async def handler(request):
+        if not statuses:
+            await asyncio.sleep(10) # Never answers: the request gets cancelled
+        return httpx.Response(statuses.pop(0))
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=AsyncResilientTransport(upstream, httpx.MockTransport(handler))) as client:
+            assert (await client.get("http://upstream.test/")).status_code == 200
+            upstream.breaker.record_failure() # Open; with reset_seconds=0 the next request is a trial
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.get("http://upstream.test/"), 0.05)
+        return upstream.breaker.allow() # The cancelled trial gave its slot back
+
+    assert asyncio.run(scenario()) is True
+    assert upstream.metrics.snapshot()["retries"] == 1
+
+
+def test_registry_shares_clients_until_reset_and_keeps_the_breakers():
+    registry = ClientRegistry()
+    client = registry.openai()
+    breaker = registry.upstreams["openai"].breaker
+
+    assert registry.openai() is client
+    registry.reset()
+    assert registry.openai() is not client
+    assert registry.upstreams["openai"].breaker is breaker
+    assert registry.metrics()["openai"]["circuit"] == "closed"
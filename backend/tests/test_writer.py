@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+import turns
+from app import db
+from config import AppConfig
+from models import Message
+from writer import GroupCommitWriter
+from conftest import stored_messages
+
+
+def stale_seq(monkeypatch):
+    # The first next_seq read from now on returns a seq another worker already took, as when two turns race
+    calls = []
+    next_seq = Message.next_seq
+    def stale(chat_id):
+        calls.append(chat_id)
+        return next_seq(chat_id) - (2 if len(calls) == 1 else 0)
+    monkeypatch.setattr(Message, "next_seq", staticmethod(stale))
+    return calls
+
+
+def save_first_turn(app, chat_id):
+    with app.app_context():
+        turns.commit_turn(chat_id, "first", "reply one")
+
+
+@pytest.fixture
+def writer(app, monkeypatch):
+    group_commit = GroupCommitWriter(True, 256, 0, 100, 10)
+    group_commit.init_app(app)
+    monkeypatch.setattr(turns, "group_commit", group_commit)
+    yield group_commit
+    group_commit.stop()
+
+
+@pytest.mark.parametrize("wait", [True, False])
+def test_writer_retries_a_turn_that_lost_the_seq_race(app, chat_id, writer, monkeypatch, wait):
+    save_first_turn(app, chat_id)
+    monkeypatch.setattr(AppConfig, "WRITE_BEHIND_WAIT_FOR_TURNS", wait)
+    calls = stale_seq(monkeypatch)
+
+    with app.app_context():
+        turns.commit_turn(chat_id, "second", "reply two")
+    writer.stop() # Commits what is still queued when the request did not wait
+
+    assert len(calls) == 2
+    assert [row[:2] for row in stored_messages(chat_id)] == [
+        ("user", "first"), ("assistant", "reply one"), ("user", "second"), ("assistant", "reply two")
+    ]
+    assert writer.stats()["failed"] == 0
+
+
+def test_inline_commit_retries_a_turn_that_lost_the_seq_race(app, chat_id, monkeypatch):
+    save_first_turn(app, chat_id)
+    calls = stale_seq(monkeypatch)
+
+    save_first_turn(app, chat_id)
+
+    assert len(calls) == 2
+    assert [row[0] for row in stored_messages(chat_id)] == ["user", "assistant"] * 2
+
+
+def test_writer_gives_up_after_its_attempts(app, chat_id, writer):
+    runs = []
+    def conflict():
+        runs.append(1)
+        db.session.add(Message(chat_id=chat_id, seq=0, role="user", content="one"))
+        db.session.add(Message(chat_id=chat_id, seq=0, role="user", content="two"))
+
+    with pytest.raises(IntegrityError):
+        writer.write(conflict, attempts=3)
+
+    assert len(runs) == 3
+    assert writer.stats()["failed"] == 1
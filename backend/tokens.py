@@ -0,0 +1,108 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+import jwt
+from app import db
+from config import AppConfig
+from models import RevokedToken
+
+"""
+    Used for :
+        _Issuing short-lived signed access tokens and longer-lived refresh tokens (AUTH_TOKEN_MODE=jwt)
+        _Verifying them by signature and expiry only, plus a small revocation list for logout
+"""
+
+JWT_ALGORITHM = "HS256"
+
+
+"""explain: Refuses settings that would let anyone forge tokens: jwt mode needs an explicit JWT_SECRET_KEY other than the public default. Called by create_app()."""
+def check_settings():
+    mode = AppConfig.AUTH_TOKEN_MODE
+    if mode not in ("opaque", "jwt"):
+        raise RuntimeError(f"AUTH_TOKEN_MODE must be 'opaque' or 'jwt', not {mode!r}")
+    if mode == "jwt" and AppConfig.JWT_SECRET_KEY in (None, "", AppConfig.DEFAULT_SECRET_KEY):
+        raise RuntimeError("AUTH_TOKEN_MODE=jwt requires JWT_SECRET_KEY to be set to a private value")
+
+
+"""explain: Cheap check for the JWT shape (header.payload.signature); opaque uuid4 tokens never contain dots."""
+def looks_like_jwt(token):
+    return token.count('.') == 2
+
+
+def _encode(user, token_type, ttl_seconds):
+    now = int(time.time())
+    claims = {
+        "sub": str(user.id),
+        "username": user.username,
+        "type": token_type,
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + ttl_seconds,
+    }
+    return jwt.encode(claims, AppConfig.JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+"""explain: Issues an access/refresh token pair for a user, in the shape returned by /api/login."""
+def issue_tokens(user):
+    return {
+        "token": _encode(user, "access", AppConfig.ACCESS_TOKEN_TTL_SECONDS),
+        "refresh_token": _encode(user, "refresh", AppConfig.REFRESH_TOKEN_TTL_SECONDS),
+        "expires_in": AppConfig.ACCESS_TOKEN_TTL_SECONDS,
+    }
+
+
+"""explain: Returns the claims of a valid, unrevoked token of the expected type, or None (always None outside jwt mode). No database access unless the revocation list is due for a refresh."""
+def decode_token(token, expected_type="access"):
+    if AppConfig.AUTH_TOKEN_MODE != "jwt":
+        return None
+    try:
+        claims = jwt.decode(
+            token, AppConfig.JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM],
+            options={"require": ["exp", "sub", "jti"]}
+        )
+    except jwt.InvalidTokenError:
+        return None
+    if claims.get("type") != expected_type or revocation_list.is_revoked(claims["jti"]):
+        return None
+    return claims
+
+
+class RevocationList():
+    """
+    Used for :
+        _jti values of tokens revoked before they expire (logout, refresh rotation), stored in revoked_token
+        _An in-process copy refreshed every REVOCATION_REFRESH_SECONDS so verification stays in memory
+    """
+    def __init__(self, refresh_seconds):
+        self.refresh_seconds = refresh_seconds
+        self.revoked = set()
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def is_revoked(self, jti):
+        self._refresh_if_due()
+        return jti in self.revoked
+
+    """explain: Revokes a token until its own expiry; expired rows are pruned on the way."""
+    def revoke(self, claims):
+        expires_at = datetime.fromtimestamp(claims["exp"], tz=timezone.utc).replace(tzinfo=None)
+        now = datetime.utcnow()
+        RevokedToken.query.filter(RevokedToken.expires_at < now).delete(synchronize_session=False)
+        if not db.session.get(RevokedToken, claims["jti"]):
+            db.session.add(RevokedToken(jti=claims["jti"], expires_at=expires_at))
+        db.session.commit()
+        with self.lock:
+            self.revoked.add(claims["jti"])
+
+    def _refresh_if_due(self):
+        now = time.monotonic()
+        if self.loaded_at is not None and now - self.loaded_at < self.refresh_seconds:
+            return
+        rows = db.session.query(RevokedToken.jti).filter(RevokedToken.expires_at >= datetime.utcnow()).all()
+        with self.lock:
+            self.revoked = {jti for jti, in rows}
+            self.loaded_at = now
+
+
+revocation_list = RevocationList(AppConfig.REVOCATION_REFRESH_SECONDS)
@@ -0,0 +1,312 @@
+import hashlib
+import logging
+import time
+from datetime import datetime
+from flask import jsonify, request
+from app import db
+from config import AppConfig
+from context import ContextBuilder
+from models import Chat, Message
+from retrieval import document_block_cache, retrieve_chunks, format_chunks
+from intents import intent_router
+from response_cache import response_cache
+from metrics import timed, record_stage, record_token_usage
+from logs import fields
+from utils import RestaurantHandle, ReasoningStreamParser, parse_reasoning_response
+from writer import group_commit
+
+"""
+    Used for :
+        _Everything in a chat turn except the OpenAI call itself: building the request before it, saving the turn after it
+        _Shared by the Flask view (blocking client) and the ASGI entry point in asgi.py (AsyncOpenAI),
+         so both serving modes answer a message the same way
+"""
+
+DEFAULT_MODEL = "gpt-4o"
+
+logger = logging.getLogger(__name__)
+
+BASE_SYSTEM_MESSAGE = (
+    "You are Merlin, a helpful AI assistant. Provide detailed, accurate, and relevant responses. "
+    "Be concise when appropriate but comprehensive when needed. "
+    "If the user asks about coding, provide clear code examples using markdown code blocks. "
+    "For HTML snippets, use ```html ... ```. For Python, use ```python ... ```, etc. "
+    "Structure your answers clearly using paragraphs, lists, or other formatting as needed."
+)
+
+REASONING_INSTRUCTIONS = (
+    "\n\nIMPORTANT: Structure your response as follows:\n"
+    "1. First, provide your step-by-step reasoning within <reasoning> tags. Explain how you interpret the request, relevant context (like documents), and how you arrive at the answer.\n"
+    "2. After the reasoning, provide the final, direct answer to the user's query within <answer> tags.\n"
+    "Example:\n<reasoning>\nThe user is asking about X based on the provided document Z. Document Z states Y. Therefore, the answer involves combining information about X and Y.\n</reasoning>\n<answer>\nBased on document Z, the details about X are Y.\n</answer>"
+)
+
+"""explain: Appends a user/assistant turn to the chat's message table and bumps chat.updated_at. Only the two new rows are written, however long the history is."""
+def save_turn(chat_id, user_content, assistant_content, reasoning=None, usage=None):
+    seq = Message.next_seq(chat_id)
+    Chat.query.filter_by(id=chat_id).update({"updated_at": datetime.utcnow()}, synchronize_session=False) # Moves the chat to the top of the list
+    db.session.add(Message(chat_id=chat_id, seq=seq, role='user', content=user_content))
+    db.session.add(Message(
+        chat_id=chat_id, seq=seq + 1, role='assistant', content=assistant_content, reasoning=reasoning, **(usage or {})
+    ))
+
+
+"""explain: Saves and commits a turn (through the write-behind queue when enabled). Concurrent turns in the same chat can race for the same seq; the loser takes the next one, also when the writer thread commits it after the request has returned."""
+def commit_turn(chat_id, user_content, assistant_content, reasoning=None, usage=None, attempts=3, timings=None):
+    with timed("db_commit", timings):
+        group_commit.write(
+            lambda: save_turn(chat_id, user_content, assistant_content, reasoning, usage), # Reads next_seq on every attempt
+            wait=AppConfig.WRITE_BEHIND_WAIT_FOR_TURNS,
+            attempts=attempts # Unique (chat_id, seq)
+        )
+
+
+"""explain: Reads a send-message request (form fields message, use_reasoning, stream) for the authenticated user and returns its prepared ChatTurn, or an error response when the request is rejected."""
+def turn_from_request(chat_id):
+    chat = Chat.query.filter_by(id=chat_id, user_id=request.user.id).first()
+    if not chat:
+        return jsonify({"error": "Chat not found or access denied"}), 404
+
+    message = request.form.get("message")
+    use_reasoning_flag = request.form.get("use_reasoning", "false").lower() == "true"
+    # Stream tokens back as server-sent events instead of waiting for the full completion
+    stream_flag = request.form.get("stream", "false").lower() == "true"
+
+    if not message or not message.strip():
+        return jsonify({"error": "Message cannot be empty"}), 400
+
+    return ChatTurn(chat.id, message.strip(), use_reasoning_flag, stream_flag).prepare(request.user)
+
+
+class ChatTurn():
+    """
+    Used for :
+        _One user message: the OpenAI request prepared for it and the parsing/saving of the reply
+        _Holds only plain values after prepare(), so the slow completion can run outside any DB session
+    """
+    def __init__(self, chat_id, message, use_reasoning_flag=False, stream=False):
+        self.chat_id = chat_id
+        self.message = message
+        self.use_reasoning_flag = use_reasoning_flag
+        self.stream = stream
+        self.openai_model = DEFAULT_MODEL
+        self.openai_api_messages = None
+        self.max_tokens = 4096
+        self.parse_reasoning = use_reasoning_flag
+        self.error_message = "Sorry, I encountered an error processing your request"
+        self.immediate_response = None # Set when the turn is answered without calling OpenAI
+        self.document_hash = None # SHA-256 of the document context sent with this turn
+        self.cache_key = None # Response cache key; None when the turn is not cacheable
+        self.usage = None # Token usage reported by the API, saved on the assistant message
+        self.lease = None # Rate limit lease held until the reply is finished (ASGI path)
+        self.timings = {} # Stage durations in ms, logged when the turn finishes
+        self.completion_started = None
+        self.parser = ReasoningStreamParser()
+
+    """explain: Builds the OpenAI request (documents, history, restaurant lookups) inside an app context. When the turn can be answered without OpenAI (location prompt, response cache hit) it is saved right away and immediate_response is set instead."""
+    def prepare(self, user):
+        if not self.use_reasoning_flag: # Check location/food only if not explicitly in reasoning mode
+            analysis = intent_router.analyze(self.message)
+            if analysis.has("restaurant"):
+                if response_cache.enabled:
+                    response_cache.bypass() # Answers depend on the user's location and live Places data
+                self._prepare_restaurant(user, analysis.get("cuisine"))
+                return self
+        with timed("prompt", self.timings):
+            system_prompt = self._prepare_default()
+        if response_cache.enabled:
+            self._answer_from_cache(system_prompt)
+        return self
+
+    def _prepare_restaurant(self, user, keywords):
+        if user.latitude is None or user.longitude is None:
+            logger.info("Restaurant query without a known location", extra=fields(chat_id=self.chat_id))
+            response_text = "I can help with restaurant suggestions! Please share your location first by clicking the 'Share Location' button."
+            try:
+                commit_turn(self.chat_id, self.message, response_text, timings=self.timings)
+            except Exception as e:
+                db.session.rollback()
+                logger.error("DB error saving location prompt", extra=fields(chat_id=self.chat_id, error=e))
+            self.immediate_response = {"reasoning": None, "response": response_text}
+            return
+
+        logger.info("Restaurant query", extra=fields(chat_id=self.chat_id, keywords=",".join(keywords or [])))
+        restaurant_handle = RestaurantHandle()
+        with timed("places", self.timings):
+            restaurants = restaurant_handle.get_restaurants(user.latitude, user.longitude, keywords)
+        formatted_restaurants = restaurant_handle.format_restaurants(restaurants)
+
+        prompt = (
+            f"User's location: ({user.latitude}, {user.longitude})\n"
+            f"User's message: {self.message}\n"
+            f"{formatted_restaurants}\n"
+            "Task: Suggest one or more restaurants based on the user's preferences (or lack thereof). "
+            "For each restaurant, provide the following details:\n"
+            "1. Name of the restaurant\n"
+            "2. Notable reason(s) to recommend it\n"
+            "3. Address\n"
+            f"4. Google Maps Link: Use this format: put the name of the restaurant as a link: https://www.google.com/maps/search/?api=1&query={user.latitude},{user.longitude}\n"
+            "5. Google Maps: display an iframe of google map"
+            "If preferences are unclear, suggest a variety of options and explain why each is a good choice. "
+            "Ask follow-up questions if needed to clarify their food interests."
+        )
+        self.openai_api_messages = [
+            {"role": "system", "content": BASE_SYSTEM_MESSAGE}, # Food query doesn't need reasoning tags
+            {"role": "user", "content": prompt}
+        ]
+        self.max_tokens = 1024
+        self.parse_reasoning = False
+        self.error_message = "Sorry, I encountered an error while looking for restaurants"
+
+    def _prepare_default(self):
+        # Prompt = stable prefix (base instructions + whole document block) + history + per-turn suffix.
+        # Keeping the prefix byte-identical across turns lets the API reuse its prompt cache for it.
+        context_builder = ContextBuilder()
+        system_message = BASE_SYSTEM_MESSAGE
+        suffix = []
+        document_tokens = 0
+        block = document_block_cache.get(self.chat_id, context_builder.document_budget)
+        if block is not None and block.fits:
+            system_message += f"\n\nCONTEXT FROM UPLOADED DOCUMENTS:\n{block.text}"
+            document_tokens = block.tokens
+            self.document_hash = block.sha256
+        elif block is not None:
+            # Too large to send whole: only the chunks relevant to this question, after the history
+            retrieved_chunks = retrieve_chunks(self.chat_id, self.message)
+            # Nothing matched lexically (e.g. "summarize this"): fall back to the start of the documents
+            document_text = format_chunks(retrieved_chunks) if retrieved_chunks else block.text
+            document_context, document_tokens = context_builder.build_documents(document_text)
+            suffix.append(f"CONTEXT FROM UPLOADED DOCUMENTS (excerpts relevant to the next message):\n{document_context}")
+            self.document_hash = hashlib.sha256(document_context.encode()).hexdigest()
+        # Reasoning instructions ONLY if reasoning mode is active, and outside the cached prefix
+        if self.use_reasoning_flag:
+            suffix.append(REASONING_INSTRUCTIONS.strip())
+        # Replay the most recent turns that fit the token budget, reading history newest first
+        history_seconds = [0.0]
+        def history():
+            rows = iter(Message.query.filter_by(chat_id=self.chat_id).order_by(Message.seq.desc()).yield_per(100))
+            while True:
+                started = time.perf_counter()
+                msg = next(rows, None)
+                history_seconds[0] += time.perf_counter() - started
+                if msg is None:
+                    return
+                yield {"role": msg.role, "content": msg.content}
+        self.openai_api_messages, context_stats = context_builder.build(
+            system_message, history(), self.message, suffix="\n\n".join(suffix)
+        )
+        record_stage("history", history_seconds[0], self.timings)
+        context_stats["document_tokens"] = document_tokens
+        logger.debug("Context built", extra=fields(
+            chat_id=self.chat_id, model=self.openai_model, reasoning=self.use_reasoning_flag, **context_stats
+        ))
+        # The instructions without the document text, which the cache key covers through document_hash
+        return "\n\n".join([BASE_SYSTEM_MESSAGE] + ([REASONING_INSTRUCTIONS] if self.use_reasoning_flag else []))
+
+    def _answer_from_cache(self, system_prompt):
+        self.cache_key = response_cache.key(
+            self.openai_model, system_prompt, self.document_hash, self.openai_api_messages,
+            self.message, self.use_reasoning_flag, self.max_tokens
+        )
+        cached = response_cache.get(self.cache_key)
+        if cached is None:
+            return
+        logger.info("Response cache hit", extra=fields(chat_id=self.chat_id))
+        try:
+            commit_turn(self.chat_id, self.message, cached["response"], cached["reasoning"], timings=self.timings)
+        except Exception as e:
+            db.session.rollback()
+            logger.error("DB error saving cached response", extra=fields(chat_id=self.chat_id, error=e))
+            return # Fall back to a regular completion
+        self.cache_key = None
+        self.immediate_response = cached
+
+    """explain: Arguments for chat.completions.create. Called right before the request, so it also starts the openai stage timer."""
+    def completion_args(self, stream=False):
+        self.completion_started = time.perf_counter()
+        args = {"model": self.openai_model, "messages": self.openai_api_messages, "max_tokens": self.max_tokens}
+        if stream:
+            args.update(stream=True, stream_options={"include_usage": True}) # Usage arrives in a final chunk
+        return args
+
+    """explain: Keeps the token usage of the completion (prompt, cached prompt, completion) to save with the reply."""
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.usage = {
+            "prompt_tokens": usage.prompt_tokens,
+            "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+            "completion_tokens": usage.completion_tokens,
+        }
+        record_token_usage(self.openai_model, self.usage)
+
+    """explain: Parses a complete (non-streamed) reply, saves the turn and returns the response payload."""
+    def complete(self, ai_response_text, usage=None):
+        self._completion_finished()
+        self.record_usage(usage)
+        extracted_reasoning = None
+        extracted_answer = ai_response_text # Default if not in reasoning mode or parsing fails
+        if self.parse_reasoning:
+            extracted_reasoning, extracted_answer = parse_reasoning_response(ai_response_text)
+            if extracted_reasoning is None:
+                logger.warning("Could not parse reasoning tags", extra=fields(chat_id=self.chat_id, model=self.openai_model))
+                # Keep the full response as the answer if parsing fails but reasoning was expected
+                extracted_answer = ai_response_text
+        return self._save(extracted_reasoning, extracted_answer)
+
+    """explain: Turns one streamed delta into the (section, text) events forwarded to the client."""
+    def stream_events(self, delta):
+        if "openai_first_token_ms" not in self.timings and self.completion_started is not None:
+            record_stage("openai_first_token", time.perf_counter() - self.completion_started, self.timings)
+        if self.parse_reasoning:
+            return self.parser.feed(delta)
+        self.parser.text.append(delta)
+        return [("answer", delta)]
+
+    """explain: Ends a streamed reply. Returns the events held back by the parser and the response payload of the saved turn."""
+    def finish_stream(self):
+        self._completion_finished()
+        if not self.parse_reasoning:
+            return [], self._save(None, self.parser.full_text())
+        events = self.parser.flush()
+        extracted_reasoning, extracted_answer = self.parser.result()
+        if extracted_reasoning is None:
+            logger.warning("Could not parse reasoning tags from stream", extra=fields(chat_id=self.chat_id, model=self.openai_model))
+            extracted_answer = self.parser.full_text()
+        return events, self._save(extracted_reasoning, extracted_answer)
+
+    """explain: Rolls back, saves the error as the assistant reply and returns the error payload."""
+    def fail(self, error):
+        db.session.rollback()
+        self._completion_finished()
+        logger.error("OpenAI call failed", extra=fields(chat_id=self.chat_id, model=self.openai_model, error=error, **self.timings))
+        error_message = f"{self.error_message}: {str(error)}"
+        try:
+            commit_turn(self.chat_id, self.message, error_message, timings=self.timings) # Save error with null reasoning
+        except Exception as db_err:
+            db.session.rollback()
+            logger.error("DB error saving error message", extra=fields(chat_id=self.chat_id, error=db_err))
+        return {"reasoning": None, "response": error_message}
+
+    def _completion_finished(self):
+        if self.completion_started is not None:
+            record_stage("openai", time.perf_counter() - self.completion_started, self.timings)
+            self.completion_started = None
+
+    def _save(self, extracted_reasoning, extracted_answer):
+        commit_turn(self.chat_id, self.message, extracted_answer, extracted_reasoning, self.usage, timings=self.timings)
+        if self.cache_key is not None and extracted_answer:
+            response_cache.put(self.cache_key, self.openai_model, extracted_reasoning, extracted_answer)
+        logger.info("Turn finished", extra=fields(
+            chat_id=self.chat_id, model=self.openai_model, stream=self.stream, **self.timings, **(self.usage or {})
+        ))
+        return {"reasoning": extracted_reasoning, "response": extracted_answer}
+
+    """explain: The (section, text) events of an immediate response, for a client that asked for a stream."""
+    def immediate_events(self):
+        events = []
+        if self.immediate_response.get("reasoning"):
+            events.append(("reasoning", self.immediate_response["reasoning"]))
+        events.append(("answer", self.immediate_response["response"]))
+        return events
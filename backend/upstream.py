@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import httpx
+from logs import fields
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _Resilience for outbound HTTP calls (OpenAI, Google Maps): pooled httpx clients with per-upstream timeouts,
+         jittered exponential backoff on 429/5xx and connection errors, and a circuit breaker
+        _Per-upstream counters for requests, retries, failures and latency
+"""
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised without contacting the upstream while its circuit breaker is open."""
+
+
+class CircuitBreaker():
+    """
+    Used for :
+        _Opening after `failure_threshold` consecutive failed requests, so a dead upstream fails fast
+        _Letting a single trial request through once `reset_seconds` have passed (half-open)
+    """
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_in_flight or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    """explain: Gives up a trial slot without an outcome (the request was cancelled)."""
+    def release(self):
+        with self.lock:
+            self.trial_in_flight = False
+
+    """explain: Counts a failed request; returns True when this failure opened the circuit."""
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if was_open or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+            return not was_open and self.opened_at is not None
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+
+class UpstreamMetrics():
+    """
+    Used for :
+        _Counters per upstream; latency covers all attempts of a request up to its final response headers
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.circuit_opened = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+
+    def record_request(self, latency, retries, ok):
+        with self.lock:
+            self.requests += 1
+            self.retries += retries
+            self.failures += 0 if ok else 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    self.latency_buckets[i] += 1
+                    break
+
+    def record_rejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def record_circuit_opened(self):
+        with self.lock:
+            self.circuit_opened += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "circuit_opened": self.circuit_opened,
+                "latency_sum": round(self.latency_sum, 6),
+                "latency_max": round(self.latency_max, 6),
+                "latency_avg": round(self.latency_sum / self.requests, 6) if self.requests else 0.0,
+                "latency_buckets": dict(zip(LATENCY_BUCKETS, self.latency_buckets)),
+            }
+
+
+class Upstream():
+    """
+    Used for :
+        _The policy, breaker and metrics of one upstream, shared by every sync and async client built for it
+    """
+    def __init__(self, name, connect_timeout, read_timeout, max_connections,
+                 max_retries, backoff_base, backoff_max, failure_threshold, reset_seconds):
+        self.name = name
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_connections, 100)
+        )
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.metrics = UpstreamMetrics()
+
+    def client(self, **kwargs):
+        transport = ResilientTransport(self, httpx.HTTPTransport(limits=self.limits))
+        return httpx.Client(transport=transport, timeout=self.timeout, **kwargs)
+
+    def async_client(self, **kwargs):
+        transport = AsyncResilientTransport(self, httpx.AsyncHTTPTransport(limits=self.limits))
+        return httpx.AsyncClient(transport=transport, timeout=self.timeout, **kwargs)
+
+    def check_circuit(self, request):
+        if not self.breaker.allow():
+            self.metrics.record_rejected()
+            raise CircuitOpenError(f"{self.name} circuit breaker is open", request=request)
+
+    """explain: Seconds to wait before the next attempt, or None when the outcome is final. Full jitter over an exponential window; a numeric Retry-After header is honoured up to backoff_max."""
+    def retry_delay(self, attempt, response=None):
+        if attempt >= self.max_retries:
+            return None
+        if response is not None:
+            if response.status_code not in RETRY_STATUSES:
+                return None
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.replace(".", "", 1).isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def finish(self, started, attempt, ok):
+        self.metrics.record_request(time.monotonic() - started, attempt, ok)
+        if ok:
+            self.breaker.record_success()
+        elif self.breaker.record_failure():
+            self.metrics.record_circuit_opened()
+            logger.warning("Circuit breaker opened", extra=fields(upstream=self.name))
+
+
+class ResilientTransport(httpx.BaseTransport):
+    def __init__(self, upstream, transport):
+        self.upstream = upstream
+        self.transport = transport
+
+    def handle_request(self, request):
+        self.upstream.check_circuit(request)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                response = self.transport.handle_request(request)
+            except RETRY_ERRORS:
+                delay = self.upstream.retry_delay(attempt)
+                if delay is None:
+                    self.upstream.finish(started, attempt, ok=False)
+                    raise
+            except Exception:
+                self.upstream.finish(started, attempt, ok=False)
+                raise
+            else:
+                delay = self.upstream.retry_delay(attempt, response)
+                if delay is None:
+                    self.upstream.finish(started, attempt, ok=response.status_code not in RETRY_STATUSES)
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(self, upstream, transport):
+        self.upstream = upstream
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        self.upstream.check_circuit(request)
+        try:
+            return await self._send(request)
+        except asyncio.CancelledError:
+            self.upstream.breaker.release()
+            raise
+
+    async def _send(self, request):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except RETRY_ERRORS:
+                delay = self.upstream.retry_delay(attempt)
+                if delay is None:
+                    self.upstream.finish(started, attempt, ok=False)
+                    raise
+            except Exception:
+                self.upstream.finish(started, attempt, ok=False)
+                raise
+            else:
+                delay = self.upstream.retry_delay(attempt, response)
+                if delay is None:
+                    self.upstream.finish(started, attempt, ok=response.status_code not in RETRY_STATUSES)
+                    return response
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
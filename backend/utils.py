@@ -1,8 +1,19 @@
 from flask import jsonify, request
 from functools import wraps
 import urllib.parse # For URL encoding
+import logging
 import re
-from service import GoogleMapService
+from service import clients
+from places import places_cache,place_index
+from config import AppConfig
+from intents import intent_router
+from middleware import token_cache
+from metrics import timed
+from logs import fields
+from models import User
+from writer import group_commit
+
+logger = logging.getLogger(__name__)
 
 class LocationHandle(): 
     def __init__(self,data,user,db):
@@ -26,8 +37,10 @@ class LocationHandle():
             return jsonify({"error": "Invalid longitude format"}), 400
         return None,None            
     def saveToDB(self,latitude,longitude): 
+        user_id = self.user.id
         try:
-            self.db.session.commit()
+            group_commit.write(lambda: User.query.filter_by(id=user_id).update({"latitude": latitude, "longitude": longitude}))
+            token_cache.invalidate_user(self.user.id) # Cached snapshot holds the old coordinates
             if latitude is not None and longitude is not None:
                 message = "Location updated successfully"
             else:
@@ -35,18 +48,17 @@ class LocationHandle():
             return jsonify({"message": message}), 200
         except Exception as e:
             self.db.session.rollback()
-            print(f"Error updating location in DB: {e}")
+            logger.exception("Error updating location in DB")
             return jsonify({"error": "Database error updating location"}), 500
 
 
 
 class RestaurantHandle(): 
     """explain: Fetches nearby restaurants using the Google Maps Places API based on latitude, longitude, optional keywords, and radius."""
-    def get_restaurants(latitude, longitude, keywords=None, radius=1000):
-        ggmap_handle = GoogleMapService
-        gmaps = ggmap_handle.getGmaps()
-        if not gmaps: # Check if googlemaps client is initialized
-            print("Google Maps client not available. Cannot fetch restaurants.")
+    def get_restaurants(self, latitude, longitude, keywords=None, radius=1000):
+        gmaps = clients.maps()
+        if not gmaps.http: # Check if the Places client is initialized (API key set)
+            logger.warning("Google Maps client not available. Cannot fetch restaurants.")
             return []
         params = {
             'location': (latitude, longitude),
@@ -56,31 +68,40 @@ class RestaurantHandle():
         if keywords:
             # Join keywords for the Places API query
             params['keyword'] = ' '.join(keywords)
+        # Same cell, radius and keyword set as a recent query: reuse its results
+        cache_key = places_cache.key(latitude, longitude, radius, keywords, params['type'])
+        cached = places_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        if keywords:
+            # Known cuisine around here: answer from places fetched earlier when there are enough fresh ones
+            local_results = place_index.nearby(
+                latitude, longitude, radius, keywords,
+                AppConfig.PLACE_INDEX_MIN_RESULTS, AppConfig.PLACE_INDEX_MAX_AGE_SECONDS
+            )
+            if local_results is not None:
+                logger.info("Restaurants served from the local place index", extra=fields(results=len(local_results)))
+                places_cache.put(cache_key, local_results)
+                return local_results
         try:
-            print(f"Querying Google Places API with params: {params}") # Debug log
-            results = gmaps.places_nearby(**params)
-            # print(f"Places API response: {results}") # Debug log (can be verbose)
-            return results.get('results', [])
+            logger.debug("Querying Google Places API", extra=fields(radius=radius, keyword=params.get('keyword', '')))
+            with timed("places_api"):
+                results = gmaps.places_nearby(**params)
+            places_cache.put(cache_key, results)
+            place_index.record([
+                (r, set(keywords or []) | set(self.extract_food_keywords(r.get('name', '')))) for r in results
+            ])
+            return results
         except Exception as e:
-            print(f"Error fetching restaurants from Google Maps API: {e}")
+            logger.error("Error fetching restaurants from Google Maps API", extra=fields(error=e))
             return []
-    def extract_food_keywords(message):
-    # Expanded list of common food types and cuisines
-        food_types = [
-            'italian', 'chinese', 'japanese', 'mexican', 'indian', 'american', 'french',
-            'mediterranean', 'middle eastern', 'vietnamese', 'pho', 'thai', 'greek', 'spanish',
-            'german', 'russian', 'african', 'caribbean', 'south american', 'korean', 'bbq',
-            'pizza', 'burger', 'sandwiches', 'sushi', 'ramen', 'tapas', 'steak', 'seafood',
-            'vegetarian', 'vegan', 'gluten-free', 'bakery', 'cafe', 'coffee', 'dessert', 'brunch'
-        ]
-        lower_message = message.lower()
-        # Return keywords found in the message
-        return [food for food in food_types if food in lower_message]
+    """explain: Returns the cuisines and food types mentioned in a message (whole words only)."""
+    def extract_food_keywords(self, message):
+        return intent_router.match(message).get('cuisine', [])
 
     """explain: Formats a list of restaurant data into a string suitable for providing context to the LLM."""
-    def format_restaurants(restaurants):
-        ggmap_handle = GoogleMapService
-        gmaps,GOOGLE_MAPS_API_KEY = ggmap_handle.getGmaps()
+    def format_restaurants(self, restaurants):
+        GOOGLE_MAPS_API_KEY = clients.maps().GOOGLE_MAPS_API_KEY
         if not restaurants:
             return "Context: No relevant restaurants found in the immediate vicinity based on the query.\n"
         # Limit context size to avoid overly long prompts
@@ -139,3 +160,77 @@ def parse_reasoning_response(response_text):
              answer = "..." # Placeholder if only reasoning was somehow returned
 
     return reasoning, answer
+
+
+"""explain: Incrementally splits a streamed AI response into reasoning and answer sections, holding back partial tags until enough text has arrived to decide."""
+class ReasoningStreamParser():
+    TAGS = {
+        '<reasoning>': 'reasoning',
+        '</reasoning>': None,
+        '<answer>': 'answer',
+        '</answer>': None,
+    }
+
+    def __init__(self):
+        self.section = None # None means text outside of any tag
+        self.pending = ""
+        self.text = []
+        self.parts = {'reasoning': [], 'answer': [], None: []}
+        self.seen = set()
+
+    """explain: Consumes a chunk of streamed text and returns (section, text) events that are safe to forward. Text outside tags is reported as 'answer'."""
+    def feed(self, delta):
+        self.text.append(delta)
+        self.pending += delta
+        events = []
+        while self.pending:
+            tag_start = self.pending.find('<')
+            if tag_start == -1:
+                self._emit(self.pending, events)
+                self.pending = ""
+                break
+            if tag_start > 0:
+                self._emit(self.pending[:tag_start], events)
+                self.pending = self.pending[tag_start:]
+
+            lowered = self.pending.lower()
+            tag = next((t for t in self.TAGS if lowered.startswith(t)), None)
+            if tag:
+                self.section = self.TAGS[tag]
+                if self.section:
+                    self.seen.add(self.section)
+                self.pending = self.pending[len(tag):]
+                continue
+            if any(t.startswith(lowered) for t in self.TAGS):
+                break # Possibly a tag split across chunks, wait for more text
+            self._emit(self.pending[0], events)
+            self.pending = self.pending[1:]
+        return events
+
+    """explain: Flushes any text held back at the end of the stream."""
+    def flush(self):
+        events = []
+        if self.pending:
+            self._emit(self.pending, events)
+            self.pending = ""
+        return events
+
+    """explain: Returns (reasoning, answer) with the same semantics as parse_reasoning_response."""
+    def result(self):
+        reasoning = None
+        if 'reasoning' in self.seen:
+            reasoning = "".join(self.parts['reasoning']).strip()
+        if 'answer' in self.seen:
+            answer = "".join(self.parts['answer']).strip()
+        elif reasoning is not None:
+            answer = "".join(self.parts[None]).strip() or "..."
+        else:
+            answer = self.full_text()
+        return reasoning, answer
+
+    def full_text(self):
+        return "".join(self.text)
+
+    def _emit(self, text, events):
+        self.parts[self.section].append(text)
+        events.append((self.section or 'answer', text))
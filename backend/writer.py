@@ -0,0 +1,187 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy.exc import IntegrityError
+from app import db
+from config import AppConfig
+from logs import fields
+
+logger = logging.getLogger(__name__)
+
+"""
+    Used for :
+        _Optional write-behind persistence (WRITE_BEHIND_ENABLED=true): chat turns, login/logout tokens and location
+         updates are handed to one writer thread per process, which applies everything queued in a single transaction,
+         so concurrent requests share one commit (and one fsync) instead of contending for SQLite's write lock
+        _write(fn) calls fn() with the writer's db.session and returns its result once committed; wait=False returns
+         right away (errors are then only logged). Disabled, write(fn) runs fn() and commits in the calling thread
+        _write(fn, attempts=n) runs fn() again in a new transaction when the commit hits an IntegrityError, on whichever
+         thread commits it, so the retry also happens after a wait=False caller has moved on. fn must recompute what
+         conflicted (e.g. the next seq) each time it is called
+        _fn must not use objects of the request's session: it gets its own session, so pass ids and plain values
+"""
+
+
+class WriteOp():
+    def __init__(self, fn, attempts=1):
+        self.fn = fn
+        self.attempts = max(1, attempts)
+        self.future = Future()
+
+
+class GroupCommitWriter():
+    STOP = object()
+
+    def __init__(self, enabled, max_batch, max_delay_ms, queue_size, ack_timeout):
+        self.enabled = enabled
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay_ms / 1000
+        self.queue_size = queue_size
+        self.ack_timeout = ack_timeout
+        self.app = None
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.ops = 0
+        self.batches = 0
+        self.failed = 0
+        self.largest_batch = 0
+
+    def init_app(self, app):
+        self.app = app
+
+    """explain: Runs fn() and commits, through the writer thread when write-behind is enabled. With wait=True the result (or the exception raised by fn / the commit) comes back to the caller."""
+    def write(self, fn, wait=True, attempts=1):
+        if not self.enabled or self.app is None:
+            return self._apply(fn, attempts)
+        op = WriteOp(fn, attempts)
+        self._ensure_started()
+        self.queue.put(op, timeout=self.ack_timeout) # A full queue pushes back on the requests
+        if wait:
+            return op.future.result(timeout=self.ack_timeout)
+        return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "queued": self.queue.qsize(),
+                "ops": self.ops,
+                "batches": self.batches,
+                "failed": self.failed,
+                "largest_batch": self.largest_batch,
+                "ops_per_batch": round(self.ops / self.batches, 2) if self.batches else 0.0,
+            }
+
+    def stop(self):
+        thread = self.thread
+        if thread is not None and thread.is_alive():
+            self.queue.put(self.STOP)
+            thread.join(timeout=self.ack_timeout) # Commits what is still queued
+
+    def _ensure_started(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self.thread.start()
+
+    def _reset_after_fork(self):
+        # The parent's writer thread does not exist in a forked worker
+        self.queue = queue.Queue(self.queue_size)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._commit(batch)
+                    db.session.remove()
+                if stopping:
+                    return
+
+    """explain: Everything already queued (up to max_batch); if that is a partial batch, waits up to max_delay for more."""
+    def _next_batch(self):
+        first = self.queue.get()
+        if first is self.STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                op = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if op is self.STOP:
+                return batch, True
+            batch.append(op)
+        return batch, False
+
+    """explain: Runs fn() and commits; while the commit hits an IntegrityError, rolls back and runs fn() again, up to attempts runs in all (including the `used` ones already made)."""
+    def _apply(self, fn, attempts, used=0):
+        while True:
+            used += 1
+            try:
+                result = fn()
+                db.session.commit()
+                return result
+            except IntegrityError:
+                db.session.rollback()
+                if used >= attempts:
+                    raise
+            except Exception:
+                db.session.rollback()
+                raise
+
+    """explain: Applies a batch in one transaction. If that fails, replays its ops one transaction each, so one bad op only fails itself."""
+    def _commit(self, batch):
+        try:
+            results = [op.fn() for op in batch]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1 and not (isinstance(e, IntegrityError) and batch[0].attempts > 1):
+                self._finish(batch[0], error=e)
+            else:
+                if len(batch) > 1:
+                    logger.warning("Group commit failed, retrying its writes one by one", extra=fields(ops=len(batch), error=e))
+                for op in batch:
+                    try:
+                        self._finish(op, self._apply(op.fn, op.attempts, used=1 if len(batch) == 1 else 0))
+                    except Exception as op_error:
+                        self._finish(op, error=op_error)
+        else:
+            for op, result in zip(batch, results):
+                op.future.set_result(result)
+        with self.lock:
+            self.ops += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def _finish(self, op, result=None, error=None):
+        if error is None:
+            op.future.set_result(result)
+            return
+        with self.lock:
+            self.failed += 1
+        logger.warning("Write-behind operation failed", extra=fields(error=error))
+        op.future.set_exception(error)
+
+
+group_commit = GroupCommitWriter(
+    AppConfig.WRITE_BEHIND_ENABLED,
+    AppConfig.WRITE_BEHIND_MAX_BATCH,
+    AppConfig.WRITE_BEHIND_MAX_DELAY_MS,
+    AppConfig.WRITE_BEHIND_QUEUE_SIZE,
+    AppConfig.WRITE_BEHIND_ACK_TIMEOUT
+)
+atexit.register(group_commit.stop)
+os.register_at_fork(after_in_child=group_commit._reset_after_fork)
@@ -347,13 +347,22 @@ class ChatApp {
             return;
         }
         try {
-            const response = await fetch(`${API_BASE}/api/check-login`, {
+            let response = await fetch(`${API_BASE}/api/check-login`, {
                 method: 'GET',
                 headers: { 'Authorization': `Bearer ${token}` },
 
             });
+            // Signed access tokens are short-lived: try the refresh token once before giving up
+            if (response.status === 401 && await this.refreshAccessToken()) {
+                response = await fetch(`${API_BASE}/api/check-login`, {
+                    method: 'GET',
+                    headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` },
+                });
+            }
             const data = await response.json();
             if (response.ok && data.logged_in) { // Check response.ok as well
+                // After a page reload there is no refresh timer yet; rotate now to start one
+                if (localStorage.getItem('refreshToken') && !this.tokenRefreshTimer) this.refreshAccessToken();
                 this.showChatUI();
                 await this.loadChats();
                 this.isLocationShared = localStorage.getItem('locationShared') === 'true';
@@ -393,7 +402,7 @@ class ChatApp {
             });
             const data = await response.json();
             if (response.ok) {
-                localStorage.setItem('token', data.token);
+                this.storeTokens(data);
                 this.showChatUI();
                 await this.loadChats();
                 this.isLocationShared = localStorage.getItem('locationShared') === 'true';
@@ -409,19 +418,58 @@ class ChatApp {
         }
     }
 
+    /**
+     * explain: Saves the tokens returned by login/refresh. When the backend issues signed tokens (with a refresh token), schedules a refresh shortly before the access token expires.
+     */
+    storeTokens(data) {
+        localStorage.setItem('token', data.token);
+        clearTimeout(this.tokenRefreshTimer);
+        if (data.refresh_token) {
+            localStorage.setItem('refreshToken', data.refresh_token);
+            const refreshInMs = Math.max(10, (data.expires_in || 900) * 0.8) * 1000;
+            this.tokenRefreshTimer = setTimeout(() => this.refreshAccessToken(), refreshInMs);
+        }
+    }
+
+    /**
+     * explain: Exchanges the stored refresh token for a new token pair. Returns true on success.
+     */
+    async refreshAccessToken() {
+        const refreshToken = localStorage.getItem('refreshToken');
+        if (!refreshToken) return false;
+        try {
+            const response = await fetch(`${API_BASE}/api/token/refresh`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ refresh_token: refreshToken }),
+            });
+            if (!response.ok) {
+                localStorage.removeItem('refreshToken');
+                return false;
+            }
+            this.storeTokens(await response.json());
+            return true;
+        } catch (error) {
+            console.error('Error refreshing access token:', error);
+            return false;
+        }
+    }
+
     /**
      * explain: Handles the logout process, clearing local storage and resetting the UI. Notifies the backend.
      */
     async handleLogout() {
         // ... (handleLogout implementation remains the same, includes resetting reasoning mode) ...
         const token = localStorage.getItem('token');
+        const refreshToken = localStorage.getItem('refreshToken');
         this.forceLogoutUI(); // Clear UI immediately
 
         if (token) {
              try {
                  const response = await fetch(`${API_BASE}/api/logout`, {
                      method: 'POST',
-                     headers: { 'Authorization': `Bearer ${token}` }, // Send token for backend invalidation
+                     headers: { 'Authorization': `Bearer ${token}`, 'Content-Type': 'application/json' }, // Send token for backend invalidation
+                     body: JSON.stringify({ refresh_token: refreshToken }), // Revoked too when using signed tokens
                  });
                  if (response.ok) console.log("Backend logout successful.");
                  else console.warn("Backend logout request failed. Status:", response.status);
@@ -439,6 +487,8 @@ class ChatApp {
     forceLogoutUI() {
         // ... (forceLogoutUI implementation remains the same, includes resetting reasoning mode) ...
         localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
+        clearTimeout(this.tokenRefreshTimer);
         localStorage.removeItem('locationShared');
         localStorage.removeItem('latitude');
         localStorage.removeItem('longitude');
@@ -562,7 +612,7 @@ class ChatApp {
          }
         try {
             // Fetch current chat details to get the name for the prompt
-            const response = await fetch(`${API_BASE}/api/chats/${chatId}`, {
+            const response = await fetch(`${API_BASE}/api/chats/${chatId}?fields=name`, {
                 method: 'GET',
                 headers: { 'Authorization': `Bearer ${token}` }, // Ensure Bearer prefix
             });
@@ -612,7 +662,7 @@ class ChatApp {
             // Optional: Fetch chat name for confirmation dialog
             let chatName = `Chat ${chatId.slice(-4)}`; // Default name
             try {
-                const chatDetailsResponse = await fetch(`${API_BASE}/api/chats/${chatId}`, {
+                const chatDetailsResponse = await fetch(`${API_BASE}/api/chats/${chatId}?fields=name`, {
                     method: 'GET',
                     headers: { 'Authorization': `Bearer ${token}` }
                 });
@@ -705,8 +755,15 @@ class ChatApp {
                  const errorData = await response.json();
                  throw new Error(errorData.error || `HTTP error! Status: ${response.status}`);
              }
-            await response.json(); // Process response if needed
-            alert('PDFs uploaded successfully!');
+            // Upload is accepted immediately (202); text extraction runs in the background
+            const job = await response.json();
+            const finalJob = await this.pollUploadJob(job.status_url, token);
+            const failures = [...(job.errors || []), ...finalJob.files.filter(f => f.status === 'failed').map(f => f.error)];
+            if (failures.length > 0) {
+                alert(`Some PDFs could not be added:\n${failures.join('\n')}`);
+            } else {
+                alert('PDFs uploaded successfully!');
+            }
             this.renderUploadedPdfs(); // Update the list of uploaded PDFs
 
         } catch (error) {
@@ -724,6 +781,28 @@ class ChatApp {
         }
     }
 
+    /**
+     * explain: Polls a PDF upload job until every file is processed, showing page progress on the upload button.
+     */
+    async pollUploadJob(statusUrl, token) {
+        while (true) {
+            const response = await fetch(`${API_BASE}${statusUrl}`, {
+                method: 'GET',
+                headers: { 'Authorization': `Bearer ${token}` },
+            });
+            if (!response.ok) throw new Error(`Could not check upload status (Status: ${response.status})`);
+            const job = await response.json();
+            if (['done', 'failed', 'partial'].includes(job.status)) return job;
+
+            const pagesTotal = job.files.reduce((sum, f) => sum + (f.pages_total || 0), 0);
+            const pagesDone = job.files.reduce((sum, f) => sum + f.pages_done, 0);
+            if (this.uploadPdfBtn && pagesTotal > 0) {
+                this.uploadPdfBtn.textContent = `Processing... ${pagesDone}/${pagesTotal} pages`;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
     /**
      * explain: Removes a specific PDF from the current chat via a backend request.
      */
@@ -788,20 +867,24 @@ class ChatApp {
         }
 
         let currentMessages = [];
+        let savedMessages = []; // Messages already stored on the server, each with its seq
+        let lastSeq = null; // Cursor for fetching only the messages added by this send
 
         // Fetch current messages for display consistency
         try {
-             const chatResponse = await fetch(`${API_BASE}/api/chats/${this.currentChatId}`, {
+             const chatResponse = await fetch(`${API_BASE}/api/chats/${this.currentChatId}?fields=messages`, {
                  method: 'GET',
                  headers: { 'Authorization': `Bearer ${token}` },
              });
              if (chatResponse.ok) {
                  const chatData = await chatResponse.json();
                  // Ensure messages fetched have the reasoning field (even if null)
-                 currentMessages = (chatData.messages || []).map(msg => ({
+                 savedMessages = (chatData.messages || []).map(msg => ({
                     ...msg,
                     reasoning: msg.reasoning !== undefined ? msg.reasoning : null
                  }));
+                 currentMessages = savedMessages.slice();
+                 lastSeq = chatData.next_after_seq;
              }
          } catch (fetchError) {
              console.warn("Could not fetch current messages for display:", fetchError);
@@ -842,8 +925,9 @@ class ChatApp {
             const data = await response.json();
 
              // --- Update UI with Final State ---
-             // Fetch the latest chat state from the backend
-             const updatedChatResponse = await fetch(`${API_BASE}/api/chats/${this.currentChatId}`, {
+             // Fetch only the messages saved by this send (everything after the cursor)
+             const afterParam = lastSeq !== null && lastSeq !== undefined ? `&after_seq=${lastSeq}` : '';
+             const updatedChatResponse = await fetch(`${API_BASE}/api/chats/${this.currentChatId}?fields=messages${afterParam}`, {
                  method: 'GET',
                  headers: { 'Authorization': `Bearer ${token}` },
              });
@@ -858,10 +942,14 @@ class ChatApp {
              } else {
                  const updatedChat = await updatedChatResponse.json();
                   // Ensure messages fetched have the reasoning field
-                 const finalMessages = (updatedChat.messages || []).map(msg => ({
+                 const newMessages = (updatedChat.messages || []).map(msg => ({
                     ...msg,
                     reasoning: msg.reasoning !== undefined ? msg.reasoning : null
                  }));
+                 // Rebuild from server messages only (the optimistic entries have no seq), merged by seq
+                 const bySeq = new Map();
+                 (afterParam ? savedMessages : []).concat(newMessages).forEach(msg => bySeq.set(msg.seq, msg));
+                 const finalMessages = Array.from(bySeq.values()).sort((a, b) => a.seq - b.seq);
                  this.renderMessages(finalMessages); // Render the definitive message list
              }
 
@@ -996,7 +1084,7 @@ class ChatApp {
                  return;
              }
             try {
-                const response = await fetch(`${API_BASE}/api/chats/${this.currentChatId}`, {
+                const response = await fetch(`${API_BASE}/api/chats/${this.currentChatId}?fields=messages`, {
                     method: 'GET',
                     headers: { 'Authorization': `Bearer ${token}` },
                 });
@@ -1227,7 +1315,7 @@ class ChatApp {
         if (!token) return;
 
         try {
-            const response = await fetch(`${API_BASE}/api/chats/${this.currentChatId}`, {
+            const response = await fetch(`${API_BASE}/api/chats/${this.currentChatId}?fields=uploaded_pdfs`, {
                 method: 'GET',
                 headers: { 'Authorization': `Bearer ${token}` }, // Ensure Bearer prefix
             });
@@ -1280,7 +1368,7 @@ class ChatApp {
 
         try {
             // Fetch current messages to append the error message correctly
-            const response = await fetch(`${API_BASE}/api/chats/${this.currentChatId}`, {
+            const response = await fetch(`${API_BASE}/api/chats/${this.currentChatId}?fields=messages`, {
                 method: 'GET',
                 headers: { 'Authorization': `Bearer ${token}` }, // Ensure Bearer prefix
             });